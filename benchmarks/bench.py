@@ -0,0 +1,202 @@
+"""
+エンジン・集計・グラフ生成のベンチマーク。
+
+    python benchmarks/bench.py                                  # 全ケースを計測して表示
+    python benchmarks/bench.py --quick --save benchmarks/baseline.json
+    python benchmarks/bench.py --baseline benchmarks/baseline.json --tolerance 0.25
+
+各ケースについて所要時間（repeat 回の最小値）、スループット（試行×年/秒）、ピークメモリ
+（tracemalloc、時間計測とは別の 1 回で測る）を記録する。--baseline を渡すと同名ケースと比べ、
+時間またはピークメモリが許容幅を超えて悪化したケースがあれば終了コード 1 を返す。
+ベースラインは計測したマシンでしか意味を持たないので、比較は同じマシン上で行うこと。
+"""
+from __future__ import annotations
+
+import argparse
+import datetime
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from lifesim import ENGINE_VERSION, Event, SimParams, run_simulation, simulate_batch, simulate_path  # noqa: E402
+from lifesim.aggregate import Aggregator  # noqa: E402
+from lifesim.backends import available_backends, simulate  # noqa: E402
+from lifesim.sampling import make_shock_source  # noqa: E402
+from lifesim.timeline import compile_timeline  # noqa: E402
+
+TRIALS = (200, 1_000, 10_000, 100_000)
+HORIZONS = ((40, 95), (20, 110), (65, 95))       # (start_age, end_age)
+EVENTS = (0, 3, 12)
+ACCOUNTS = ("none", "ideco+nisa", "all")
+
+
+# ══════════════════════════════════════════════════════════
+#  ケースの組み立て
+# ══════════════════════════════════════════════════════════
+def make_params(trials=1000, horizon=(40, 95), events=3, accounts="ideco+nisa") -> SimParams:
+    s, e = horizon
+    evs = [Event(on=True, label=f"ev{i}", idx=i + 1, age=s + 5 + (4 * i) % max(e - s - 5, 1),
+                 direction="支出" if i % 2 == 0 else "収入", amount=1_000_000 * (i + 1),
+                 every=5 if i >= 10 else 0)
+           for i in range(events)]
+    return SimParams(start_age=s, end_age=e, trials=int(trials), events=evs,
+                     retire_age=min(max(65, s + 1), e), pension_start_age=min(max(70, s + 1), e),
+                     ideco_on=accounts != "none", nisa_on=accounts != "none",
+                     taxable_on=accounts == "all", show_sample_paths=True)
+
+
+def cases(quick: bool):
+    """(名前, 設定, 計測対象の関数, 試行×年) を返す。"""
+    trials = TRIALS[:3] if quick else TRIALS
+    out = []
+
+    def add(name, cfg, p, fn):
+        out.append((name, cfg, fn, int(p.trials) * p.n_years))
+
+    # run_simulation 全体（エンジン＋集計）: 試行回数
+    for n in trials:
+        p = make_params(trials=n)
+        add(f"run/trials={n}", {"trials": n}, p, lambda p=p: run_simulation(p))
+    # 期間・イベント数・口座数
+    for h in HORIZONS:
+        p = make_params(trials=2000, horizon=h)
+        add(f"run/horizon={h[0]}-{h[1]}", {"trials": 2000, "horizon": list(h)}, p, lambda p=p: run_simulation(p))
+    for k in EVENTS:
+        p = make_params(trials=2000, events=k)
+        add(f"run/events={k}", {"trials": 2000, "events": k}, p, lambda p=p: run_simulation(p))
+    for acc in ACCOUNTS:
+        p = make_params(trials=2000, accounts=acc)
+        add(f"run/accounts={acc}", {"trials": 2000, "accounts": acc}, p, lambda p=p: run_simulation(p))
+
+    # エンジン単体（一括 / 参照ループ）
+    p = make_params(trials=2000)
+    z = make_shock_source("mc", np.random.default_rng(0), p.n_years).next(p.trials)
+    tl = compile_timeline(p)
+    add("engine/batch", {"trials": 2000}, p,
+        lambda: simulate_batch(p, None, p.trials, z=z, timeline=tl))
+    p_loop = make_params(trials=200)
+    add("engine/loop", {"trials": 200}, p_loop,
+        lambda: [simulate_path(p_loop, np.random.default_rng(i)) for i in range(p_loop.trials)])
+    for b in available_backends():   # 同じ z でのバックエンド比較（reference は試行数を絞る）
+        pb = p_loop if b == "reference" else p
+        add(f"engine/backend={b}", {"trials": pb.trials, "backend": b}, pb,
+            lambda pb=pb, b=b: simulate(pb, pb.trials, z[:pb.trials], tl, backend=b))
+
+    # 集計単体（exact / sketch）
+    out_batch = simulate_batch(p, None, p.trials, z=z, timeline=tl)
+    keys = np.random.default_rng(1).random(p.trials)
+    for mode in ("exact", "sketch"):
+        def agg_fn(mode=mode):
+            agg = Aggregator(tl.years, quantiles=mode)
+            agg.update(out_batch, keys)
+            return agg.summary()
+        add(f"aggregate/{mode}", {"trials": 2000, "quantiles": mode}, p, agg_fn)
+
+    # グラフ生成（ライブラリがある場合のみ）
+    res = run_simulation(make_params(trials=2000))
+    try:
+        import plotly  # noqa: F401
+        from lifesim.charts import interactive_figure_json
+        add("chart/plotly_json", {"trials": 2000}, p, lambda: interactive_figure_json(res))
+    except ImportError:
+        pass
+    try:
+        import matplotlib  # noqa: F401
+        from lifesim.charts import render_static
+        add("chart/static_png", {"trials": 2000}, p, lambda: render_static(res))
+    except ImportError:
+        pass
+    return out
+
+
+# ══════════════════════════════════════════════════════════
+#  計測
+# ══════════════════════════════════════════════════════════
+def measure(fn, repeat: int) -> tuple[float, float]:
+    """(最小所要時間 秒, ピークメモリ MB)。"""
+    fn()   # ウォームアップ（import・キャッシュの初期化を計測に含めない）
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    tracemalloc.start()
+    try:
+        fn()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return best, peak / 2**20
+
+
+def run(quick: bool = False, repeat: int = 3, only: str = "", log=print) -> dict:
+    results = []
+    for name, cfg, fn, work in cases(quick):
+        if only and only not in name:
+            continue
+        sec, peak = measure(fn, repeat)
+        row = {"name": name, "config": cfg, "seconds": sec,
+               "trial_years_per_sec": work / sec if sec > 0 else float("inf"), "peak_mb": peak}
+        results.append(row)
+        log(f"{name:<28} {sec*1000:10.1f} ms  {row['trial_years_per_sec']:14,.0f} trial-yr/s  {peak:8.1f} MB")
+    return {
+        "meta": {
+            "date": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(), "numpy": np.__version__,
+            "machine": platform.machine(), "processor": platform.processor(),
+            "engine_version": ENGINE_VERSION, "repeat": repeat, "quick": quick,
+        },
+        "results": results,
+    }
+
+
+def compare(current: dict, baseline: dict, tolerance: float, mem_tolerance: float) -> list[str]:
+    """許容幅を超えて悪化したケースの説明を返す（空なら合格）。"""
+    base = {r["name"]: r for r in baseline["results"]}
+    failures = []
+    for r in current["results"]:
+        b = base.get(r["name"])
+        if b is None:
+            continue
+        if r["seconds"] > b["seconds"] * (1 + tolerance):
+            failures.append(f"{r['name']}: time {b['seconds']*1000:.1f} -> {r['seconds']*1000:.1f} ms "
+                            f"(+{(r['seconds'] / b['seconds'] - 1) * 100:.0f}%)")
+        if r["peak_mb"] > b["peak_mb"] * (1 + mem_tolerance) + 1.0:   # 1MB 未満の揺れは無視
+            failures.append(f"{r['name']}: peak {b['peak_mb']:.1f} -> {r['peak_mb']:.1f} MB")
+    return failures
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="lifesim ベンチマーク")
+    ap.add_argument("--quick", action="store_true", help="100k 試行のケースを省く")
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--only", default="", help="名前にこの文字列を含むケースだけ実行")
+    ap.add_argument("--save", help="結果を JSON で保存（ベースラインとして使える）")
+    ap.add_argument("--baseline", help="比較するベースライン JSON")
+    ap.add_argument("--tolerance", type=float, default=0.25, help="時間の許容悪化率（0.25 = +25%%）")
+    ap.add_argument("--mem-tolerance", type=float, default=0.25, help="ピークメモリの許容悪化率")
+    a = ap.parse_args(argv)
+
+    current = run(quick=a.quick, repeat=a.repeat, only=a.only)
+    if a.save:
+        Path(a.save).write_text(json.dumps(current, indent=2, ensure_ascii=False), encoding="utf-8")
+    if a.baseline:
+        failures = compare(current, json.loads(Path(a.baseline).read_text(encoding="utf-8")),
+                           a.tolerance, a.mem_tolerance)
+        for f in failures:
+            print("REGRESSION", f, file=sys.stderr)
+        if failures:
+            return 1
+        print("no regressions", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
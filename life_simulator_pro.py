@@ -1,7 +1,14 @@
 import os
 import time
+_T_SCRIPT = time.perf_counter()   # 再実行ごとの前処理時間の計測起点
 import glob
+import io
+import json
+import logging
 import math
+import tempfile
+import uuid
+import zipfile
 import streamlit as st
 
 st.set_page_config(
@@ -11,34 +18,7 @@ st.set_page_config(
     initial_sidebar_state="collapsed",
 )
 
-import numpy as np
-import pandas as pd
-import matplotlib
-import matplotlib.pyplot as plt
-import matplotlib.font_manager as fm
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
-
-def _setup_font():
-    for pat in ["/usr/share/fonts/**/NotoSansCJK*.otf",
-                "/usr/share/fonts/**/NotoSansCJK*.ttc",
-                "/usr/share/fonts/**/IPAexGothic*.ttf"]:
-        hits = glob.glob(pat, recursive=True)
-        if hits:
-            try:
-                fm.fontManager.addfont(hits[0])
-                matplotlib.rcParams["font.family"] = fm.FontProperties(fname=hits[0]).get_name()
-                return
-            except Exception:
-                pass
-    for name in ["Hiragino Sans", "Yu Gothic", "Meiryo", "MS Gothic"]:
-        if name in {f.name for f in fm.fontManager.ttflist}:
-            matplotlib.rcParams["font.family"] = name
-            return
-_setup_font()
-matplotlib.rcParams["axes.unicode_minus"] = False
-
-st.markdown("""
+_CSS = """
 <style>
   .sim-title{font-size:32px;font-weight:900;color:#1a1a2e;}
   .sim-sub{color:#555;font-size:14px;margin-bottom:1rem;}
@@ -65,7 +45,8 @@ st.markdown("""
     padding-bottom:0 !important; margin-bottom:16px !important;
   }
 </style>
-""", unsafe_allow_html=True)
+"""
+st.markdown(_CSS, unsafe_allow_html=True)
 
 st.markdown('<div class="sim-title">🔮 資産未来予報 Pro</div>', unsafe_allow_html=True)
 st.markdown('<div class="sim-sub">老後資産管理に最適。iDeCo・NISA・特定口座・現金をモンテカルロ法で確率的に可視化します。</div>', unsafe_allow_html=True)
@@ -101,9 +82,85 @@ def password_gate():
 
 password_gate()
 
-for k, v in [("locked", False), ("locked_params", None), ("sim_result", None), ("sim_done", False)]:
+# ── 重いライブラリはログイン後に読み込む（ログイン画面では読み込まない） ─────────────
+#    ここでは設定入力と実行に必要なものだけ。pandas・グラフ・各タブ / 展開部の機能
+#    （逆算・比較・書き出し・ヒストリカル CSV など）は、それを表示する箇所で読み込む
+from lifesim import default_cache
+from lifesim.aggregate import FAN_QUANTILES, HIGHLIGHT_QUANTILES
+from lifesim.backends import DEFAULT_BACKEND, available_backends
+from lifesim.incremental import default_checkpoints
+from lifesim.jobs import JobQueueFull, default_jobs
+from lifesim.params import ANALYSIS_FIELDS
+from lifesim.profiling import Profiler
+from lifesim.sampling import SAMPLING_MODES, sobol_available
+from lifesim.simulation import analyze
+
+
+@st.cache_resource(show_spinner=False)
+def _setup_font():
+    """日本語フォントの探索と matplotlib 設定。プロセスにつき 1 回だけ実行する。"""
+    import matplotlib
+    import matplotlib.font_manager as fm
+    matplotlib.rcParams["axes.unicode_minus"] = False
+    for pat in ["/usr/share/fonts/**/NotoSansCJK*.otf",
+                "/usr/share/fonts/**/NotoSansCJK*.ttc",
+                "/usr/share/fonts/**/IPAexGothic*.ttf"]:
+        hits = glob.glob(pat, recursive=True)
+        if hits:
+            try:
+                fm.fontManager.addfont(hits[0])
+                matplotlib.rcParams["font.family"] = fm.FontProperties(fname=hits[0]).get_name()
+                return matplotlib.rcParams["font.family"]
+            except Exception:
+                pass
+    for name in ["Hiragino Sans", "Yu Gothic", "Meiryo", "MS Gothic"]:
+        if name in {f.name for f in fm.fontManager.ttflist}:
+            matplotlib.rcParams["font.family"] = name
+            return name
+    return None
+
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def cached_static_chart(result_key, show_hl, fmt, _result):
+    """静的グラフの画像バイト列。result.view_key ごとに 1 回だけ描く（_result はハッシュ対象外）。"""
+    from lifesim.charts import render_static
+    _setup_font()
+    return render_static(_result, show_hl, fmt)
+
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def cached_interactive_json(result_key, show_hl, webgl, _result):
+    """Plotly 図の JSON。軽量表示では WebGL 描画にし、サンプル軌跡の点数を絞る。"""
+    from lifesim.charts import PLOTLY_MAX_POINTS, interactive_figure_json
+    return interactive_figure_json(_result, show_hl, webgl=webgl,
+                                   max_points=PLOTLY_MAX_POINTS // 4 if webgl else PLOTLY_MAX_POINTS)
+
+
+@st.cache_resource(show_spinner=False)
+def _startup_stats():
+    """プロセス単位の起動計測。最初の実行をコールドスタートとして記録する。"""
+    return {"cold_start_ms": None, "reruns": 0, "rerun_ms_total": 0.0, "last_ms": 0.0}
+
+
+def _record_startup(ms):
+    s = _startup_stats()
+    if s["cold_start_ms"] is None:
+        s["cold_start_ms"] = ms
+    else:
+        s["reruns"] += 1
+        s["rerun_ms_total"] += ms
+    s["last_ms"] = ms
+    logging.getLogger("lifesim.ui").info(
+        "startup overhead %.1f ms (cold start %.1f ms, reruns %d, mean %.1f ms)",
+        ms, s["cold_start_ms"], s["reruns"], s["rerun_ms_total"] / max(s["reruns"], 1))
+    return s
+
+for k, v in [("locked", False), ("locked_params", None), ("sim_result", None), ("sim_done", False),
+             ("job", None), ("session_uid", None)]:
     if k not in st.session_state:
         st.session_state[k] = v
+if st.session_state.session_uid is None:   # バックグラウンド実行の owner（セッションごとに 1 件まで）
+    st.session_state.session_uid = uuid.uuid4().hex
 
 def yen_to_man(x): return x / 10_000.0
 def clamp(x, lo, hi): return max(lo, min(hi, x))
@@ -256,104 +313,42 @@ def linked_float(label, lo, hi, default, step, key, fmt="%.2f", disabled=False,
         return float(st.session_state[vk])
 
 
-# ══════════════════════════════════════════════════════════
-#  シミュレーション本体
-# ══════════════════════════════════════════════════════════
-def simulate_path(params, rng):
-    years = np.arange(params["start_age"], params["end_age"] + 1)
-    cash    = params["initial_cash"]
-    ideco   = params["initial_ideco"]
-    nisa    = params["initial_nisa"]
-    taxable = params["initial_taxable"]
-    taxable_cost_basis = params["initial_taxable"]
-    total_h=[]; cash_h=[]; ideco_h=[]; nisa_h=[]; taxable_h=[]
-    ic_h=[]; nc_h=[]; iw_h=[]; nw_h=[]; tc_h=[]; tw_h=[]
-    ruined=False; ruin_age=None
-    infl = params["inflation_rate"]
-    salary_ms  = params.get("salary_macro_slide", 0.0)
-    pension_ms = params.get("pension_macro_slide", -0.006)
-    salary_growth  = clamp(infl + salary_ms,  -0.03, 0.03)
-    pension_growth = clamp(infl + pension_ms, -0.03, 0.03)
-
-    for age in years:
-        inf_f = (1.0 + infl) ** int(age - params["start_age"])
-        years_elapsed = int(age - params["start_age"])
-        income = 0.0
-        if age < params["retire_age"]:
-            income += params["salary_net"] * (1.0 + salary_growth) ** years_elapsed
-        if age >= params["pension_start_age"]:
-            income += params["pension_annual"] * (1.0 + pension_growth) ** years_elapsed
-
-        base_lv   = params["living_before"] if age < params["retire_age"] else params["living_after"]
-        available = cash + income - base_lv * inf_f
-
-        ic = nc = 0.0
-        if params["ideco_on"] and params["ideco_contrib_start"] <= age <= params["ideco_contrib_end"] and available > 0:
-            ic = min(params["ideco_contrib_monthly"] * 12, available); ideco += ic; available -= ic
-        if params["nisa_on"] and params["nisa_contrib_start"] <= age <= params["nisa_contrib_end"] and available > 0:
-            nc = min(params["nisa_contrib_monthly"] * 12, available); nisa += nc; available -= nc
-
-        tc = 0.0
-        if params["taxable_on"] and params["taxable_contrib_start"] <= age <= params["taxable_contrib_end"] and available > 0:
-            tc = min(params["taxable_contrib_monthly"] * 12, available); taxable += tc; taxable_cost_basis += tc; available -= tc
-
-        cash = available
-
-        iw = nw = tw = 0.0
-        if params["ideco_on"] and age >= params["ideco_withdraw_start"] and ideco > 0:
-            iw = min(params["ideco_withdraw_annual"], ideco); ideco -= iw; cash += iw
-        if params["nisa_on"] and age >= params["nisa_withdraw_start"] and nisa > 0:
-            nw = (nisa * params["nisa_withdraw_rate"] if params["nisa_withdraw_mode"] == "定率"
-                  else min(params["nisa_withdraw_annual"], nisa))
-            nw = min(nw, nisa); nisa -= nw; cash += nw
-        if params["taxable_on"] and age >= params["taxable_withdraw_start"] and taxable > 0:
-            tw_gross = (taxable * params["taxable_withdraw_rate"] if params["taxable_withdraw_mode"] == "定率"
-                        else min(params["taxable_withdraw_annual"], taxable))
-            tw_gross = min(tw_gross, taxable)
-            if taxable > 0 and taxable_cost_basis < taxable:
-                gain_ratio = (taxable - taxable_cost_basis) / taxable
-                tw_tax = tw_gross * gain_ratio * params["taxable_tax_rate"]
-            else:
-                tw_tax = 0.0
-            tw = tw_gross - tw_tax
-            cost_ratio = min(taxable_cost_basis / taxable, 1.0) if taxable > 0 else 0.0
-            taxable_cost_basis -= tw_gross * cost_ratio
-            taxable_cost_basis = max(taxable_cost_basis, 0.0)
-            taxable -= tw_gross; cash += tw
-
-        for ev in params["events"]:
-            if ev["on"] and age == ev["age"]:
-                cash += ev["amount"] if ev["direction"] == "収入" else -abs(ev["amount"])
-
-        r_ideco = rng.normal(params["ideco_return"], params["ideco_vol"])
-        r_nisa  = rng.normal(params["nisa_return"],  params["nisa_vol"])
-        r_tax   = rng.normal(params["tax_return"],   params["tax_vol"])
-        ideco   *= (1.0 + r_ideco)
-        nisa    *= (1.0 + r_nisa)
-        taxable *= (1.0 + r_tax)
-
-        total = cash + ideco + nisa + taxable
-        if not ruined and total <= 0: ruined=True; ruin_age=int(age)
-
-        total_h.append(total); cash_h.append(cash); ideco_h.append(ideco)
-        nisa_h.append(nisa); taxable_h.append(taxable)
-        ic_h.append(ic); nc_h.append(nc); iw_h.append(iw)
-        nw_h.append(nw); tc_h.append(tc); tw_h.append(tw)
-
-    return dict(years=years,
-                total=np.array(total_h), cash=np.array(cash_h),
-                ideco=np.array(ideco_h),  nisa=np.array(nisa_h),
-                taxable=np.array(taxable_h),
-                ic=np.array(ic_h), nc=np.array(nc_h),
-                iw=np.array(iw_h), nw=np.array(nw_h),
-                tc=np.array(tc_h), tw=np.array(tw_h),
-                ruined=ruined, ruin_age=ruin_age)
+# ── 起動・再実行の前処理時間（ここまでの所要時間）を記録 ─────────────
+_boot = _record_startup((time.perf_counter() - _T_SCRIPT) * 1000)
+st.sidebar.caption(f"⏱ 前処理 {_boot['last_ms']:,.0f} ms ／ コールドスタート {_boot['cold_start_ms']:,.0f} ms ／ "
+                   f"再実行平均 {_boot['rerun_ms_total'] / max(_boot['reruns'], 1):,.0f} ms（{_boot['reruns']} 回）")
 
 # ══════════════════════════════════════════════════════════
-tab_input, tab_result = st.tabs(["⚙️ 設定入力", "📈 グラフ・結果"])
-locked = st.session_state.locked
+tab_input, tab_result, tab_sweep, tab_goal = st.tabs(
+    ["⚙️ 設定入力", "📈 グラフ・結果", "🔁 受給開始年齢比較", "🎯 目標逆算"])
+_sampling_labels = {"mc": "通常（疑似乱数）", "antithetic": "対称変量（antithetic）",
+                    "sobol": "準乱数（Sobol QMC）", "bootstrap": "ヒストリカル（ブロック・ブートストラップ）"}
+_backend_labels = {"numpy": "標準（NumPy 一括計算）", "reference": "参照実装（1 試行ずつ・低速）",
+                   "numba": "高速（numba JIT）"}
 
-with tab_input:
+# 入力パネルは fragment：項目を編集しても再実行されるのはこのパネル（入力欄＋設定確認）だけで、
+# CSS・ログイン・結果タブのグラフは描き直さない。fragment 非対応の古い Streamlit では通常関数。
+_fragment = getattr(st, "fragment", None) or getattr(st, "experimental_fragment", None) or (lambda f: f)
+
+
+def _rerun_panel():
+    try:
+        st.rerun(scope="fragment")
+    except TypeError:   # scope 引数のない版
+        st.rerun()
+
+
+# 比較・逆算タブが表示に使う項目（変わったら fragment の外も描き直す）
+_TAB_FIELDS = ("pension_annual", "pension_start_age", "trials")
+
+
+@_fragment
+def input_panel():
+    """
+    設定入力・設定確認・実行ボタン。最新の入力は session_state の panel_params / panel_workers に置く
+    （fragment だけの再実行では戻り値が fragment の外に届かないため）。
+    """
+    locked = st.session_state.locked
     st.header("⚙️ シミュレーション設定")
     cA, cB = st.columns(2)
     with cA: lock_clicked   = st.button("🔒 設定を確定", use_container_width=True, disabled=locked)
@@ -471,7 +466,7 @@ with tab_input:
         tax_return = linked_float("特定口座 期待リターン（年率）",       0.0, 0.20, 0.04, 0.001, "tax_mu",  disabled=locked or not taxable_on, pct=True)
         tax_vol    = linked_float("特定口座 変動率（ボラティリティ）", 0.0, 0.50, 0.12, 0.001, "tax_sig", disabled=locked or not taxable_on, pct=True)
 
-    st.subheader("🎯 一時イベント（最大12件）")
+    st.subheader("🎯 イベント（最大12件・繰り返し可）")
     _ev_def = [
         (True,  70, 3_000_000, "支出", "住宅リフォーム"),
         (True,  75, 5_000_000, "支出", "介護費用"),
@@ -491,245 +486,423 @@ with tab_input:
                                   index=0 if d[3]=="支出" else 1,
                                   horizontal=True, disabled=locked, key=f"ev_dir_{i}")
             amount    = linked_int("金額（円）", 0, ev_max, d[2], 10_000, f"ev_amt_{i}", disabled=locked, man=True)
+            repeat    = st.checkbox("繰り返す（定期的に発生）", value=False, disabled=locked, key=f"ev_rep_{i}")
+            if repeat:
+                every     = linked_int("間隔（年）",   1,  30,   5, 1, f"ev_every_{i}", disabled=locked)
+                until_age = linked_int("最終年齢",    20, 110, 100, 1, f"ev_until_{i}", disabled=locked)
+            else:
+                every, until_age = 0, 0
         events.append({"on": bool(on), "label": label, "idx": i,
-                        "age": int(ev_age), "direction": direction, "amount": int(amount)})
+                        "age": int(ev_age), "direction": direction, "amount": int(amount),
+                        "every": int(every), "until_age": int(until_age)})
 
     st.subheader("🎲 モンテカルロ設定")
-    trials         = linked_int("試行回数",              200, 3000, 1000, 100, "trials",   disabled=locked)
-    ruin_threshold = linked_int("破綻確率しきい値（%）",   0,  100,   20,   5, "ruin_thr", disabled=locked)
-    show_sample_paths = st.checkbox("サンプル軌跡を表示", value=True, disabled=locked)
-    sample_paths_n = linked_int("サンプル表示本数",       10,  200,   80,  10, "sp_n",     disabled=locked)
-
-# ── params 構築 ───────────────────────────────────────────
-def build_params():
-    s = int(clamp(start_age, 20, 110))
-    e = int(clamp(end_age, s, 110))
-    return dict(
-        start_age=s, end_age=e,
-        initial_cash=float(initial_cash), initial_ideco=float(initial_ideco),
-        initial_nisa=float(initial_nisa),  initial_taxable=float(initial_taxable),
-        salary_net=float(salary_net), retire_age=int(retire_age),
-        pension_start_age=int(pension_start_age), pension_annual=float(pension_annual),
-        living_before=float(living_before), living_after=float(living_after),
-        inflation_rate=float(inflation_rate),
-        salary_macro_slide=float(salary_macro_slide),
-        pension_macro_slide=float(pension_macro_slide),
-        ideco_on=bool(ideco_on),
-        ideco_contrib_start=int(ideco_contrib_start),
-        ideco_contrib_end=max(int(ideco_contrib_end), int(ideco_contrib_start)),
-        ideco_contrib_monthly=float(ideco_contrib_monthly),
-        ideco_withdraw_start=int(ideco_withdraw_start),
-        ideco_withdraw_annual=float(ideco_withdraw_annual),
-        ideco_return=float(ideco_return), ideco_vol=float(ideco_vol),
-        nisa_on=bool(nisa_on),
-        nisa_contrib_start=int(nisa_contrib_start),
-        nisa_contrib_end=max(int(nisa_contrib_end), int(nisa_contrib_start)),
-        nisa_contrib_monthly=float(nisa_contrib_monthly),
-        nisa_withdraw_start=int(nisa_withdraw_start),
-        nisa_withdraw_annual=float(nisa_withdraw_annual),
-        nisa_withdraw_mode=nisa_withdraw_mode,
-        nisa_withdraw_rate=float(nisa_withdraw_rate),
-        nisa_return=float(nisa_return), nisa_vol=float(nisa_vol),
-        taxable_on=bool(taxable_on),
-        taxable_contrib_start=int(taxable_contrib_start),
-        taxable_contrib_end=max(int(taxable_contrib_end), int(taxable_contrib_start)),
-        taxable_contrib_monthly=float(taxable_contrib_monthly),
-        taxable_withdraw_start=int(taxable_withdraw_start),
-        taxable_withdraw_annual=float(taxable_withdraw_annual),
-        taxable_withdraw_mode=taxable_withdraw_mode,
-        taxable_withdraw_rate=float(taxable_withdraw_rate),
-        taxable_tax_rate=float(taxable_tax_rate),
-        tax_return=float(tax_return), tax_vol=float(tax_vol),
-        events=events,
-        ruin_threshold=int(ruin_threshold),
-        show_sample_paths=bool(show_sample_paths),
-        sample_paths_n=int(sample_paths_n), trials=int(trials),
+    auto_trials    = st.checkbox("試行回数を自動決定（収束したら停止）", value=False, disabled=locked)
+    trials         = linked_int("試行回数",              200, 20000, 1000, 100, "trials",   disabled=locked or auto_trials)
+    if auto_trials:
+        auto_ruin_tol   = linked_float("許容幅：破綻確率（±%ポイント）", 0.001, 0.05, 0.01, 0.001, "auto_rtol", disabled=locked, pct=True) * 100
+        auto_median_tol = linked_float("許容幅：最終資産中央値（±%）", 0.005, 0.10, 0.02, 0.005, "auto_mtol", disabled=locked, pct=True)
+        auto_max_trials = linked_int("試行回数の上限", 1000, 100_000, 20_000, 1000, "auto_max", disabled=locked)
+        st.caption("※ 500 回ずつ追加し、破綻確率と最終資産中央値の 95% 信頼区間が許容幅に収まった時点で停止します。")
+    else:
+        auto_ruin_tol, auto_median_tol, auto_max_trials = 1.0, 0.02, 20_000
+    # 分析専用（ANALYSIS_FIELDS）: ロック中も変更でき、再計算せず保存済みの結果から作り直す
+    ruin_threshold = linked_int("破綻確率しきい値（%）",   0,  100,   20,   5, "ruin_thr")
+    show_sample_paths = st.checkbox("サンプル軌跡を表示", value=True)
+    sample_paths_n = linked_int("サンプル表示本数",       10,  200,   80,  10, "sp_n")
+    st.caption("※ しきい値・サンプル軌跡の表示はロック中も変更でき、再計算なしで結果に反映されます。")
+    _sampling_opts = [m for m in SAMPLING_MODES if m != "sobol" or sobol_available()]
+    sampling = st.selectbox("乱数サンプリング方式", _sampling_opts, disabled=locked,
+                            format_func=lambda m: _sampling_labels[m])
+    st.caption("※ 対称変量・準乱数は少ない試行回数でも帯や破綻確率が安定しやすくなります（効果は結果タブで測定できます）。")
+    returns_csv, bootstrap_freq, bootstrap_block, bootstrap_map, bootstrap_raw = "", "annual", 5, "", False
+    if sampling == "bootstrap":
+        returns_csv = st.text_input("リターン履歴 CSV のパス", key="bs_csv", disabled=locked,
+                                    help="1 行目が列名、各行が 1 期間のリターン（小数。0.05 = 5%）。日付などの列は無視します。")
+        bootstrap_freq = st.radio("データの頻度", ["annual", "monthly"], horizontal=True, disabled=locked,
+                                  format_func=lambda f: {"annual": "年次", "monthly": "月次"}[f], key="bs_freq")
+        bootstrap_block = linked_int("ブロック長（年）", 1, 20, 5, 1, "bs_block", disabled=locked)
+        bootstrap_raw = st.checkbox("履歴のリターン水準をそのまま使う", value=False, disabled=locked, key="bs_raw",
+                                    help="オフ：分布の形と口座間の相関だけ履歴から取り、期待リターン・ボラは各口座の設定に合わせます。")
+        if returns_csv:
+            from lifesim.bootstrap import load_returns
+            try:
+                _bs_names, _bs_data = load_returns(returns_csv)
+            except (OSError, ValueError) as e:
+                st.error(f"CSV を読めません: {e}")
+            else:
+                _bs_cols = st.columns(3)
+                _bs_pick = {acct: c.selectbox(label, _bs_names, index=None, placeholder="系列を選択",
+                                              disabled=locked, key=f"bs_map_{acct}")
+                            for c, acct, label in zip(_bs_cols, ("ideco", "nisa", "taxable"),
+                                                      ("iDeCo", "NISA", "特定口座"))}
+                if all(_bs_pick.values()):   # 口座ごとの系列は明示的に選ぶ（未選択のまま実行しない）
+                    bootstrap_map = ",".join(f"{a}={c}" for a, c in _bs_pick.items())
+                st.caption(f"※ {len(_bs_data):,} 期間分。連続した {int(bootstrap_block)} 年を 1 ブロックとして"
+                           "ランダムにつなぐので、暴落の連続や裾の厚さが残ります。")
+    _cpu = os.cpu_count() or 1
+    parallel_on = st.checkbox("並列実行（マルチコア）", value=False, disabled=locked or _cpu < 2)
+    workers = linked_int("並列ワーカー数", 2, max(2, _cpu), min(4, max(2, _cpu)), 1, "workers",
+                         disabled=locked or not parallel_on) if parallel_on else 1
+    st.caption("※ 並列時は乱数列をワーカーごとに分割します。同じワーカー数なら結果は毎回同一です。")
+    _backends = available_backends()
+    backend = st.selectbox("計算エンジン", _backends, index=_backends.index(DEFAULT_BACKEND), disabled=locked,
+                           format_func=lambda b: _backend_labels[b],
+                           help="結果は同じ入力で一致することを python -m lifesim.harness で確認しています。")
+
+    # ── params 構築 ───────────────────────────────────────────
+    def build_params():
+        s = int(clamp(start_age, 20, 110))
+        e = int(clamp(end_age, s, 110))
+        return dict(
+            start_age=s, end_age=e,
+            initial_cash=float(initial_cash), initial_ideco=float(initial_ideco),
+            initial_nisa=float(initial_nisa),  initial_taxable=float(initial_taxable),
+            salary_net=float(salary_net), retire_age=int(retire_age),
+            pension_start_age=int(pension_start_age), pension_annual=float(pension_annual),
+            living_before=float(living_before), living_after=float(living_after),
+            inflation_rate=float(inflation_rate),
+            salary_macro_slide=float(salary_macro_slide),
+            pension_macro_slide=float(pension_macro_slide),
+            ideco_on=bool(ideco_on),
+            ideco_contrib_start=int(ideco_contrib_start),
+            ideco_contrib_end=max(int(ideco_contrib_end), int(ideco_contrib_start)),
+            ideco_contrib_monthly=float(ideco_contrib_monthly),
+            ideco_withdraw_start=int(ideco_withdraw_start),
+            ideco_withdraw_annual=float(ideco_withdraw_annual),
+            ideco_return=float(ideco_return), ideco_vol=float(ideco_vol),
+            nisa_on=bool(nisa_on),
+            nisa_contrib_start=int(nisa_contrib_start),
+            nisa_contrib_end=max(int(nisa_contrib_end), int(nisa_contrib_start)),
+            nisa_contrib_monthly=float(nisa_contrib_monthly),
+            nisa_withdraw_start=int(nisa_withdraw_start),
+            nisa_withdraw_annual=float(nisa_withdraw_annual),
+            nisa_withdraw_mode=nisa_withdraw_mode,
+            nisa_withdraw_rate=float(nisa_withdraw_rate),
+            nisa_return=float(nisa_return), nisa_vol=float(nisa_vol),
+            taxable_on=bool(taxable_on),
+            taxable_contrib_start=int(taxable_contrib_start),
+            taxable_contrib_end=max(int(taxable_contrib_end), int(taxable_contrib_start)),
+            taxable_contrib_monthly=float(taxable_contrib_monthly),
+            taxable_withdraw_start=int(taxable_withdraw_start),
+            taxable_withdraw_annual=float(taxable_withdraw_annual),
+            taxable_withdraw_mode=taxable_withdraw_mode,
+            taxable_withdraw_rate=float(taxable_withdraw_rate),
+            taxable_tax_rate=float(taxable_tax_rate),
+            tax_return=float(tax_return), tax_vol=float(tax_vol),
+            events=events,
+            ruin_threshold=int(ruin_threshold),
+            show_sample_paths=bool(show_sample_paths),
+            sample_paths_n=int(sample_paths_n), trials=int(trials), sampling=sampling,
+            returns_csv=returns_csv, bootstrap_block=int(bootstrap_block), bootstrap_freq=bootstrap_freq,
+            bootstrap_map=bootstrap_map, bootstrap_raw=bool(bootstrap_raw),
+            auto_trials=bool(auto_trials), auto_ruin_tol=float(auto_ruin_tol),
+            auto_median_tol=float(auto_median_tol), auto_max_trials=int(auto_max_trials),
+        )
+
+    if unlock_clicked:
+        st.session_state.locked = False; st.session_state.locked_params = None; _rerun_panel()
+    if lock_clicked:
+        st.session_state.locked_params = build_params(); st.session_state.locked = True; _rerun_panel()
+
+    params = build_params()
+    if st.session_state.locked and st.session_state.locked_params:
+        params = {**st.session_state.locked_params, **{k: params[k] for k in ANALYSIS_FIELDS}}
+
+    # 他のタブ（fragment の外）は panel_params を読む。分析専用の項目（結果タブ）や、
+    # 比較・逆算タブに表示している項目が変わったときは全体を描き直す
+    _view = {k: params[k] for k in ANALYSIS_FIELDS}
+    _tab_view = {k: params[k] for k in _TAB_FIELDS}
+    _prev_view, _prev_tab_view = st.session_state.get("analysis_view"), st.session_state.get("tab_view")
+    st.session_state.analysis_view, st.session_state.tab_view = _view, _tab_view
+    st.session_state.panel_params, st.session_state.panel_workers = params, workers
+    if ((_prev_view not in (None, _view) and st.session_state.sim_result is not None)
+            or _prev_tab_view not in (None, _tab_view)):
+        st.rerun()
+
+    # ── 設定確認テーブル ─────────────────────────────────────
+    st.divider()
+    st.subheader("📋 設定確認")
+
+    _ev_active = [ev for ev in params["events"] if ev["on"]]
+    _ev_text = "  /  ".join(
+        f"{ev['label']} {ev['direction']} {ev['amount']//10000:,}万円 {ev['age']}歳"
+        + (f"〜{ev['until_age']}歳 {ev['every']}年ごと" if ev.get("every") else "")
+        for ev in _ev_active
+    ) if _ev_active else "なし"
+
+    _ideco_str = (
+        f"{'使用' if params['ideco_on'] else '未使用'}  "
+        f"積立 {params['ideco_contrib_monthly']//10000:.1f}万円/月"
+        f"（{params['ideco_contrib_start']}〜{params['ideco_contrib_end']}歳）  "
+        f"受取 {params['ideco_withdraw_annual']//10000:,}万円/年"
+        f"（{params['ideco_withdraw_start']}歳〜）  "
+        f"リターン {params['ideco_return']*100:.1f}% / ボラ {params['ideco_vol']*100:.1f}%"
+    )
+    _nisa_str = (
+        f"{'使用' if params['nisa_on'] else '未使用'}  "
+        f"積立 {params['nisa_contrib_monthly']//10000:.1f}万円/月"
+        f"（{params['nisa_contrib_start']}〜{params['nisa_contrib_end']}歳）  "
+        f"取崩 {params['nisa_withdraw_mode']} "
+        f"{params['nisa_withdraw_annual']//10000:,}万円 or {params['nisa_withdraw_rate']*100:.1f}%"
+        f"（{params['nisa_withdraw_start']}歳〜）  "
+        f"リターン {params['nisa_return']*100:.1f}% / ボラ {params['nisa_vol']*100:.1f}%"
+    )
+    _tax_str = (
+        f"{'使用' if params['taxable_on'] else '未使用'}  "
+        f"積立 {params['taxable_contrib_monthly']//10000:.1f}万円/月"
+        f"（{params['taxable_contrib_start']}〜{params['taxable_contrib_end']}歳）  "
+        f"取崩 {params['taxable_withdraw_mode']} "
+        f"{params['taxable_withdraw_annual']//10000:,}万円 or {params['taxable_withdraw_rate']*100:.1f}%"
+        f"（{params['taxable_withdraw_start']}歳〜）  "
+        f"譲渡税率 {params['taxable_tax_rate']*100:.3f}%  "
+        f"リターン {params['tax_return']*100:.1f}% / ボラ {params['tax_vol']*100:.1f}%"
     )
 
-if unlock_clicked:
-    st.session_state.locked = False; st.session_state.locked_params = None; st.rerun()
-if lock_clicked:
-    st.session_state.locked_params = build_params(); st.session_state.locked = True; st.rerun()
-
-params = (st.session_state.locked_params
-          if st.session_state.locked and st.session_state.locked_params
-          else build_params())
-
-# ── 設定確認テーブル ─────────────────────────────────────
-st.divider()
-st.subheader("📋 設定確認")
-
-_ev_active = [ev for ev in params["events"] if ev["on"]]
-_ev_text = "  /  ".join(
-    f"{ev['label']} {ev['direction']} {ev['amount']//10000:,}万円 {ev['age']}歳"
-    for ev in _ev_active
-) if _ev_active else "なし"
-
-_ideco_str = (
-    f"{'使用' if params['ideco_on'] else '未使用'}  "
-    f"積立 {params['ideco_contrib_monthly']//10000:.1f}万円/月"
-    f"（{params['ideco_contrib_start']}〜{params['ideco_contrib_end']}歳）  "
-    f"受取 {params['ideco_withdraw_annual']//10000:,}万円/年"
-    f"（{params['ideco_withdraw_start']}歳〜）  "
-    f"リターン {params['ideco_return']*100:.1f}% / ボラ {params['ideco_vol']*100:.1f}%"
-)
-_nisa_str = (
-    f"{'使用' if params['nisa_on'] else '未使用'}  "
-    f"積立 {params['nisa_contrib_monthly']//10000:.1f}万円/月"
-    f"（{params['nisa_contrib_start']}〜{params['nisa_contrib_end']}歳）  "
-    f"取崩 {params['nisa_withdraw_mode']} "
-    f"{params['nisa_withdraw_annual']//10000:,}万円 or {params['nisa_withdraw_rate']*100:.1f}%"
-    f"（{params['nisa_withdraw_start']}歳〜）  "
-    f"リターン {params['nisa_return']*100:.1f}% / ボラ {params['nisa_vol']*100:.1f}%"
-)
-_tax_str = (
-    f"{'使用' if params['taxable_on'] else '未使用'}  "
-    f"積立 {params['taxable_contrib_monthly']//10000:.1f}万円/月"
-    f"（{params['taxable_contrib_start']}〜{params['taxable_contrib_end']}歳）  "
-    f"取崩 {params['taxable_withdraw_mode']} "
-    f"{params['taxable_withdraw_annual']//10000:,}万円 or {params['taxable_withdraw_rate']*100:.1f}%"
-    f"（{params['taxable_withdraw_start']}歳〜）  "
-    f"譲渡税率 {params['taxable_tax_rate']*100:.3f}%  "
-    f"リターン {params['tax_return']*100:.1f}% / ボラ {params['tax_vol']*100:.1f}%"
-)
+    _mc_text = (
+        (f"試行 自動（上限 {params['auto_max_trials']:,}回、許容幅 破綻確率±{params['auto_ruin_tol']:.1f}pt・"
+         f"中央値±{params['auto_median_tol']*100:.1f}%）") if params["auto_trials"]
+        else f"試行 {params['trials']:,}回"
+    ) + f"  サンプリング {params['sampling']}  破綻しきい値 {params['ruin_threshold']}%"
+    if params.get("sampling") == "bootstrap":
+        _mc_text += (f"  履歴 {os.path.basename(params['returns_csv']) or '（未指定）'}"
+                     f"（{'月次' if params['bootstrap_freq'] == 'monthly' else '年次'}・ブロック {params['bootstrap_block']}年"
+                     f"{'・水準そのまま' if params['bootstrap_raw'] else ''}）")
+
+    _confirm_rows = [
+        ("期間",        f"{params['start_age']}歳 〜 {params['end_age']}歳"),
+        ("初期資産",    f"現金 {params['initial_cash']//10000:,}万  iDeCo {params['initial_ideco']//10000:,}万  NISA {params['initial_nisa']//10000:,}万  特定口座 {params['initial_taxable']//10000:,}万"),
+        ("収入",        f"給与 {params['salary_net']//10000:,}万円/年（〜{params['retire_age']}歳）  年金 {params['pension_annual']//10000:,}万円/年（{params['pension_start_age']}歳〜）"),
+        ("生活費",      f"退職前 {params['living_before']//10000:,}万円/年  退職後 {params['living_after']//10000:,}万円/年"),
+        ("インフレ率",  f"{params['inflation_rate']*100:.2f}%/年"),
+    ]
+    if params["ideco_on"]:
+        _confirm_rows.append(("iDeCo", _ideco_str))
+    if params["nisa_on"]:
+        _confirm_rows.append(("NISA", _nisa_str))
+    if params["taxable_on"]:
+        _confirm_rows.append(("特定口座", _tax_str))
+    _confirm_rows += [
+        ("イベント",     _ev_text),
+        ("モンテカルロ", _mc_text),
+    ]
 
-_confirm_rows = [
-    ("期間",        f"{params['start_age']}歳 〜 {params['end_age']}歳"),
-    ("初期資産",    f"現金 {params['initial_cash']//10000:,}万  iDeCo {params['initial_ideco']//10000:,}万  NISA {params['initial_nisa']//10000:,}万  特定口座 {params['initial_taxable']//10000:,}万"),
-    ("収入",        f"給与 {params['salary_net']//10000:,}万円/年（〜{params['retire_age']}歳）  年金 {params['pension_annual']//10000:,}万円/年（{params['pension_start_age']}歳〜）"),
-    ("生活費",      f"退職前 {params['living_before']//10000:,}万円/年  退職後 {params['living_after']//10000:,}万円/年"),
-    ("インフレ率",  f"{params['inflation_rate']*100:.2f}%/年"),
-]
-if params["ideco_on"]:
-    _confirm_rows.append(("iDeCo", _ideco_str))
-if params["nisa_on"]:
-    _confirm_rows.append(("NISA", _nisa_str))
-if params["taxable_on"]:
-    _confirm_rows.append(("特定口座", _tax_str))
-_confirm_rows += [
-    ("イベント",     _ev_text),
-    ("モンテカルロ", f"試行 {params['trials']}回  破綻しきい値 {params['ruin_threshold']}%"),
-]
-
-_df_confirm = pd.DataFrame(_confirm_rows, columns=["項目", "設定値"])
-st.dataframe(_df_confirm, use_container_width=True, hide_index=True,
-    column_config={"項目": st.column_config.TextColumn(width="small"),
-                   "設定値": st.column_config.TextColumn(width="large")})
-st.caption("※ 上記の設定内容を確認してから実行ボタンを押してください。")
-
-run_clicked = st.button("▶ シミュレーション実行", use_container_width=True, type="primary")
-
-if run_clicked:
-    with st.spinner("⏳ シミュレーション計算中..."):
-        years_arr = np.arange(params["start_age"], params["end_age"] + 1)
-
-        sample_paths_total = []
-        if params["show_sample_paths"] and params["sample_paths_n"] > 0:
-            rng_s = np.random.default_rng(seed=7)
-            for _ in range(min(int(params["sample_paths_n"]), int(params["trials"]))):
-                out = simulate_path(params, rng_s)
-                sample_paths_total.append(out["total"].copy())
-
-        rng = np.random.default_rng(seed=42)
-        total_mat=[]; cash_mat=[]; ideco_mat=[]; nisa_mat=[]; taxable_mat=[]
-        ic_mat=[]; nc_mat=[]; iw_mat=[]; nw_mat=[]; tc_mat=[]; tw_mat=[]
-        ruin_ages=[]; ruin_counts=np.zeros(len(years_arr), dtype=float)
-
-        for _ in range(int(params["trials"])):
-            out = simulate_path(params, rng)
-            total_mat.append(out["total"]); cash_mat.append(out["cash"])
-            ideco_mat.append(out["ideco"]); nisa_mat.append(out["nisa"])
-            taxable_mat.append(out["taxable"])
-            ic_mat.append(out["ic"]); nc_mat.append(out["nc"])
-            iw_mat.append(out["iw"]); nw_mat.append(out["nw"])
-            tc_mat.append(out["tc"]); tw_mat.append(out["tw"])
-            if out["ruined"] and out["ruin_age"] is not None:
-                ruin_ages.append(out["ruin_age"])
-                ruin_counts[np.where(years_arr >= out["ruin_age"])[0]] += 1
-            else:
-                ruin_ages.append(np.nan)
-
-        total_mat   = np.array(total_mat);  cash_mat  = np.array(cash_mat)
-        ideco_mat   = np.array(ideco_mat);  nisa_mat  = np.array(nisa_mat)
-        taxable_mat = np.array(taxable_mat)
-
-        avg_total  = total_mat.mean(axis=0)
-        p10_total  = np.percentile(total_mat, 10, axis=0)
-        p90_total  = np.percentile(total_mat, 90, axis=0)
-        avg_cash   = cash_mat.mean(axis=0);   avg_ideco   = ideco_mat.mean(axis=0)
-        avg_nisa   = nisa_mat.mean(axis=0);   avg_taxable = taxable_mat.mean(axis=0)
-
-        final_assets  = total_mat[:, -1]
-        survival_rate = float(np.mean(final_assets > 0) * 100)
-        rfa           = np.array(ruin_ages, dtype=float)
-        ruin_rate     = float(np.mean(np.isfinite(rfa)) * 100)
-        median_final  = float(np.median(final_assets))
-        p10_final     = float(np.percentile(final_assets, 10))
-        p90_final     = float(np.percentile(final_assets, 90))
-
-        ruin_prob    = ruin_counts / float(params["trials"]) * 100
-        median_ruin  = int(np.nanmedian(rfa)) if np.any(np.isfinite(rfa)) else None
-        over_idx     = np.where(ruin_prob >= params["ruin_threshold"])[0]
-        ruin_thr_age = int(years_arr[over_idx[0]]) if len(over_idx) > 0 else None
-
-        # ── key_events: elabel は ASCII のみ（文字化け回避） ──
-        key_events = [
-            {"age": params["retire_age"],
-             "label":  f"退職（{params['retire_age']}歳）",
-             "elabel": f"Retire (age {params['retire_age']})",
-             "color": "#e67e22"},
-            {"age": params["pension_start_age"],
-             "label":  f"年金開始（{params['pension_start_age']}歳）",
-             "elabel": f"Pension (age {params['pension_start_age']})",
-             "color": "#2980b9"},
-        ]
-        for ev in params["events"]:
-            if ev["on"]:
-                sign = "+" if ev["direction"] == "収入" else "-"
-                # elabel は番号と金額のみ（日本語ラベルを除外して文字化け回避）
-                key_events.append({
-                    "age":    ev["age"],
-                    "label":  f"[Ev{ev['idx']}] {ev['label']}（{sign}{ev['amount']//10000:,}万円）",
-                    "elabel": f"Ev{ev['idx']} {sign}{ev['amount']//10000:,}M (age {ev['age']})",
-                    "color":  "#27ae60" if ev["direction"] == "収入" else "#c0392b",
-                })
-        if ruin_thr_age:
-            key_events.append({
-                "age":    ruin_thr_age,
-                "label":  f"⚠ 破綻{params['ruin_threshold']}%超（{ruin_thr_age}歳）",
-                "elabel": f"Ruin>{params['ruin_threshold']}% (age {ruin_thr_age})",
-                "color":  "#8e44ad",
-            })
+    st.dataframe({"項目": [r[0] for r in _confirm_rows], "設定値": [r[1] for r in _confirm_rows]},
+        use_container_width=True, hide_index=True,
+        column_config={"項目": st.column_config.TextColumn(width="small"),
+                       "設定値": st.column_config.TextColumn(width="large")})
+    st.caption("※ 上記の設定内容を確認してから実行ボタンを押してください。")
+
+    _bs_missing = params.get("sampling") == "bootstrap" and not params.get("bootstrap_map")
+    _bs_zero_vol = (params.get("sampling") == "bootstrap" and params.get("bootstrap_raw")
+                    and min(params["ideco_vol"], params["nisa_vol"], params["tax_vol"]) <= 0)
+    if _bs_missing:
+        st.warning("ヒストリカル方式は、読み込めるリターン履歴 CSV を指定し、各口座の系列を選ぶと実行できます。")
+    elif _bs_zero_vol:
+        st.warning("履歴のリターン水準をそのまま使う場合は、全口座の変動率を 0 より大きくしてください。")
+        _bs_missing = True
+    run_clicked = st.button("▶ シミュレーション実行", use_container_width=True, type="primary",
+                            disabled=_bs_missing)
+
+    if run_clicked:
+        # 計算はバックグラウンドのワーカーで行い、進捗は fragment の外の job_monitor が表示する
+        _prof = Profiler(track_memory=st.session_state.get("prof_mem", False))
+        try:
+            _job = default_jobs().submit(params, owner=st.session_state.session_uid,
+                                         workers=workers, profiler=_prof, backend=backend,
+                                         checkpoints=default_checkpoints())
+        except JobQueueFull:
+            st.warning("⏳ 現在ほかの計算で混み合っています。少し待ってから再度実行してください。")
+        else:
+            st.session_state.job = _job
+            st.session_state.job_params = params
+            st.session_state.job_profile = _prof
+            st.rerun()   # 進捗表示（fragment の外）を出す
+
+    if st.session_state.sim_done and st.session_state.sim_result is not None:
+        st.success("✅ 計算完了！")
+        if "sim_source" in st.session_state:
+            _src, _sec = st.session_state.sim_source
+            _cs = default_cache().stats()
+            st.caption(f"{'キャッシュから取得' if _src != 'miss' else '新規計算'}（{_sec*1000:,.0f} ms）　"
+                       f"結果キャッシュ: ヒット {_cs['hits_memory']}（メモリ）/ {_cs['hits_disk']}（ディスク）・"
+                       f"ミス {_cs['misses']}・保持 {_cs['items']} 件")
+        st.components.v1.html("""
+        <div style="text-align:center;margin:8px 0;">
+          <button onclick="(function(){var t=window.parent.document.querySelectorAll('div[data-testid=stTabs] button[role=tab]');if(t.length>=2){t[1].click();}})()"
+            style="font-size:18px;font-weight:700;color:#fff;background:#1a6aff;border:none;
+                   border-radius:10px;padding:14px 40px;cursor:pointer;
+                   box-shadow:0 4px 12px rgba(26,106,255,0.35);">
+            📈 グラフ・結果を見る →
+          </button>
+          <div style="margin-top:10px;font-size:14px;color:#888;">※ 上にスクロールしてご確認ください。</div>
+        </div>""", height=100)
+
+
+# ── バックグラウンド実行の進捗 ───────────────────────────
+_JOB_POLL_SEC = 0.5
+
+
+def _apply_job(job):
+    """終わったジョブを画面の状態に反映する。"""
+    st.session_state.job = None
+    if job.status == "done":
+        _prof = st.session_state.get("job_profile") or Profiler()
+        if job.source != "miss":
+            _prof.add(f"cache ({job.source})", job.seconds)
+        st.session_state.sim_result = job.result
+        st.session_state.sim_source = (job.source, job.seconds)
+        st.session_state.sim_params = st.session_state.get("job_params")
+        st.session_state.run_profile = _prof
+        st.session_state.profile_logged = False
+        st.session_state.sim_done = True
+    elif job.status == "error":
+        logging.getLogger("lifesim.ui").error("simulation job failed", exc_info=job.error)
+        st.session_state.job_notice = ("error", f"計算中にエラーが発生しました: {job.error}")
+    else:
+        st.session_state.job_notice = ("info", "計算を中止しました。")
 
-        st.session_state.sim_result = dict(
-            years=years_arr, sample_paths_total=sample_paths_total,
-            avg_total=avg_total, p10_total=p10_total, p90_total=p90_total,
-            avg_cash=avg_cash, avg_ideco=avg_ideco, avg_nisa=avg_nisa,
-            avg_taxable=avg_taxable,
-            survival_rate=survival_rate, ruin_rate=ruin_rate,
-            median_final=median_final, p10_final=p10_final, p90_final=p90_final,
-            ruin_prob=ruin_prob, median_ruin=median_ruin,
-            threshold=params["ruin_threshold"], ruin_thr_age=ruin_thr_age,
-            avg_ic=np.array(ic_mat).mean(axis=0), avg_nc=np.array(nc_mat).mean(axis=0),
-            avg_iw=np.array(iw_mat).mean(axis=0), avg_nw=np.array(nw_mat).mean(axis=0),
-            avg_tc=np.array(tc_mat).mean(axis=0), avg_tw=np.array(tw_mat).mean(axis=0),
-            yr_cnt=len(years_arr), key_events=key_events,
-            show_sp=params["show_sample_paths"],
-        )
-    st.session_state.sim_done = True
-
-if st.session_state.sim_done and st.session_state.sim_result is not None:
-    st.success("✅ 計算完了！")
-    st.components.v1.html("""
-    <div style="text-align:center;margin:8px 0;">
-      <button onclick="(function(){var t=window.parent.document.querySelectorAll('div[data-testid=stTabs] button[role=tab]');if(t.length>=2){t[1].click();}})()"
-        style="font-size:18px;font-weight:700;color:#fff;background:#1a6aff;border:none;
-               border-radius:10px;padding:14px 40px;cursor:pointer;
-               box-shadow:0 4px 12px rgba(26,106,255,0.35);">
-        📈 グラフ・結果を見る →
-      </button>
-      <div style="margin-top:10px;font-size:14px;color:#888;">※ 上にスクロールしてご確認ください。</div>
-    </div>""", height=100)
+
+def _job_monitor_body():
+    job = st.session_state.get("job")
+    if job is None:
+        return
+    if job.finished:
+        _apply_job(job)
+        st.rerun()   # 結果タブ等を新しい結果で描き直す
+    done, total = job.progress
+    st.progress(min(done / max(total, 1), 1.0),
+                text=(f"⏳ シミュレーション計算中… {done:,} / {total:,} 試行" if job.status == "running"
+                      else "⏳ 計算の順番待ち…"))
+    if st.button("⏹ 計算を中止", key=f"job_cancel_{job.id}"):
+        job.cancel()
+        _apply_job(job)
+        st.rerun()
+    part = job.partial
+    if part is not None:   # 集計済みの試行だけで描いた暫定の帯と破綻確率（バッチごとに精度が上がる）
+        import pandas as pd
+        _fan_idx = {q: i for i, q in enumerate(FAN_QUANTILES)}
+        c1, c2 = st.columns(2)
+        c1.caption(f"総資産の推移（暫定・{part.trials:,} 試行、万円）")
+        c1.line_chart(pd.DataFrame({f"{q}%": part.fan_total[_fan_idx[q]] / 10000 for q in (10, 50, 90)},
+                                   index=part.years))
+        c2.caption("破綻確率（暫定、%）")
+        c2.line_chart(pd.DataFrame({"破綻確率": part.ruin_prob}, index=part.years))
+
+
+if getattr(st, "fragment", None) is not None:
+    _job_monitor = st.fragment(run_every=_JOB_POLL_SEC)(_job_monitor_body)
+else:   # run_every のない版はスクリプト全体を一定間隔で再実行する
+    def _job_monitor():
+        _job_monitor_body()
+        time.sleep(_JOB_POLL_SEC)
+        st.rerun()
+
+
+with tab_input:
+    input_panel()
+    params, workers = st.session_state.panel_params, st.session_state.panel_workers
+    if st.session_state.job is not None:
+        _job_monitor()
+    _notice = st.session_state.pop("job_notice", None)
+    if _notice:
+        getattr(st, _notice[0])(_notice[1])
+
+# ══════════════════════════════════════════════════════════
+#  受給開始年齢比較タブ（結果タブは未実行時に st.stop するので先に描画）
+# ══════════════════════════════════════════════════════════
+with tab_sweep:
+    st.header("🔁 年金 受給開始年齢の比較")
+    st.caption("現在の設定をもとに受給開始年齢（必要なら退職年齢も）を変えた全パターンを、"
+               "同じ乱数シナリオで一括計算します。差は設定の違いだけを反映します。")
+    sw_pa = st.slider("受給開始年齢の範囲", 60, 75, (60, 75), 1, key="sw_pa")
+    sw_cross = st.checkbox("退職年齢も変えて比較する", value=False, key="sw_cross")
+    sw_ra = st.slider("退職年齢の範囲", 50, 75, (60, 70), 1, key="sw_ra") if sw_cross else None
+    sw_adjust = st.checkbox("繰上げ減額（0.4%/月）・繰下げ増額（0.7%/月）を年金額に反映", value=True, key="sw_adj")
+    st.caption(f"※ 反映する場合、入力中の年金額（{params['pension_annual']//10000:,}万円/年）を "
+               f"{params['pension_start_age']}歳受給開始時の額とみなして換算します。")
+    sw_trials = linked_int("試行回数（比較用）", 200, 5000, min(int(params["trials"]), 2000), 100, "sw_trials")
+    if st.button("▶ 比較を実行", use_container_width=True, key="sw_run"):
+        from lifesim.sweep import sweep_pension
+        with st.spinner("⏳ 比較計算中..."):
+            st.session_state.sweep_rows = sweep_pension(
+                params, range(sw_pa[0], sw_pa[1] + 1),
+                range(sw_ra[0], sw_ra[1] + 1) if sw_ra else None,
+                trials=sw_trials, adjust_amount=sw_adjust)
+
+    rows = st.session_state.get("sweep_rows")
+    if rows:
+        import pandas as pd
+        import plotly.graph_objects as go
+        from plotly.subplots import make_subplots
+        df_sw = pd.DataFrame([{
+            "退職年齢":           r["retire_age"],
+            "受給開始年齢":       r["pension_start_age"],
+            "年金（万円/年）":    int(round(r["pension_annual"] / 10000)),
+            "資産が残る確率（%）": round(r["survival_rate"], 1),
+            "破綻確率（%）":      round(r["ruin_rate"], 1),
+            "最終資産 中央値（万円）": int(r["median_final"] / 10000),
+            "最終資産 10%（万円）":    int(r["p10_final"] / 10000),
+        } for r in rows])
+        best = df_sw.loc[df_sw["資産が残る確率（%）"].idxmax()]
+        st.success(f"資産が残る確率が最も高いのは 退職 {best['退職年齢']}歳・受給開始 {best['受給開始年齢']}歳"
+                   f"（{best['資産が残る確率（%）']:.1f}%）です。")
+        fig_sw = make_subplots(rows=1, cols=2, subplot_titles=("資産が残る確率（%）", "最終資産 中央値（万円）"))
+        if df_sw["退職年齢"].nunique() > 1:
+            for col, name in ((1, "資産が残る確率（%）"), (2, "最終資産 中央値（万円）")):
+                grid = df_sw.pivot(index="退職年齢", columns="受給開始年齢", values=name)
+                fig_sw.add_trace(go.Heatmap(
+                    z=grid.values, x=grid.columns, y=grid.index, colorscale="RdYlGn",
+                    colorbar=dict(x=0.45 if col == 1 else 1.0, len=0.9),
+                    hovertemplate="受給開始 %{x}歳 / 退職 %{y}歳<br>%{z:,.1f}<extra></extra>",
+                ), row=1, col=col)
+                fig_sw.update_xaxes(title_text="受給開始年齢", row=1, col=col)
+                fig_sw.update_yaxes(title_text="退職年齢", row=1, col=col)
+        else:
+            fig_sw.add_trace(go.Bar(x=df_sw["受給開始年齢"], y=df_sw["資産が残る確率（%）"],
+                                    marker_color="#1a6aff", name="資産が残る確率"), row=1, col=1)
+            fig_sw.add_trace(go.Bar(x=df_sw["受給開始年齢"], y=df_sw["最終資産 中央値（万円）"],
+                                    marker_color="#27ae60", name="最終資産 中央値"), row=1, col=2)
+            fig_sw.update_xaxes(title_text="受給開始年齢")
+        fig_sw.update_layout(height=420, showlegend=False, margin=dict(t=60, b=40))
+        st.plotly_chart(fig_sw, use_container_width=True)
+        st.dataframe(df_sw, use_container_width=True, hide_index=True)
+
+# ══════════════════════════════════════════════════════════
+#  目標逆算タブ
+# ══════════════════════════════════════════════════════════
+with tab_goal:
+    st.header("🎯 目標から逆算")
+    st.caption("破綻確率（資産が一度でも0円以下になる確率）が目標以下に収まる限界を、"
+               "同じ乱数シナリオのまま二分探索で求めます。")
+    gs_target = st.radio("求める項目", ["living_after", "retire_age"], horizontal=True, key="gs_target",
+                         format_func=lambda t: {"living_after": "退職後に使える生活費の上限",
+                                                "retire_age": "最も早い退職年齢"}[t])
+    gs_ruin = linked_int("許容する破綻確率（%）", 1, 50, int(clamp(params["ruin_threshold"], 1, 50)), 1, "gs_ruin")
+    gs_trials = linked_int("試行回数（逆算用）", 500, 10000, 2000, 500, "gs_trials")
+    if st.button("▶ 逆算を実行", use_container_width=True, key="gs_run"):
+        from lifesim.solver import solve
+        with st.spinner("⏳ 逆算中..."):
+            st.session_state.goal_result = solve(params, gs_target, gs_ruin, trials=gs_trials)
+
+    gr = st.session_state.get("goal_result")
+    if gr is not None:
+        if gr.target == "living_after":
+            _fmt = lambda v: f"{v / 10000:,.0f}万円/年"
+            _name = "退職後の生活費 上限"
+        else:
+            _fmt = lambda v: f"{v:.0f}歳"
+            _name = "最も早い退職年齢"
+        if gr.value is None:
+            st.warning(f"探索範囲（{_fmt(gr.bounds[0])}〜{_fmt(gr.bounds[1])}）では"
+                       f"破綻確率 {gr.target_ruin:.1f}% 以下を達成できませんでした。")
+        else:
+            g1, g2, g3 = st.columns(3)
+            g1.metric(_name, _fmt(gr.value))
+            g2.metric("その時の破綻確率", f"{gr.ruin_rate:.1f}%")
+            g3.metric("推定の幅（95%）", f"{_fmt(gr.ci[0])}〜{_fmt(gr.ci[1])}")
+            st.caption(f"試行 {gr.trials:,}回 × エンジン呼び出し {gr.evaluations}回 ／ "
+                       f"探索範囲 {_fmt(gr.bounds[0])}〜{_fmt(gr.bounds[1])}")
 
 # ══════════════════════════════════════════════════════════
 #  結果タブ
@@ -739,23 +912,33 @@ with tab_result:
     if result is None:
         st.info("「⚙️ 設定入力」タブで設定後、「▶ シミュレーション実行」を押してください。")
         st.stop()
-
-    years_arr = result["years"]
-    avg_total=result["avg_total"]; p10_total=result["p10_total"]; p90_total=result["p90_total"]
-    avg_cash=result["avg_cash"];   avg_ideco=result["avg_ideco"]; avg_nisa=result["avg_nisa"]
-    avg_taxable=result["avg_taxable"]
-    survival_rate=result["survival_rate"]; ruin_rate=result["ruin_rate"]
-    median_final=result["median_final"]; p10_final=result["p10_final"]; p90_final=result["p90_final"]
-    ruin_prob=result["ruin_prob"]; median_ruin=result["median_ruin"]
-    threshold=result["threshold"]; ruin_thr_age=result["ruin_thr_age"]
-    key_events=result["key_events"]; show_sp=result["show_sp"]
-    sample_paths_total=result["sample_paths_total"]
+    import numpy as np
+    import pandas as pd
+    # 分析専用の項目は現在の入力で、それ以外は実行時の params で作り直す（エンジンは回さない）
+    result = analyze(result, {**st.session_state.get("sim_params", params),
+                              **{k: params[k] for k in ANALYSIS_FIELDS}})
+
+    years_arr = result.years
+    avg_total=result.avg_total; p10_total=result.p10_total; p90_total=result.p90_total
+    avg_cash=result.avg_cash;   avg_ideco=result.avg_ideco; avg_nisa=result.avg_nisa
+    avg_taxable=result.avg_taxable
+    survival_rate=result.survival_rate; ruin_rate=result.ruin_rate
+    median_final=result.median_final; p10_final=result.p10_final; p90_final=result.p90_final
+    ruin_prob=result.ruin_prob; median_ruin=result.median_ruin
+    threshold=result.threshold; ruin_thr_age=result.ruin_thr_age
+    key_events=result.key_events; show_sp=result.show_sp
+    sample_paths_total=result.sample_paths_total[:result.sp_n]
+    highlight = dict(zip(HIGHLIGHT_QUANTILES, result.highlight_total))
 
     c1,c2,c3,c4 = st.columns(4)
     c1.metric("資産が残る確率",       f"{survival_rate:.1f}%")
     c2.metric("破綻確率（総資産≤0）", f"{ruin_rate:.1f}%")
     c3.metric("最終資産（中央値）",   fmt_man(median_final))
     c4.metric("最終資産（10〜90%）",  f"{int(p10_final/10000):,}〜{int(p90_final/10000):,} 万円")
+    st.caption(f"95%信頼区間：破綻確率 {result.ruin_ci[0]:.1f}〜{result.ruin_ci[1]:.1f}%　"
+               f"最終資産（中央値） {int(result.median_ci[0]/10000):,}〜{int(result.median_ci[1]/10000):,} 万円　"
+               f"（試行 {result.trials:,} 回"
+               + ("" if result.converged else "・上限到達のため許容幅未達") + "）")
 
     if ruin_thr_age is not None:
         idx0 = int(np.where(years_arr == ruin_thr_age)[0][0])
@@ -763,6 +946,10 @@ with tab_result:
     else:
         st.success(f"✅ 破綻確率が {threshold}% を超える年齢はありませんでした。")
 
+    show_hl = st.checkbox("代表パス（最終資産 10% / 中央値 / 90% の試行）を強調表示",
+                          value=True, disabled=len(highlight) == 0)
+    st.caption("※ サンプル軌跡・代表パスは本番の試行から抽出しています（帯と同じ分布）。")
+
     with st.expander("📌 重要変換点", expanded=True):
         cols = st.columns(3)
         for i, ke in enumerate(sorted(key_events, key=lambda x: x["age"])):
@@ -772,144 +959,27 @@ with tab_result:
 
     st.divider()
 
-    # ── グラフ（全テキストを ASCII のみにして文字化け回避） ──
-    fig = plt.figure(figsize=(18, 10))
-    gs  = fig.add_gridspec(2, 1, height_ratios=[3.0, 1.2], hspace=0.28)
-    ax  = fig.add_subplot(gs[0])
-    ax2 = fig.add_subplot(gs[1])
-
-    if show_sp and len(sample_paths_total) > 0:
-        for sp in sample_paths_total:
-            ax.plot(years_arr, yen_to_man(sp), alpha=0.06, linewidth=0.8, color="#8899bb")
-
-    ax.fill_between(years_arr, yen_to_man(p10_total), yen_to_man(p90_total),
-                    alpha=0.20, color="#4c72b0", label="Total Assets (10-90%)")
-    ax.plot(years_arr, yen_to_man(avg_total),  lw=3.0, ls="-",               color="#1a6aff", label="Total (avg)")
-    ax.plot(years_arr, yen_to_man(avg_cash),   lw=2.0, ls="--",              color="#e67e22", label="Cash (avg)")
-    ax.plot(years_arr, yen_to_man(avg_ideco),  lw=2.0, ls="-.",              color="#27ae60", label="iDeCo (avg)")
-    ax.plot(years_arr, yen_to_man(avg_nisa),   lw=2.0, ls=":",               color="#8e44ad", label="NISA (avg)")
-    ax.plot(years_arr, yen_to_man(avg_taxable),lw=2.0, ls=(0,(3,1,1,1,1,1)),color="#16a085", label="Taxable (avg)")
-    ax.axhline(0, lw=1.4, ls="--", alpha=0.5, color="red")
-
-    y_max   = float(yen_to_man(np.max(p90_total)))
-    y_min   = float(yen_to_man(np.min(p10_total)))
-    y_range = max(abs(y_max - y_min), 1.0)
-    plotted_ages = []
-    for ke in sorted(key_events, key=lambda x: x["age"]):
-        age = ke["age"]
-        if age not in years_arr: continue
-        idx   = int(np.where(years_arr == age)[0][0])
-        y_val = float(yen_to_man(avg_total[idx]))
-        n_near = sum(1 for a in plotted_ages if abs(a - age) < 4)
-        y_off  = y_range * (0.14 + n_near * 0.11)
-        plotted_ages.append(age)
-        ax.annotate(ke["elabel"],          # ← ASCII only
-                    xy=(age, y_val), xytext=(age, y_val + y_off),
-                    fontsize=9, color=ke["color"], fontweight="bold", ha="center",
-                    arrowprops=dict(arrowstyle="->", color=ke["color"], lw=1.2),
-                    bbox=dict(boxstyle="round,pad=0.3", facecolor="white",
-                              edgecolor=ke["color"], alpha=0.88))
-
-    ax.set_title("Asset Future Forecast Pro - Monte Carlo", fontsize=15, fontweight="bold", pad=12)
-    ax.set_xlabel("Age", fontsize=13)
-    ax.set_ylabel("Assets (10,000 JPY)", fontsize=13)
-    ax.grid(True, alpha=0.22)
-    ax.legend(ncols=2, fontsize=11, loc="upper right")
-    ax.tick_params(labelsize=12)
-
-    ax2.plot(years_arr, ruin_prob, lw=2.5, color="#c0392b", label="Ruin Probability")
-    ax2.axhline(threshold, ls="--", lw=1.5, alpha=0.8, color="#8e44ad", label=f"Threshold {threshold}%")
-    mask = ruin_prob >= threshold
-    ax2.fill_between(years_arr, 0, 100, where=mask, alpha=0.10, color="#c0392b")
-    if ruin_thr_age is not None:
-        ax2.axvline(ruin_thr_age, ls="--", lw=2.0, alpha=0.7, color="#8e44ad")
-        ax2.text(ruin_thr_age + 0.3, 88, f"Ruin>{threshold}% at age {ruin_thr_age}",
-                 fontsize=10, color="#8e44ad", fontweight="bold")
-    ax2.set_xlabel("Age", fontsize=12)
-    ax2.set_ylabel("Ruin Prob. (%)", fontsize=12)
-    ax2.set_ylim(0, 100)
-    ax2.grid(True, alpha=0.22)
-    ax2.legend(fontsize=11, loc="upper left")
-    ax2.tick_params(labelsize=11)
-
-    st.pyplot(fig, use_container_width=True)
-    plt.close(fig)
+    # ── グラフ（結果ごとに 1 回だけ描画し、画像バイト列をキャッシュから表示） ──
+    _rprof = Profiler(track_memory=st.session_state.get("prof_mem", False))   # この再実行での描画の計測
+    with _rprof.stage("matplotlib render"):
+        st.image(cached_static_chart(result.view_key, show_hl, "png", result), use_container_width=True)
+    # SVG は大きく描画も重いので、押されたときだけ作る（以後この結果では再利用）
+    _svg_ready = st.session_state.get("svg_ready") == (result.view_key, show_hl)
+    if not _svg_ready and st.button("🖼 SVG を作成（ダウンロード用）", key="svg_prep"):
+        st.session_state.svg_ready = (result.view_key, show_hl)
+        _svg_ready = True
+    if _svg_ready:
+        with _rprof.stage("svg render"), st.spinner("⏳ SVG を作成中..."):
+            _svg = cached_static_chart(result.view_key, show_hl, "svg", result)
+        st.download_button("🖼 グラフをSVGでダウンロード", _svg, "asset_forecast_pro_chart.svg", "image/svg+xml")
 
     # ── インタラクティブグラフ（Plotly / ツールチップ付き） ──
     st.subheader("🖱 インタラクティブグラフ（カーソルでツールチップ表示）")
-    avg_invest = avg_ideco + avg_nisa + avg_taxable
-    customdata_main = np.column_stack([
-        yen_to_man(avg_cash),
-        yen_to_man(avg_invest),
-        ruin_prob,
-    ])
-    ht_main = (
-        "<b>年齢: %{x}歳</b><br>"
-        "総資産: %{y:,.0f} 万円<br>"
-        "現金残高: %{customdata[0]:,.0f} 万円<br>"
-        "総投資資産: %{customdata[1]:,.0f} 万円<br>"
-        "破綻確率: %{customdata[2]:.1f}%<br>"
-        "<extra></extra>"
-    )
-    fig_pl = make_subplots(
-        rows=2, cols=1,
-        row_heights=[0.68, 0.32],
-        shared_xaxes=True,
-        vertical_spacing=0.06,
-        subplot_titles=("資産推移（平均）", "破綻確率（%）"),
-    )
-    # P10-P90 帯
-    fig_pl.add_trace(go.Scatter(
-        x=np.concatenate([years_arr, years_arr[::-1]]),
-        y=np.concatenate([yen_to_man(p90_total), yen_to_man(p10_total)[::-1]]),
-        fill="toself", fillcolor="rgba(76,114,176,0.15)",
-        line=dict(color="rgba(0,0,0,0)"),
-        name="総資産 10-90%帯", hoverinfo="skip",
-    ), row=1, col=1)
-    # 総資産（平均）- メイントレース（ツールチップ付き）
-    fig_pl.add_trace(go.Scatter(
-        x=years_arr, y=yen_to_man(avg_total),
-        name="総資産（平均）",
-        line=dict(color="#1a6aff", width=3),
-        customdata=customdata_main,
-        hovertemplate=ht_main,
-    ), row=1, col=1)
-    # 現金
-    fig_pl.add_trace(go.Scatter(
-        x=years_arr, y=yen_to_man(avg_cash),
-        name="現金（平均）",
-        line=dict(color="#e67e22", width=2, dash="dash"),
-        hoverinfo="skip",
-    ), row=1, col=1)
-    # 総投資資産
-    fig_pl.add_trace(go.Scatter(
-        x=years_arr, y=yen_to_man(avg_invest),
-        name="総投資資産（iDeCo+NISA+特定）",
-        line=dict(color="#27ae60", width=2, dash="dot"),
-        hoverinfo="skip",
-    ), row=1, col=1)
-    # 破綻確率
-    fig_pl.add_trace(go.Scatter(
-        x=years_arr, y=ruin_prob,
-        name="破綻確率",
-        line=dict(color="#c0392b", width=2),
-        fill="tozeroy", fillcolor="rgba(192,57,43,0.08)",
-        hovertemplate="年齢: %{x}歳<br>破綻確率: %{y:.1f}%<extra></extra>",
-    ), row=2, col=1)
-    # しきい値ライン
-    fig_pl.add_hline(y=threshold, line_dash="dash", line_color="#8e44ad",
-                     annotation_text=f"しきい値 {threshold}%",
-                     annotation_position="top left", row=2, col=1)
-    fig_pl.update_layout(
-        height=580,
-        hovermode="x unified",
-        legend=dict(orientation="h", y=1.02, x=0),
-        margin=dict(t=60, b=40),
-    )
-    fig_pl.update_xaxes(title_text="年齢（歳）", row=2, col=1)
-    fig_pl.update_yaxes(title_text="資産（万円）", row=1, col=1)
-    fig_pl.update_yaxes(title_text="破綻確率（%）", range=[0, 100], row=2, col=1)
-    st.plotly_chart(fig_pl, use_container_width=True)
+    lite_pl = st.toggle("軽量表示（WebGL 描画・サンプル軌跡の間引き）", value=False, key="lite_pl",
+                        help="古いPCやスマートフォンで表示が重いときに。")
+    with _rprof.stage("plotly serialization"):
+        st.plotly_chart(json.loads(cached_interactive_json(result.view_key, show_hl, lite_pl, result)),
+                        use_container_width=True)
 
     # ── 枠外：グラフ凡例 + アノテーション日本語対比表 ────
     # ライン種類の対比表
@@ -920,8 +990,10 @@ with tab_result:
 <tr><th style="text-align:left;padding:3px 8px;color:#555;border-bottom:1px solid #dde3ff;">English (graph)</th>
     <th style="text-align:left;padding:3px 8px;color:#555;border-bottom:1px solid #dde3ff;">日本語</th>
     <th style="text-align:left;padding:3px 8px;color:#555;border-bottom:1px solid #dde3ff;">備考</th></tr>
+<tr><td><span style="color:#4c72b0;opacity:0.4">■</span> Total Assets (5-95%)</td><td><b>総資産の5〜95%帯</b></td><td>モンテカルロ分布範囲（外側）</td></tr>
 <tr><td><span style="color:#4c72b0">■</span> Total Assets (10-90%)</td><td><b>総資産の10〜90%帯</b></td><td>モンテカルロ分布範囲</td></tr>
 <tr><td><span style="color:#1a6aff">─</span> Total (avg)</td><td><b>総資産（平均）</b></td><td>全口座合計</td></tr>
+<tr><td><span style="color:#34495e">─</span> Path P10 / P50 / P90 (final)</td><td><b>代表パス</b></td><td>最終資産が10%・中央値・90%に近い実際の試行</td></tr>
 <tr><td><span style="color:#e67e22">- -</span> Cash (avg)</td><td><b>現金・預金（平均）</b></td><td>リターン非連動</td></tr>
 <tr><td><span style="color:#27ae60">-・</span> iDeCo (avg)</td><td><b>iDeCo残高（平均）</b></td><td>口座別リターン適用</td></tr>
 <tr><td><span style="color:#8e44ad">…</span> NISA (avg)</td><td><b>NISA残高（平均）</b></td><td>口座別リターン適用</td></tr>
@@ -953,37 +1025,100 @@ with tab_result:
     tbl_col, stat_col = st.columns([2, 1])
     with tbl_col:
         st.subheader("📋 結果テーブル（平均）")
-        df = pd.DataFrame({
-            "年齢":             years_arr,
-            "総資産（万円）":   np.round(yen_to_man(avg_total),   0).astype(int),
-            "10%（万円）":      np.round(yen_to_man(p10_total),   0).astype(int),
-            "90%（万円）":      np.round(yen_to_man(p90_total),   0).astype(int),
-            "現金（万円）":     np.round(yen_to_man(avg_cash),    0).astype(int),
-            "iDeCo（万円）":    np.round(yen_to_man(avg_ideco),   0).astype(int),
-            "NISA（万円）":     np.round(yen_to_man(avg_nisa),    0).astype(int),
-            "特定口座（万円）": np.round(yen_to_man(avg_taxable), 0).astype(int),
-            "破綻確率（%）":    np.round(ruin_prob, 1),
-        })
-        st.dataframe(df, use_container_width=True, height=420)
-        csv = df.to_csv(index=False).encode("utf-8-sig")
-        st.download_button("📥 CSVダウンロード", csv,
-                           "asset_forecast_pro_results.csv", "text/csv", use_container_width=True)
+        with _rprof.stage("results DataFrame"):
+            df = pd.DataFrame({
+                "年齢":             years_arr,
+                "総資産（万円）":   np.round(yen_to_man(avg_total),   0).astype(int),
+                "10%（万円）":      np.round(yen_to_man(p10_total),   0).astype(int),
+                "90%（万円）":      np.round(yen_to_man(p90_total),   0).astype(int),
+                "現金（万円）":     np.round(yen_to_man(avg_cash),    0).astype(int),
+                "iDeCo（万円）":    np.round(yen_to_man(avg_ideco),   0).astype(int),
+                "NISA（万円）":     np.round(yen_to_man(avg_nisa),    0).astype(int),
+                "特定口座（万円）": np.round(yen_to_man(avg_taxable), 0).astype(int),
+                "破綻確率（%）":    np.round(ruin_prob, 1),
+            })
+            st.dataframe(df, use_container_width=True, height=420)
+            csv = df.to_csv(index=False).encode("utf-8-sig")
+            st.download_button("📥 CSVダウンロード", csv,
+                               "asset_forecast_pro_results.csv", "text/csv", use_container_width=True)
 
     with stat_col:
         st.subheader("🧮 積立 / 受取（平均）")
-        yr_cnt = result["yr_cnt"]
+        yr_cnt = result.yr_cnt
         c1, c2, c3 = st.columns(3)
         with c1:
-            st.metric("iDeCo 年平均積立", f"{int(result['avg_ic'].sum()/yr_cnt):,} 円")
-            st.metric("iDeCo 年平均受取", f"{int(result['avg_iw'].sum()/yr_cnt):,} 円")
+            st.metric("iDeCo 年平均積立", f"{int(result.avg_ic.sum()/yr_cnt):,} 円")
+            st.metric("iDeCo 年平均受取", f"{int(result.avg_iw.sum()/yr_cnt):,} 円")
         with c2:
-            st.metric("NISA 年平均積立",  f"{int(result['avg_nc'].sum()/yr_cnt):,} 円")
-            st.metric("NISA 年平均取崩",  f"{int(result['avg_nw'].sum()/yr_cnt):,} 円")
+            st.metric("NISA 年平均積立",  f"{int(result.avg_nc.sum()/yr_cnt):,} 円")
+            st.metric("NISA 年平均取崩",  f"{int(result.avg_nw.sum()/yr_cnt):,} 円")
         with c3:
-            st.metric("特定口座 年平均積立", f"{int(result['avg_tc'].sum()/yr_cnt):,} 円")
-            st.metric("特定口座 年平均取崩", f"{int(result['avg_tw'].sum()/yr_cnt):,} 円")
+            st.metric("特定口座 年平均積立", f"{int(result.avg_tc.sum()/yr_cnt):,} 円")
+            st.metric("特定口座 年平均取崩", f"{int(result.avg_tw.sum()/yr_cnt):,} 円")
         st.caption("※ 余剰不足時は設定額より少なくなる場合があります。")
         if median_ruin is not None:
             st.info(f"参考：破綻した試行の中央値は **{median_ruin}歳** でした。")
         else:
             st.success("試行内で総資産が 0 以下になったケースはありませんでした。")
+
+    with st.expander("🗃 全試行データの書き出し（分析用）"):
+        from lifesim.export import export_size_bytes, export_trials
+        _ex_params = st.session_state.get("sim_params", params)
+        _ex_mb = export_size_bytes(result.trials, result.yr_cnt) / 2**20
+        st.caption(f"全 {result.trials:,} 試行 × {result.yr_cnt} 年の口座別残高・積立・取崩と破綻年齢を "
+                   f"float32 の .npy（約 {_ex_mb:,.0f} MB）と meta.json（設定・seed・エンジン版）にまとめた zip です。"
+                   "展開して np.load(..., mmap_mode=\"r\") で必要な部分だけ読めます。"
+                   "並列実行した結果とは試行の並びが異なります（直列実行と同じ乱数列で再計算します）。")
+        if _ex_mb > 512:
+            st.warning("サイズが大きいため、コマンドライン（python -m lifesim.export）で書き出してください。")
+        elif st.button("書き出しを作成", key="ex_run"):
+            with st.spinner("⏳ 書き出し中..."), tempfile.TemporaryDirectory() as _td:
+                export_trials(_ex_params, _td, trials=result.trials, seed=result.seed,
+                              source_key=result.key)
+                _buf = io.BytesIO()
+                with zipfile.ZipFile(_buf, "w", zipfile.ZIP_STORED) as _zf:   # 無圧縮（展開後そのまま mmap 可）
+                    for _name in sorted(os.listdir(_td)):
+                        _zf.write(os.path.join(_td, _name), _name)
+            st.download_button("📥 zip をダウンロード", _buf.getvalue(),
+                               f"lifesim_trials_{result.key[:8]}.zip", "application/zip")
+
+    with st.expander("🧪 サンプリング方式の分散削減効果を測定"):
+        st.caption("現在の設定で各方式を 1,024 試行 × 10 回（seed を変えて）実行し、推定値のばらつきを比べます。"
+                   "分散比 2.0 は、通常の疑似乱数の約半分の試行回数で同じ精度が得られることを意味します。")
+        if st.button("測定する", key="vr_run"):
+            from lifesim.sampling import compare_sampling
+            with st.spinner("⏳ 測定中..."):
+                _rows = compare_sampling(params, trials=1024, replicates=10)
+            _stat_labels = {"survival_rate": "資産が残る確率", "ruin_rate": "破綻確率",
+                            "median_final": "最終資産（中央値）", "mean_final": "最終資産（平均）"}
+            st.dataframe(pd.DataFrame([{
+                "方式": _sampling_labels[r["mode"]], "指標": _stat_labels[r["stat"]],
+                "標準偏差": round(r["std"] / (10000 if "final" in r["stat"] else 1), 2),
+                "分散比（対 疑似乱数）": round(r["var_ratio"], 2),
+            } for r in _rows]), use_container_width=True, hide_index=True)
+
+    # ── 診断：実行（エンジン・集計）と描画の段階別所要時間 ──
+    _prof_all = Profiler()
+    if st.session_state.get("run_profile") is not None:
+        _prof_all.merge(st.session_state.run_profile, "run: ")
+    _prof_all.merge(_rprof, "render: ")
+    _prof_meta = dict(result_key=result.key, trials=result.trials,
+                      source=st.session_state.get("sim_source", ("?", 0))[0])
+    with st.expander("🩺 診断：処理時間の内訳"):
+        st.checkbox("メモリのピークも計測する（次の実行・描画から。計測中は遅くなります）", key="prof_mem")
+        st.dataframe(pd.DataFrame([{
+            "段階": r["stage"], "時間（ms）": round(r["seconds"] * 1000, 1), "回数": r["calls"],
+            "ピーク（MB）": None if r["peak_mb"] is None else round(r["peak_mb"], 1),
+        } for r in _prof_all.rows()]), use_container_width=True, hide_index=True)
+        st.caption("※ run は「▶ シミュレーション実行」時、render はこの画面を表示した直近の計測です"
+                   "（グラフはキャッシュ済みならほぼ 0 ms）。")
+        st.download_button("📥 計測結果（JSON Lines）", json.dumps(_prof_all.to_record(**_prof_meta),
+                           ensure_ascii=False) + "\n", "lifesim_profile.jsonl", "application/json")
+    # 環境変数 LIFESIM_PROFILE_LOG があれば、実行ごとに最初の描画までの計測を 1 行追記
+    _prof_log = os.getenv("LIFESIM_PROFILE_LOG")
+    if _prof_log and not st.session_state.get("profile_logged", True):
+        try:
+            _prof_all.append_jsonl(_prof_log, **_prof_meta)
+        except OSError as e:
+            st.caption(f"計測ログを書き込めませんでした: {e}")
+        st.session_state.profile_logged = True
@@ -0,0 +1,17 @@
+"""資産未来予報 Pro のシミュレーション中核。Streamlit / matplotlib / plotly に依存しない。"""
+from .cache import ResultCache, default_cache
+from .engine import ENGINE_VERSION, simulate_batch, simulate_path
+from .params import Event, SimParams
+from .simulation import SimResult, run_simulation
+
+__all__ = [
+    "ENGINE_VERSION",
+    "Event",
+    "ResultCache",
+    "SimParams",
+    "SimResult",
+    "default_cache",
+    "run_simulation",
+    "simulate_batch",
+    "simulate_path",
+]
@@ -0,0 +1,238 @@
+"""
+試行結果のストリーミング集計。エンジンのチャンク出力を順に受け取り、
+平均（累積和）・破綻年齢ヒストグラム・年齢別分位点・表示用サンプル軌跡だけを保持する。
+
+分位点は 2 方式:
+- exact : 総資産行列をチャンクごとに保持して np.percentile（従来と同じ値、メモリは試行数に比例）
+- sketch: 相対誤差 alpha の対数バケット（DDSketch 方式）。メモリは試行数に依存しない
+"""
+from __future__ import annotations
+
+import math
+from typing import Optional
+
+import numpy as np
+
+from .engine import SERIES
+
+FAN_QUANTILES = (5, 10, 25, 50, 75, 90, 95)   # ファンチャート用（%）
+EXACT_LIMIT = 20_000                          # quantiles="auto" で exact を使う試行数の上限
+SAMPLE_POOL = 200                             # 本番試行から保持するサンプル軌跡の本数
+HIGHLIGHT_QUANTILES = (10, 50, 90)            # 代表パス（最終資産の分位点に最も近い軌跡）
+
+
+class QuantileSketch:
+    """年齢ごとの対数バケット分位点スケッチ。値の相対誤差は alpha 以内。"""
+
+    def __init__(self, n_years: int, alpha: float = 0.005,
+                 min_value: float = 1.0, max_value: float = 1e13):
+        self.n_years = int(n_years)
+        self.gamma = (1.0 + alpha) / (1.0 - alpha)
+        self._log_gamma = math.log(self.gamma)
+        self.min_value = float(min_value)
+        self.n_buckets = int(math.ceil(math.log(max_value / min_value) / self._log_gamma)) + 1
+        self.pos = np.zeros((self.n_years, self.n_buckets), dtype=np.int64)
+        self.neg = np.zeros((self.n_years, self.n_buckets), dtype=np.int64)
+        self.zero = np.zeros(self.n_years, dtype=np.int64)
+        self.count = 0
+
+    def update(self, mat: np.ndarray) -> None:
+        """mat: (試行数, 年数)"""
+        n, y = mat.shape
+        a = np.abs(mat)
+        small = a < self.min_value
+        k = np.ceil(np.log(np.maximum(a, self.min_value) / self.min_value) / self._log_gamma)
+        k = np.clip(k, 0, self.n_buckets - 1).astype(np.int64)
+        flat = np.arange(y)[None, :] * self.n_buckets + k
+        size = y * self.n_buckets
+        pos = (mat > 0) & ~small
+        neg = (mat < 0) & ~small
+        self.pos += np.bincount(flat[pos], minlength=size).reshape(y, self.n_buckets)
+        self.neg += np.bincount(flat[neg], minlength=size).reshape(y, self.n_buckets)
+        self.zero += small.sum(axis=0)
+        self.count += n
+
+    def merge(self, other: "QuantileSketch") -> None:
+        self.pos += other.pos; self.neg += other.neg; self.zero += other.zero
+        self.count += other.count
+
+    def quantiles(self, qs, last_only: bool = False) -> np.ndarray:
+        """qs: パーセント値の列 → (len(qs), 年数)。last_only なら最終年のみ (len(qs), 1)"""
+        centers = self.min_value * 2.0 * self.gamma ** np.arange(self.n_buckets) / (self.gamma + 1.0)
+        values = np.concatenate([-centers[::-1], [0.0], centers])
+        rows = slice(-1, None) if last_only else slice(None)
+        counts = np.concatenate([self.neg[rows, ::-1], self.zero[rows, None], self.pos[rows]], axis=1)
+        cum = np.cumsum(counts, axis=1)
+        out = np.empty((len(qs), len(counts)))
+        last = max(self.count - 1, 0)
+        for i, q in enumerate(qs):
+            # np.percentile（linear）と同じく隣接順位の値を線形補間する
+            rank = q / 100.0 * last
+            r0 = math.floor(rank)
+            lo = values[np.argmax(cum > r0, axis=1)]
+            hi = values[np.argmax(cum > min(r0 + 1, last), axis=1)]
+            out[i] = lo + (hi - lo) * (rank - r0)
+        return out
+
+
+class _ExactQuantiles:
+    """総資産行列をそのまま保持する厳密版（従来の np.percentile と同値）。"""
+
+    def __init__(self, n_years: int):
+        self.n_years = int(n_years)
+        self._chunks: list[np.ndarray] = []
+
+    def update(self, mat: np.ndarray) -> None:
+        self._chunks.append(np.array(mat, copy=True))
+
+    def merge(self, other: "_ExactQuantiles") -> None:
+        self._chunks.extend(other._chunks)
+
+    def quantiles(self, qs, last_only: bool = False) -> np.ndarray:
+        if last_only:
+            return np.percentile(np.concatenate([c[:, -1:] for c in self._chunks]), list(qs), axis=0)
+        return np.percentile(np.concatenate(self._chunks), list(qs), axis=0)
+
+
+class PathReservoir:
+    """
+    本番試行から k 本の総資産軌跡を一様に抜き出す bottom-k サンプリング。
+    各試行に一様乱数キーを付け、キーの小さい k 本を保持する（シャード間で merge 可能）。
+    """
+
+    def __init__(self, k: int, n_years: int):
+        self.k = int(k)
+        self.keys = np.empty(0)
+        self.paths = np.empty((0, int(n_years)))
+
+    def update(self, totals: np.ndarray, keys: np.ndarray) -> None:
+        self._keep(np.concatenate([self.keys, keys]), np.concatenate([self.paths, totals]))
+
+    def merge(self, other: "PathReservoir") -> None:
+        self.update(other.paths, other.keys)
+
+    def _keep(self, keys, paths):
+        if len(keys) > self.k:
+            idx = np.argpartition(keys, self.k - 1)[:self.k]
+            keys, paths = keys[idx], paths[idx]
+        order = np.argsort(keys, kind="stable")
+        self.keys, self.paths = keys[order], np.array(paths[order])
+
+
+class Aggregator:
+    """
+    エンジン出力（simulate_batch の dict）をチャンク単位で受け取る集計器。
+    quantiles: "exact" / "sketch" / "auto"（expected_trials <= EXACT_LIMIT なら exact）
+    """
+
+    def __init__(self, years: np.ndarray, quantiles: str = "auto",
+                 expected_trials: Optional[int] = None, n_paths: int = SAMPLE_POOL):
+        self.years = np.asarray(years)
+        y = len(self.years)
+        if quantiles == "auto":
+            quantiles = "exact" if (expected_trials or 0) <= EXACT_LIMIT else "sketch"
+        self.mode = quantiles
+        self.q = _ExactQuantiles(y) if quantiles == "exact" else QuantileSketch(y)
+        self.sums = {k: np.zeros(y) for k in SERIES}
+        self.ruin_hist = np.zeros(y, dtype=np.int64)   # 初回破綻年齢ごとの試行数
+        self.paths = PathReservoir(n_paths, y)
+        self.n = 0
+        self.n_final_pos = 0
+
+    def update(self, out: dict, path_keys: Optional[np.ndarray] = None) -> None:
+        """path_keys: サンプル軌跡選択用の一様乱数（試行数ぶん）。None なら軌跡は保持しない。"""
+        for k in SERIES:
+            self.sums[k] += out[k].sum(axis=0)
+        ra = out["ruin_age"]
+        hit = np.isfinite(ra)
+        idx = (ra[hit] - self.years[0]).astype(np.int64)
+        self.ruin_hist += np.bincount(idx, minlength=len(self.years))
+        self.n_final_pos += int(np.count_nonzero(out["total"][:, -1] > 0))
+        self.q.update(out["total"])
+        if path_keys is not None and self.paths.k > 0:
+            self.paths.update(out["total"], path_keys)
+        self.n += len(ra)
+
+    def merge(self, other: "Aggregator") -> None:
+        """別シャードの部分集計を合流する（加算のみ）。合流順を固定すれば結果も固定。"""
+        for k in SERIES:
+            self.sums[k] += other.sums[k]
+        self.ruin_hist += other.ruin_hist
+        self.n += other.n
+        self.n_final_pos += other.n_final_pos
+        self.q.merge(other.q)
+        self.paths.merge(other.paths)
+
+    # ── 集計値 ──────────────────────────────────────────
+    def mean(self, key: str) -> np.ndarray:
+        return self.sums[key] / max(self.n, 1)
+
+    @property
+    def n_ruined(self) -> int:
+        return int(self.ruin_hist.sum())
+
+    def ruin_prob(self) -> np.ndarray:
+        """各年齢までに破綻した割合（%）"""
+        return np.cumsum(self.ruin_hist) / float(max(self.n, 1)) * 100
+
+    def median_ruin(self) -> Optional[int]:
+        """破綻した試行の破綻年齢の中央値（np.nanmedian と同値）"""
+        m = self.n_ruined
+        if m == 0:
+            return None
+        cum = np.cumsum(self.ruin_hist)
+        lo = self.years[np.searchsorted(cum, (m - 1) // 2, side="right")]
+        hi = self.years[np.searchsorted(cum, m // 2, side="right")]
+        return int((lo + hi) / 2)
+
+    def ruin_rate_ci(self, z: float = 1.96) -> tuple[float, float]:
+        """破綻率の Wilson 信頼区間（%）。0% / 100% 付近でも幅が潰れない。"""
+        n = max(self.n, 1)
+        ph = self.n_ruined / n
+        denom = 1.0 + z * z / n
+        center = (ph + z * z / (2 * n)) / denom
+        half = z * math.sqrt(ph * (1 - ph) / n + z * z / (4 * n * n)) / denom
+        return (max(center - half, 0.0) * 100, min(center + half, 1.0) * 100)
+
+    def final_quantile_ci(self, q: float = 50, z: float = 1.96) -> tuple[float, float]:
+        """最終資産の q% 点の信頼区間（順位統計量による分布非依存の区間）。"""
+        n = max(self.n, 1)
+        f = q / 100.0
+        d = z * math.sqrt(n * f * (1 - f))
+        lo_q = min(max((n * f - d) / n, 0.0), 1.0) * 100
+        hi_q = min(max((n * f + d) / n, 0.0), 1.0) * 100
+        lo, hi = self.q.quantiles((lo_q, hi_q), last_only=True)[:, -1]
+        return float(lo), float(hi)
+
+    def highlight_paths(self, final_values) -> np.ndarray:
+        """保持中の軌跡から、最終資産が各値に最も近いものを選ぶ → (len(final_values), 年数)"""
+        pool = self.paths.paths
+        if len(pool) == 0:
+            return np.empty((0, len(self.years)))
+        idx = [int(np.argmin(np.abs(pool[:, -1] - v))) for v in final_values]
+        return pool[idx]
+
+    def summary(self) -> dict:
+        fan = self.q.quantiles(FAN_QUANTILES)
+        final_q = self.q.quantiles((10, 50, 90), last_only=True)[:, -1]
+        hq = self.q.quantiles(HIGHLIGHT_QUANTILES, last_only=True)[:, -1]
+        return dict(
+            fan_total=fan,
+            p10_total=fan[FAN_QUANTILES.index(10)],
+            p90_total=fan[FAN_QUANTILES.index(90)],
+            avg_total=self.mean("total"),
+            avg_cash=self.mean("cash"), avg_ideco=self.mean("ideco"),
+            avg_nisa=self.mean("nisa"), avg_taxable=self.mean("taxable"),
+            avg_ic=self.mean("ic"), avg_nc=self.mean("nc"),
+            avg_iw=self.mean("iw"), avg_nw=self.mean("nw"),
+            avg_tc=self.mean("tc"), avg_tw=self.mean("tw"),
+            ruin_prob=self.ruin_prob(),
+            survival_rate=float(self.n_final_pos / max(self.n, 1) * 100),
+            ruin_rate=float(self.n_ruined / max(self.n, 1) * 100),
+            p10_final=float(final_q[0]), median_final=float(final_q[1]),
+            p90_final=float(final_q[2]),
+            median_ruin=self.median_ruin(),
+            ruin_ci=self.ruin_rate_ci(), median_ci=self.final_quantile_ci(50),
+            sample_paths_total=self.paths.paths,
+            highlight_total=self.highlight_paths(hq),
+        )
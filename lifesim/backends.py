@@ -0,0 +1,187 @@
+"""
+エンジンの実装（バックエンド）の切り替え。どれも同じ入力（params・標準正規ショック z・タイムライン）から
+同じ形の出力（SERIES の (試行数, 年数) 配列と ruin_age）を返す。
+
+- "numpy"     : simulate_batch（既定。全試行を配列でまとめて進める）
+- "reference" : simulate_path（1 試行ずつの Python ループ。遅いが最も素直な参照実装）
+- "numba"     : 試行×年の二重ループを numba で JIT コンパイルしたカーネル（numba がある場合のみ）
+
+run_simulation(..., backend="numba") のように実行ごとに選べる。速い実装を入れるときは
+python -m lifesim.harness で参照実装と突き合わせてから既定を切り替えること。
+"""
+from __future__ import annotations
+
+import functools
+from typing import Callable
+
+import numpy as np
+
+from .engine import SERIES, simulate_batch, simulate_path
+from .params import SimParams
+from .timeline import Timeline, compile_timeline
+
+BACKENDS = ("numpy", "reference", "numba")
+DEFAULT_BACKEND = "numpy"
+
+
+# ── numpy ──────────────────────────────────────────────
+def _run_numpy(p: SimParams, n: int, z: np.ndarray, tl: Timeline) -> dict:
+    return simulate_batch(p, None, n, z=z, timeline=tl)
+
+
+# ── reference ──────────────────────────────────────────
+class _ShockRng:
+    """simulate_path の rng.normal(mu, sigma) に z を順に流し込む（試行→年→口座の順）。"""
+
+    def __init__(self, z_trial: np.ndarray):
+        self._z = iter(z_trial.reshape(-1).tolist())
+
+    def normal(self, loc, scale):
+        return loc + scale * next(self._z)
+
+
+def _run_reference(p: SimParams, n: int, z: np.ndarray, tl: Timeline) -> dict:
+    paths = [simulate_path(p, _ShockRng(z[i])) for i in range(n)]
+    out = {k: np.array([r[k] for r in paths]).reshape(n, len(tl.years)) for k in SERIES}
+    out["ruin_age"] = np.array([np.nan if r["ruin_age"] is None else r["ruin_age"] for r in paths], dtype=float)
+    out["years"] = tl.years
+    return out
+
+
+# ── numba ──────────────────────────────────────────────
+def _kernel(z, mu, sig, income, living, contrib, contrib_on, withdraw_on, event_cash, init,
+            withdraw_annual, withdraw_rate, rate_mode, tax_rate, out, ruin_idx):
+    """
+    simulate_batch と同じ手順を 1 試行・1 年ずつ行う。口座の並びは (iDeCo, NISA, 特定)。
+    out: (11, 試行数, 年数) に SERIES の順で書く。ruin_idx: 初めて総資産 ≤ 0 になった年インデックス（-1 は無し）。
+    """
+    n, n_years = z.shape[0], z.shape[1]
+    for i in range(n):
+        cash, ideco, nisa, taxable, basis = init[0], init[1], init[2], init[3], init[4]
+        ruin_idx[i] = -1
+        for t in range(n_years):
+            available = cash + income[t] - living[t]
+            ic = nc = tc = 0.0
+            if contrib_on[0, t]:
+                ic = min(contrib[0, t], available) if available > 0 else 0.0
+                ideco += ic
+                available -= ic
+            if contrib_on[1, t]:
+                nc = min(contrib[1, t], available) if available > 0 else 0.0
+                nisa += nc
+                available -= nc
+            if contrib_on[2, t]:
+                tc = min(contrib[2, t], available) if available > 0 else 0.0
+                taxable += tc
+                basis += tc
+                available -= tc
+            cash = available
+
+            iw = nw = tw = 0.0
+            if withdraw_on[0, t]:
+                iw = min(withdraw_annual[0], ideco) if ideco > 0 else 0.0
+                ideco -= iw
+                cash += iw
+            if withdraw_on[1, t]:
+                nw = nisa * withdraw_rate[1] if rate_mode[1] else min(withdraw_annual[1], nisa)
+                nw = min(nw, nisa) if nisa > 0 else 0.0
+                nisa -= nw
+                cash += nw
+            if withdraw_on[2, t]:
+                pos = taxable > 0
+                safe = taxable if pos else 1.0
+                gross = taxable * withdraw_rate[2] if rate_mode[2] else min(withdraw_annual[2], taxable)
+                gross = min(gross, taxable) if pos else 0.0
+                gain_ratio = (taxable - basis) / safe
+                tax = gross * gain_ratio * tax_rate if (pos and basis < taxable) else 0.0
+                tw = gross - tax
+                cost_ratio = min(basis / safe, 1.0) if pos else 0.0
+                if pos:
+                    basis = max(basis - gross * cost_ratio, 0.0)
+                taxable -= gross
+                cash += tw
+
+            if event_cash[t] != 0.0:
+                cash += event_cash[t]
+
+            ideco = ideco * (1.0 + (mu[0] + sig[0] * z[i, t, 0]))
+            nisa = nisa * (1.0 + (mu[1] + sig[1] * z[i, t, 1]))
+            taxable = taxable * (1.0 + (mu[2] + sig[2] * z[i, t, 2]))
+
+            total = cash + ideco + nisa + taxable
+            if ruin_idx[i] < 0 and total <= 0:
+                ruin_idx[i] = t
+            out[0, i, t] = total
+            out[1, i, t] = cash
+            out[2, i, t] = ideco
+            out[3, i, t] = nisa
+            out[4, i, t] = taxable
+            out[5, i, t] = ic
+            out[6, i, t] = nc
+            out[7, i, t] = iw
+            out[8, i, t] = nw
+            out[9, i, t] = tc
+            out[10, i, t] = tw
+
+
+@functools.lru_cache(maxsize=None)
+def _numba_kernel():
+    import numba
+    return numba.njit(cache=True, fastmath=False)(_kernel)
+
+
+def _run_numba(p: SimParams, n: int, z: np.ndarray, tl: Timeline) -> dict:
+    kernel = _numba_kernel()
+    n_years = len(tl.years)
+    out = np.zeros((len(SERIES), n, n_years))
+    ruin_idx = np.empty(n, dtype=np.int64)
+    kernel(np.ascontiguousarray(z, dtype=np.float64),
+           np.array([p.ideco_return, p.nisa_return, p.tax_return]),
+           np.array([p.ideco_vol, p.nisa_vol, p.tax_vol]),
+           tl.income.astype(float), tl.living.astype(float),
+           np.stack([tl.ideco_contrib, tl.nisa_contrib, tl.taxable_contrib]).astype(float),
+           np.stack([tl.ideco_contrib_on, tl.nisa_contrib_on, tl.taxable_contrib_on]).astype(np.bool_),
+           np.stack([tl.ideco_withdraw_on, tl.nisa_withdraw_on, tl.taxable_withdraw_on]).astype(np.bool_),
+           tl.event_cash.astype(float),
+           np.array([p.initial_cash, p.initial_ideco, p.initial_nisa, p.initial_taxable, p.initial_taxable],
+                    dtype=float),
+           np.array([p.ideco_withdraw_annual, p.nisa_withdraw_annual, p.taxable_withdraw_annual], dtype=float),
+           np.array([0.0, p.nisa_withdraw_rate, p.taxable_withdraw_rate]),
+           np.array([False, p.nisa_withdraw_mode == "定率", p.taxable_withdraw_mode == "定率"]),
+           float(p.taxable_tax_rate), out, ruin_idx)
+    res = {k: out[j] for j, k in enumerate(SERIES)}
+    res["ruin_age"] = np.where(ruin_idx >= 0, tl.years[np.maximum(ruin_idx, 0)], np.nan).astype(float)
+    res["years"] = tl.years
+    return res
+
+
+_RUNNERS: dict[str, Callable] = {"numpy": _run_numpy, "reference": _run_reference, "numba": _run_numba}
+
+
+def backend_available(name: str) -> bool:
+    if name == "numba":
+        try:
+            import numba  # noqa: F401
+        except ImportError:
+            return False
+    return name in _RUNNERS
+
+
+def available_backends() -> list[str]:
+    return [b for b in BACKENDS if backend_available(b)]
+
+
+def get_backend(name: str) -> Callable:
+    """name の実行関数 (params, 試行数, z, timeline) -> 出力 dict。未知・未インストールは ValueError。"""
+    if name not in _RUNNERS:
+        raise ValueError(f"unknown engine backend: {name!r}（{', '.join(BACKENDS)}）")
+    if not backend_available(name):
+        raise ValueError(f"engine backend {name!r} is not available (pip install {name})")
+    return _RUNNERS[name]
+
+
+def simulate(p: SimParams, n_trials: int, z: np.ndarray, timeline: Timeline | None = None,
+             backend: str = DEFAULT_BACKEND) -> dict:
+    """バックエンドを選んで n_trials 試行を計算する（z は (試行数, 年数, 3) の標準正規ショック）。"""
+    tl = timeline if timeline is not None else compile_timeline(p)
+    return get_backend(backend)(p, int(n_trials), z, tl)
@@ -0,0 +1,190 @@
+"""
+乱数シナリオバンク（事前生成した標準正規ショックをディスクに置き、読み取り専用でメモリマップ）。
+
+同じ生成設定（サンプリング方式・seed・年数）なら全セッション・全プロセスで同じショックを使うので、
+実行のたびに乱数を生成し直さずに済み、メモリもページキャッシュで共有される。
+中身は make_shock_source(mode, default_rng(seed), 年数).next(試行数) そのもの（float64）なので、
+バンクの有無で結果は変わらない（先頭 n 試行を使う）。
+
+- 保存先: 環境変数 LIFESIM_BANK_DIR（未設定ならバンクは使わない）
+- 容量: LIFESIM_BANK_TRIALS（既定 20,000 試行）。これを超える実行は通常どおり生成する
+- 自動作成: LIFESIM_BANK_SEEDS に含まれる seed（既定 "42"＝画面の seed）だけ、無ければバックグラウンドの
+  スレッドで作り始める。作り終わるまでの実行は必要な試行数だけ通常どおり生成する（初回の実行が
+  バンク全体の生成を待たない）。それ以外の seed は作成済みのバンクがあれば使う
+- 事前作成: python -m lifesim.bank --dir D（既定は画面の既定どおり mc・終了 95 歳で開始 40〜70 歳の年数）。
+  --years 30-80 --modes mc,antithetic のように広げられる（1 ファイル 試行数×年数×24 バイト）
+
+並列実行（workers > 1）はシャードごとに別の乱数列を使うのでバンクの対象外。
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import threading
+from typing import Iterable, Optional
+
+import numpy as np
+
+from .sampling import N_ACCOUNTS, SAMPLING_MODES, make_shock_source, sobol_available
+
+BANK_VERSION = 1
+BANK_TRIALS = 20_000
+_BUILD_CHUNK = 2000
+DEFAULT_YEARS = "26-56"   # 画面の既定（終了 95 歳）で開始年齢 40〜70 歳。それ以外は自動作成に任せる
+DEFAULT_MODES = "mc"      # 画面の既定のサンプリング方式
+
+
+def bank_key(mode: str, seed: int, n_years: int, n_trials: int) -> str:
+    """生成設定のハッシュ（ファイル名に使う）。"""
+    blob = json.dumps({"v": BANK_VERSION, "mode": mode, "seed": int(seed), "years": int(n_years),
+                       "trials": int(n_trials), "accounts": N_ACCOUNTS, "numpy": np.__version__},
+                      sort_keys=True)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()[:24]
+
+
+class BankShocks:
+    """バンクの先頭から順に切り出す（make_shock_source の next(n) と同じ使い方）。"""
+
+    def __init__(self, arr: np.ndarray):
+        self.arr, self.pos = arr, 0
+
+    def next(self, n: int) -> np.ndarray:
+        n = int(n)
+        if self.pos + n > len(self.arr):
+            raise IndexError("scenario bank exhausted")
+        z = self.arr[self.pos:self.pos + n]
+        self.pos += n
+        return z
+
+
+class ScenarioBank:
+    """バンク置き場。開いたメモリマップはプロセス内で使い回す。"""
+
+    def __init__(self, bank_dir: str, n_trials: int = BANK_TRIALS,
+                 autobuild_seeds: Iterable[int] = (42,)):
+        self.dir = bank_dir
+        self.n_trials = int(n_trials)
+        self.autobuild_seeds = {int(s) for s in autobuild_seeds}
+        self._open: dict[str, np.ndarray] = {}
+        self._building: set[str] = set()
+        self._lock = threading.Lock()
+        os.makedirs(bank_dir, exist_ok=True)
+
+    def path(self, mode: str, seed: int, n_years: int) -> str:
+        return os.path.join(self.dir, f"{mode}-{bank_key(mode, seed, n_years, self.n_trials)}.npy")
+
+    def build(self, mode: str, seed: int, n_years: int) -> str:
+        """バンクを作る（既にあれば作り直す）。一時ファイルに書いてから置き換えるので、読み手は壊れたファイルを見ない。"""
+        path = self.path(mode, seed, n_years)
+        fd, tmp = tempfile.mkstemp(dir=self.dir, suffix=".npy.tmp")
+        os.close(fd)
+        try:
+            arr = np.lib.format.open_memmap(tmp, mode="w+", dtype=np.float64,
+                                            shape=(self.n_trials, int(n_years), N_ACCOUNTS))
+            source = make_shock_source(mode, np.random.default_rng(seed=seed), n_years)
+            for i in range(0, self.n_trials, _BUILD_CHUNK):
+                k = min(_BUILD_CHUNK, self.n_trials - i)
+                arr[i:i + k] = source.next(k)
+            arr.flush()
+            del arr
+            os.chmod(tmp, 0o644)   # mkstemp は 0600。他プロセス・他ユーザーからも読めるように
+            os.replace(tmp, path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        with self._lock:
+            self._open.pop(path, None)
+        return path
+
+    def build_async(self, mode: str, seed: int, n_years: int) -> None:
+        """バックグラウンドのスレッドで build する（同じバンクを作成中なら何もしない）。"""
+        path = self.path(mode, seed, n_years)
+        with self._lock:
+            if path in self._building:
+                return
+            self._building.add(path)
+
+        def work():
+            try:
+                self.build(mode, seed, n_years)
+            finally:
+                with self._lock:
+                    self._building.discard(path)
+
+        threading.Thread(target=work, name="lifesim-bank-build", daemon=True).start()
+
+    def get(self, mode: str, seed: int, n_years: int) -> Optional[np.ndarray]:
+        """
+        読み取り専用メモリマップ。無ければ None（自動作成対象ならバックグラウンドで作り始め、
+        できあがった後の呼び出しから返す）。
+        """
+        path = self.path(mode, seed, n_years)
+        with self._lock:
+            arr = self._open.get(path)
+        if arr is not None:
+            return arr
+        if not os.path.exists(path):
+            if int(seed) in self.autobuild_seeds:
+                self.build_async(mode, seed, n_years)
+            return None
+        arr = np.load(path, mmap_mode="r")
+        with self._lock:
+            self._open[path] = arr
+        return arr
+
+
+_default_bank: Optional[ScenarioBank] = None
+_default_lock = threading.Lock()
+
+
+def default_bank() -> Optional[ScenarioBank]:
+    """環境変数から作るプロセス共通のバンク（LIFESIM_BANK_DIR 未設定なら None）。"""
+    global _default_bank
+    bank_dir = os.getenv("LIFESIM_BANK_DIR")
+    if not bank_dir:
+        return None
+    with _default_lock:
+        if _default_bank is None or _default_bank.dir != bank_dir:
+            seeds = [int(s) for s in os.getenv("LIFESIM_BANK_SEEDS", "42").split(",") if s.strip()]
+            _default_bank = ScenarioBank(bank_dir, int(os.getenv("LIFESIM_BANK_TRIALS", BANK_TRIALS)), seeds)
+        return _default_bank
+
+
+def shock_source(mode: str, seed: int, n_years: int, n_trials: int, params=None):
+    """
+    seed から作るショック列。バンクが使えれば（容量が n_trials 以上）バンクから、
+    そうでなければ make_shock_source で生成する。どちらでも同じ値になる。
+    bootstrap は CSV 次第で中身が変わり、生成も添字の gather だけなのでバンクを使わない。
+    """
+    bank = default_bank()
+    if bank is not None and mode != "bootstrap" and int(n_trials) <= bank.n_trials:
+        arr = bank.get(mode, seed, n_years)
+        if arr is not None:
+            return BankShocks(arr)
+    return make_shock_source(mode, np.random.default_rng(seed=seed), n_years, params)
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(prog="python -m lifesim.bank", description="乱数シナリオバンクの事前作成")
+    ap.add_argument("--dir", default=os.getenv("LIFESIM_BANK_DIR"), required=not os.getenv("LIFESIM_BANK_DIR"))
+    ap.add_argument("--years", default=DEFAULT_YEARS, help="年数（終了年齢 - 開始年齢 + 1）の範囲。例: 30-80")
+    modes = [m for m in SAMPLING_MODES if m != "bootstrap" and (m != "sobol" or sobol_available())]
+    ap.add_argument("--modes", default=DEFAULT_MODES, help=f"カンマ区切り（{','.join(modes)}）")
+    ap.add_argument("--seeds", default=os.getenv("LIFESIM_BANK_SEEDS", "42"))
+    ap.add_argument("--trials", type=int, default=int(os.getenv("LIFESIM_BANK_TRIALS", BANK_TRIALS)))
+    a = ap.parse_args(argv)
+    lo, _, hi = a.years.partition("-")
+    bank = ScenarioBank(a.dir, a.trials)
+    for mode in [m for m in a.modes.split(",") if m]:
+        for seed in [int(s) for s in a.seeds.split(",") if s.strip()]:
+            for n_years in range(int(lo), int(hi or lo) + 1):
+                print(bank.build(mode, seed, n_years), file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
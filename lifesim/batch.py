@@ -0,0 +1,287 @@
+"""
+ヘッドレスの一括実行（多数の顧客プロファイルを夜間にまとめて計算する）。
+
+    python -m lifesim.batch profiles.jsonl -o out/ --workers 8 --format parquet
+
+- 入力: JSONL（1 行 1 プロファイル）または CSV（列名＝build_params() のキー、events 列は JSON 文字列）。
+  "id" キー / 列があればプロファイル ID に使い、無ければ行番号。
+- 出力: out/summary/part-*.{parquet,arrow,csv}（プロファイルごとの要約指標）と
+  out/yearly/part-*（年齢ごとの分位点・平均・破綻確率）。どちらも ID 列で結合できる。
+- 並列: プロファイル単位でプロセスに分配。投入中のプロファイル数と未書き出しの行数に上限を設け、
+  件数が多くてもメモリは一定。
+- 再開: 要約・年次の part を書き終えたら、その part に含まれる ID を out/_parts/part-*.json に
+  書く（これが part の確定。1 回の os.replace なので途中で落ちても中途半端には残らない）。
+  中断後に同じコマンドを実行すると、確定した part の ID と errors.jsonl の ID を飛ばして続きから
+  計算する。manifest の無い要約・年次の part（書き出し途中で落ちた分）は削除して計算し直す。
+- ワーカーが落ちた場合（メモリ不足など BrokenProcessPool）は、計算済みの分を書き出して中断する。
+  残りの ID は未完了のままなので、同じコマンドで再開できる。
+
+parquet / arrow 形式には pyarrow が必要（無い環境では --format csv）。
+"""
+from __future__ import annotations
+
+import argparse
+import csv
+import json
+import multiprocessing as mp
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Iterator, Optional
+
+import numpy as np
+
+from .aggregate import FAN_QUANTILES
+from .backends import BACKENDS, DEFAULT_BACKEND, get_backend
+from .params import SimParams
+from .simulation import run_simulation
+
+FORMATS = ("parquet", "arrow", "csv")
+MANIFEST_DIR = "_parts"
+ERROR_FILE = "errors.jsonl"
+
+
+def pyarrow_available() -> bool:
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+# ══════════════════════════════════════════════════════════
+#  入力
+# ══════════════════════════════════════════════════════════
+def _csv_value(v: str) -> Any:
+    """CSV セルを JSON として解釈（数値・true/false・events のリスト）。解釈できなければ文字列のまま。"""
+    if v in ("True", "False"):
+        return v == "True"
+    try:
+        return json.loads(v)
+    except ValueError:
+        return v
+
+
+def read_profiles(path: str) -> Iterator[tuple[str, dict[str, Any]]]:
+    """(id, params dict) を 1 件ずつ返す（ファイル全体は読み込まない）。"""
+    if path.lower().endswith(".csv"):
+        with open(path, newline="", encoding="utf-8-sig") as f:
+            for i, row in enumerate(csv.DictReader(f)):
+                d = {k: _csv_value(v) for k, v in row.items() if k and v not in ("", None)}
+                yield str(d.pop("id", i)), d
+        return
+    with open(path, encoding="utf-8") as f:
+        for i, line in enumerate(f):
+            if not line.strip():
+                continue
+            d = json.loads(line)
+            yield str(d.pop("id", i)), d
+
+
+# ══════════════════════════════════════════════════════════
+#  1 プロファイルの計算（ワーカープロセス側）
+# ══════════════════════════════════════════════════════════
+def _nan_if_none(x) -> float:
+    return float("nan") if x is None else float(x)
+
+
+def run_profile(pid: str, d: dict[str, Any], seed: int, trials: Optional[int],
+                backend: str = DEFAULT_BACKEND) -> dict[str, Any]:
+    """1 プロファイルを計算し、書き出し用の列（要約 1 行・年次 n 行）を返す。"""
+    p = SimParams.from_dict(d)
+    if trials:
+        p.trials = int(trials)
+    res = run_simulation(p, seed=seed, backend=backend)
+    summary = {
+        "id": pid, "key": res.key, "trials": res.trials, "converged": bool(res.converged),
+        "survival_rate": res.survival_rate, "ruin_rate": res.ruin_rate,
+        "ruin_ci_lo": res.ruin_ci[0], "ruin_ci_hi": res.ruin_ci[1],
+        "median_final": res.median_final, "p10_final": res.p10_final, "p90_final": res.p90_final,
+        "median_ci_lo": res.median_ci[0], "median_ci_hi": res.median_ci[1],
+        "median_ruin_age": _nan_if_none(res.median_ruin),
+        "ruin_thr_age": _nan_if_none(res.ruin_thr_age),
+    }
+    n = len(res.years)
+    yearly = {
+        "id": [pid] * n, "age": res.years.astype(np.int32),
+        "avg_total": res.avg_total, "avg_cash": res.avg_cash, "avg_ideco": res.avg_ideco,
+        "avg_nisa": res.avg_nisa, "avg_taxable": res.avg_taxable,
+        **{f"p{q}_total": res.fan_total[i] for i, q in enumerate(FAN_QUANTILES)},
+        "ruin_prob": res.ruin_prob,
+    }
+    return {"summary": summary, "yearly": yearly}
+
+
+# ══════════════════════════════════════════════════════════
+#  出力（part ファイル＋part ごとの ID の manifest）
+# ══════════════════════════════════════════════════════════
+def _part_no(name: str) -> int:
+    return int(name[5:10])
+
+
+class _PartWriter:
+    def __init__(self, out_dir: str, fmt: str):
+        if fmt not in FORMATS:
+            raise ValueError(f"unknown format: {fmt!r}")
+        if fmt != "csv" and not pyarrow_available():
+            raise RuntimeError(f"format={fmt!r} には pyarrow が必要です（pip install pyarrow、または --format csv）")
+        self.out_dir, self.fmt = out_dir, fmt
+        for sub in ("summary", "yearly", MANIFEST_DIR):
+            os.makedirs(os.path.join(out_dir, sub), exist_ok=True)
+        committed = {_part_no(f) for f in os.listdir(os.path.join(out_dir, MANIFEST_DIR))
+                     if f.startswith("part-") and f.endswith(".json")}
+        for sub in ("summary", "yearly"):   # manifest の無い part・書きかけの .tmp は前回の中断の残り
+            for f in os.listdir(os.path.join(out_dir, sub)):
+                if f.startswith("part-") and (f.endswith(".tmp") or _part_no(f) not in committed):
+                    os.remove(os.path.join(out_dir, sub, f))
+        self.part = max(committed, default=-1) + 1   # 再開時は続き番号から
+
+    def _write(self, sub: str, cols: dict[str, list]) -> None:
+        path = os.path.join(self.out_dir, sub, f"part-{self.part:05d}.{self.fmt}")
+        tmp = path + ".tmp"
+        if self.fmt == "csv":
+            with open(tmp, "w", newline="", encoding="utf-8") as f:
+                w = csv.writer(f)
+                w.writerow(cols)
+                w.writerows(zip(*cols.values()))
+        else:
+            import pyarrow as pa
+            table = pa.table({k: pa.array(v) for k, v in cols.items()})
+            if self.fmt == "parquet":
+                import pyarrow.parquet as pq
+                pq.write_table(table, tmp)
+            else:
+                import pyarrow.feather as feather
+                feather.write_feather(table, tmp)
+        os.replace(tmp, path)
+
+    def _commit(self, ids: list[str]) -> None:
+        path = os.path.join(self.out_dir, MANIFEST_DIR, f"part-{self.part:05d}.json")
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(ids, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+    def flush(self, rows: list[dict[str, Any]]) -> None:
+        """要約・年次の part を書き、最後に manifest で確定する（途中で落ちた part は再開時に消える）。"""
+        if not rows:
+            return
+        summary = {k: [r["summary"][k] for r in rows] for k in rows[0]["summary"]}
+        yearly = {k: np.concatenate([r["yearly"][k] for r in rows])
+                  for k in rows[0]["yearly"] if k != "id"}
+        yearly = {"id": [pid for r in rows for pid in r["yearly"]["id"]], **yearly}
+        self._write("summary", summary)
+        self._write("yearly", yearly)
+        self._commit([r["summary"]["id"] for r in rows])
+        self.part += 1
+
+
+def load_done(out_dir: str) -> set[str]:
+    """確定した part の ID ＋ errors.jsonl に記録した（再試行しない）ID。"""
+    done: set[str] = set()
+    mdir = os.path.join(out_dir, MANIFEST_DIR)
+    if os.path.isdir(mdir):
+        for f in os.listdir(mdir):
+            if f.startswith("part-") and f.endswith(".json"):
+                with open(os.path.join(mdir, f), encoding="utf-8") as fh:
+                    done.update(json.load(fh))
+    path = os.path.join(out_dir, ERROR_FILE)
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    done.add(json.loads(line)["id"])
+                except ValueError:   # 追記途中で落ちた行（そのプロファイルは再試行する）
+                    pass
+    return done
+
+
+# ══════════════════════════════════════════════════════════
+#  実行
+# ══════════════════════════════════════════════════════════
+def run_batch(in_path: str, out_dir: str, *, workers: Optional[int] = None, fmt: str = "parquet",
+              seed: int = 42, trials: Optional[int] = None, flush_every: int = 200,
+              backend: str = DEFAULT_BACKEND, log=print) -> dict[str, int]:
+    """
+    プロファイルを並列に計算して out_dir に書き出す。確定済み・エラー記録済みの ID は飛ばす。
+    投入中は最大 2×workers 件、未書き出しは最大 flush_every 件。
+    ワーカーが落ちたら計算済みの分を書き出してから BrokenProcessPool を送出する。
+    """
+    workers = max(1, int(workers or os.cpu_count() or 1))
+    get_backend(backend)   # 未知・未インストールなら投入前に ValueError
+    writer = _PartWriter(out_dir, fmt)
+    done = load_done(out_dir)
+    stats = {"done": 0, "skipped": 0, "failed": 0}
+    buf: list[dict[str, Any]] = []
+    t0 = time.perf_counter()
+
+    def collect(futs):
+        for fut in futs:
+            pid = pending.pop(fut)
+            try:
+                buf.append(fut.result())
+                stats["done"] += 1
+            except BrokenProcessPool:   # プロファイルの問題ではないので記録しない（再開時に再試行）
+                raise
+            except Exception as e:   # 不正なプロファイルは記録して続行（再開時にも再試行しない）
+                stats["failed"] += 1
+                with open(os.path.join(out_dir, ERROR_FILE), "a", encoding="utf-8") as f:
+                    f.write(json.dumps({"id": pid, "error": f"{type(e).__name__}: {e}"},
+                                       ensure_ascii=False) + "\n")
+                    f.flush()
+                    os.fsync(f.fileno())
+        if len(buf) >= flush_every:
+            writer.flush(buf)
+            buf.clear()
+            rate = stats["done"] / max(time.perf_counter() - t0, 1e-9)
+            log(f"{stats['done']:,} done, {stats['failed']:,} failed, {stats['skipped']:,} skipped "
+                f"({rate:,.1f} profiles/s)")
+
+    pending: dict = {}
+    try:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context("spawn")) as pool:
+            for pid, d in read_profiles(in_path):
+                if pid in done:
+                    stats["skipped"] += 1
+                    continue
+                if len(pending) >= 2 * workers:
+                    finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    collect(finished)
+                pending[pool.submit(run_profile, pid, d, seed, trials, backend)] = pid
+            collect(list(pending))
+    except BrokenProcessPool:
+        writer.flush(buf)
+        log(f"worker process died after {stats['done']:,} done; rerun the same command to resume")
+        raise
+    writer.flush(buf)
+    log(f"finished: {stats['done']:,} done, {stats['failed']:,} failed, {stats['skipped']:,} skipped "
+        f"in {time.perf_counter() - t0:,.1f} s")
+    return stats
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(prog="python -m lifesim.batch", description="プロファイル一括シミュレーション")
+    ap.add_argument("profiles", help="JSONL または CSV（列名は build_params() のキー）")
+    ap.add_argument("-o", "--out", required=True, help="出力ディレクトリ（再開時も同じものを指定）")
+    ap.add_argument("--workers", type=int, default=None, help="並列プロセス数（既定: CPU 数）")
+    ap.add_argument("--format", choices=FORMATS, default="parquet")
+    ap.add_argument("--seed", type=int, default=42, help="全プロファイル共通の乱数 seed（画面と同じ既定値）")
+    ap.add_argument("--trials", type=int, default=None, help="試行回数を一律に上書き")
+    ap.add_argument("--flush-every", type=int, default=200, help="part ファイル 1 つあたりのプロファイル数")
+    ap.add_argument("--backend", choices=BACKENDS, default=DEFAULT_BACKEND, help="エンジンの実装（lifesim.backends）")
+    a = ap.parse_args(argv)
+    try:
+        stats = run_batch(a.profiles, a.out, workers=a.workers, fmt=a.format, seed=a.seed,
+                          trials=a.trials, flush_every=a.flush_every, backend=a.backend,
+                          log=lambda m: print(m, file=sys.stderr))
+    except BrokenProcessPool:
+        return 2
+    return 1 if stats["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,143 @@
+"""
+ヒストリカル・リターンのブロック・ブートストラップ（sampling="bootstrap"）。
+
+ローカル CSV の年次 / 月次リターン（小数。0.05 = 5%）から、連続した block 期間を丸ごと
+ランダムに選んでつなぐ（循環ブロック・ブートストラップ）。暴落の連続や裾の厚さがそのまま残る。
+全口座で同じ時点の行を使うので、口座間の相関も保たれる。
+
+- CSV: 1 行目が列名。数値でない列と日付の列（列名が Year / Date / 年 など、または値がすべて
+  西暦年の整数）は無視し、残りの数値列をリターン系列として読む
+- 口座との対応: bootstrap_map="ideco=SP500,nisa=ACWI,taxable=TOPIX"（3 口座とも必須。省略は ValueError）
+- 月次データは bootstrap_freq="monthly"。月単位でブロックを選び、12 か月を複利でまとめて年次にする
+- bootstrap_raw=False（既定）: 各系列を平均 0・標準偏差 1 に基準化して返し、エンジンの
+  mu + sigma * z で各口座の期待リターン・変動率に合わせる（分布の形と相関だけ履歴から取る）
+- bootstrap_raw=True: 履歴のリターンをそのまま使う（z = (r - mu) / sigma を返す）。
+  変動率 0 の口座には履歴を渡せないので ValueError
+
+サンプリングは (試行, ブロック) の開始位置を一度に引き、添字配列で一括 gather する。
+"""
+from __future__ import annotations
+
+import csv
+import hashlib
+import os
+import threading
+
+import numpy as np
+
+ACCOUNTS = ("ideco", "nisa", "taxable")
+# 日付として読み飛ばす列名（小文字・前後空白なしで比較）
+DATE_COLUMNS = frozenset({"year", "years", "date", "month", "period", "fy", "年", "年度", "年月", "日付", "期間"})
+_YEAR_RANGE = (1800, 2200)
+
+_cache: dict[tuple, tuple[list[str], np.ndarray]] = {}
+_cache_lock = threading.Lock()
+
+
+def load_returns(path: str) -> tuple[list[str], np.ndarray]:
+    """(系列名, (期間数, 系列数) の配列)。ファイルの更新時刻ごとにプロセス内でキャッシュ。"""
+    st = os.stat(path)
+    key = (os.path.abspath(path), st.st_mtime_ns, st.st_size)
+    with _cache_lock:
+        if key in _cache:
+            return _cache[key]
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        rows = list(csv.reader(f))
+    if len(rows) < 2:
+        raise ValueError(f"{path}: リターンの行がありません")
+    header, body = rows[0], rows[1:]
+
+    def num(v):
+        try:
+            return float(v)
+        except ValueError:
+            return None
+
+    cells = lambda j: [r[j] for r in body if j < len(r) and r[j].strip()]
+    def is_date(j):
+        if header[j].strip().lower() in DATE_COLUMNS:
+            return True
+        v = [num(x) for x in cells(j)]
+        return all(x == int(x) and _YEAR_RANGE[0] <= x <= _YEAR_RANGE[1] for x in v)
+
+    cols = [j for j in range(len(header))
+            if cells(j) and all(num(v) is not None for v in cells(j)) and not is_date(j)]
+    if not cols:
+        raise ValueError(f"{path}: 数値の列がありません")
+    names = [header[j].strip() for j in cols]
+    data = np.array([[num(r[j]) if j < len(r) and r[j].strip() else np.nan for j in cols] for r in body])
+    data = data[~np.isnan(data).any(axis=1)]   # 全系列がそろう期間だけ使う（同時点の相関を保つ）
+    with _cache_lock:
+        _cache[key] = (names, data)
+    return names, data
+
+
+def returns_digest(path: str) -> str:
+    """CSV の内容のハッシュ（結果キャッシュのキーに含める）。"""
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()[:16]
+
+
+def parse_map(spec: str, names: list[str]) -> list[int]:
+    """"ideco=A,nisa=B,taxable=C" → 口座順 (iDeCo, NISA, 特定) の系列インデックス。全口座の指定が必要。"""
+    idx: dict[str, int] = {}
+    for part in filter(None, (s.strip() for s in (spec or "").split(","))):
+        acct, _, col = part.partition("=")
+        acct, col = acct.strip(), col.strip()
+        if acct not in ACCOUNTS:
+            raise ValueError(f"unknown account in bootstrap_map: {acct!r}（{', '.join(ACCOUNTS)}）")
+        if col not in names:
+            raise ValueError(f"unknown series in bootstrap_map: {col!r}（{', '.join(names)}）")
+        idx[acct] = names.index(col)
+    missing = [a for a in ACCOUNTS if a not in idx]
+    if missing:
+        raise ValueError(f"bootstrap_map has no series for {', '.join(missing)}"
+                         f"（例: {','.join(f'{a}={names[0]}' for a in ACCOUNTS)}）")
+    return [idx[a] for a in ACCOUNTS]
+
+
+class BlockBootstrapShocks:
+    """next(n) で (n, 年数, 3) を返す（make_shock_source の他の方式と同じ形）。"""
+
+    def __init__(self, rng, n_years: int, params):
+        p = params
+        names, data = load_returns(p.returns_csv)
+        r = data[:, parse_map(p.bootstrap_map, names)]          # (期間数, 3)
+        self.monthly = p.bootstrap_freq == "monthly"
+        self.per_year = 12 if self.monthly else 1
+        self.block = max(1, int(p.bootstrap_block)) * self.per_year
+        self.rng, self.n_years = rng, int(n_years)
+        self.hist = r
+        if len(r) < self.block:
+            raise ValueError(f"{p.returns_csv}: 期間数 {len(r)} がブロック長 {self.block} より短い")
+        self.raw = bool(p.bootstrap_raw)
+        self.mu = np.array([p.ideco_return, p.nisa_return, p.tax_return])
+        self.sig = np.array([p.ideco_vol, p.nisa_vol, p.tax_vol])
+        if self.raw and (self.sig <= 0).any():
+            zero = [a for a, v in zip(ACCOUNTS, self.sig) if v <= 0]
+            raise ValueError(f"bootstrap_raw needs a positive volatility for {', '.join(zero)}"
+                             "（変動率 0 では mu + sigma * z で履歴のリターンを再現できない）")
+        if not self.raw:
+            ann = self._annualize(r[None])[0] if self.monthly else r
+            self.center, self.scale = ann.mean(axis=0), ann.std(axis=0)
+            self.scale[self.scale == 0] = 1.0
+
+    def _annualize(self, r: np.ndarray) -> np.ndarray:
+        """(…, 月数, 3) → (…, 年数, 3)。12 か月ずつ複利でまとめる（端数の月は捨てる）。"""
+        m = r.shape[-2] // 12 * 12
+        r = r[..., :m, :].reshape(*r.shape[:-2], m // 12, 12, r.shape[-1])
+        return np.prod(1.0 + r, axis=-2) - 1.0
+
+    def next(self, n: int) -> np.ndarray:
+        n = int(n)
+        T, b = len(self.hist), self.block
+        length = self.n_years * self.per_year
+        n_blocks = -(-length // b)
+        starts = self.rng.integers(0, T, size=(n, n_blocks))
+        idx = ((starts[:, :, None] + np.arange(b)) % T).reshape(n, n_blocks * b)[:, :length]
+        r = self.hist[idx]                                       # (n, length, 3) の一括 gather
+        if self.monthly:
+            r = self._annualize(r)
+        if self.raw:
+            return (r - self.mu) / self.sig
+        return (r - self.center) / self.scale
@@ -0,0 +1,159 @@
+"""
+結果キャッシュ。キーは正規化 params＋seed＋エンジン版のハッシュ（SimResult.key と同じ）。
+分析専用の項目（しきい値など）はキーに含まないので、取り出した結果は analyze で params に合わせる。
+
+- メモリ層: プロセス内で共有する件数上限つき LRU（全セッション共通）
+- ディスク層（任意）: npz ファイル。合計サイズ上限を超えたら古い順に削除
+"""
+from __future__ import annotations
+
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+import numpy as np
+
+from .simulation import SimResult, analyze, result_key, run_simulation
+
+
+class ResultCache:
+    """SimResult のメモリ LRU ＋ 任意のディスク層。スレッドセーフ。"""
+
+    def __init__(self, max_items: int = 64, disk_dir: Optional[str] = None,
+                 disk_max_bytes: int = 512 * 1024 * 1024):
+        self.max_items = int(max_items)
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = int(disk_max_bytes)
+        self._mem: "OrderedDict[str, SimResult]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits_memory = 0
+        self.hits_disk = 0
+        self.misses = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    # ── 参照・登録 ──────────────────────────────────────
+    def get(self, key: str) -> tuple[Optional[SimResult], str]:
+        """(結果, 取得元) を返す。取得元は "memory" / "disk" / "miss"。"""
+        with self._lock:
+            if key in self._mem:
+                self._mem.move_to_end(key)
+                self.hits_memory += 1
+                return self._mem[key], "memory"
+        res = self._disk_get(key)
+        with self._lock:
+            if res is None:
+                self.misses += 1
+                return None, "miss"
+            self.hits_disk += 1
+            self._mem_put(key, res)
+        return res, "disk"
+
+    def put(self, key: str, result: SimResult) -> None:
+        with self._lock:
+            self._mem_put(key, result)
+        self._disk_put(key, result)
+
+    def get_or_run(self, params, **kw) -> tuple[SimResult, str]:
+        """キャッシュを引き、無ければ run_simulation(params, **kw) して登録する。"""
+        key = result_key(params, **kw)
+        res, source = self.get(key)
+        if res is None:
+            res = run_simulation(params, **kw)
+            self.put(key, res)
+        else:
+            res = analyze(res, params)
+        return res, source
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return dict(hits_memory=self.hits_memory, hits_disk=self.hits_disk,
+                        misses=self.misses, items=len(self._mem),
+                        disk_bytes=self._disk_usage()[0])
+
+    def clear(self) -> None:
+        with self._lock:
+            self._mem.clear()
+
+    # ── 内部 ──────────────────────────────────────────────
+    def _mem_put(self, key, result):
+        self._mem[key] = result
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.max_items:
+            self._mem.popitem(last=False)
+
+    def _path(self, key):
+        return os.path.join(self.disk_dir, f"{key}.npz")
+
+    def _disk_get(self, key):
+        if not self.disk_dir:
+            return None
+        path = self._path(key)
+        try:
+            with np.load(path, allow_pickle=False) as z:
+                res = SimResult.from_arrays(z)
+            os.utime(path)   # LRU 用に最終利用時刻を更新
+            return res
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _disk_put(self, key, result):
+        if not self.disk_dir:
+            return
+        fd, tmp = tempfile.mkstemp(dir=self.disk_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez_compressed(f, **result.to_arrays())
+            os.replace(tmp, self._path(key))
+        except OSError:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            return
+        self._disk_evict()
+
+    def _disk_usage(self):
+        if not self.disk_dir:
+            return 0, []
+        entries = []
+        for name in os.listdir(self.disk_dir):
+            if name.endswith(".npz"):
+                try:
+                    st = os.stat(os.path.join(self.disk_dir, name))
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, name))
+        return sum(e[1] for e in entries), sorted(entries)
+
+    def _disk_evict(self):
+        used, entries = self._disk_usage()
+        for _, size, name in entries:
+            if used <= self.disk_max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.disk_dir, name))
+                used -= size
+            except OSError:
+                pass
+
+
+_default_cache: Optional[ResultCache] = None
+_default_lock = threading.Lock()
+
+
+def default_cache() -> ResultCache:
+    """
+    プロセス共通のキャッシュ。環境変数で設定する:
+    LIFESIM_CACHE_ITEMS（メモリ件数, 既定 64）, LIFESIM_CACHE_DIR（ディスク層, 未設定なら無効）,
+    LIFESIM_CACHE_DISK_MB（ディスク上限, 既定 512）。
+    """
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = ResultCache(
+                max_items=int(os.getenv("LIFESIM_CACHE_ITEMS", "64")),
+                disk_dir=os.getenv("LIFESIM_CACHE_DIR") or None,
+                disk_max_bytes=int(os.getenv("LIFESIM_CACHE_DISK_MB", "512")) * 1024 * 1024,
+            )
+        return _default_cache
@@ -0,0 +1,251 @@
+"""
+結果グラフの描画（matplotlib 静的画像 / Plotly 図の JSON）。
+
+SimResult だけから描くので、同じ結果（result.view_key）なら出力も同じ。UI 側で結果ごとにキャッシュし、
+再実行（rerun）のたびに描き直さない。matplotlib・plotly は呼び出し時に読み込む。
+"""
+from __future__ import annotations
+
+import io
+
+import numpy as np
+
+from .aggregate import FAN_QUANTILES, HIGHLIGHT_QUANTILES
+from .simulation import SimResult
+
+HIGHLIGHT_COLORS = ((10, "#c0392b"), (50, "#34495e"), (90, "#2e86c1"))
+
+
+def _man(x):
+    return np.asarray(x, dtype=float) / 10000.0
+
+
+def build_static_figure(result: SimResult, show_hl: bool = True):
+    """資産推移 + 破綻確率の 2 段グラフ（全テキスト ASCII：文字化け回避）。"""
+    from matplotlib.collections import LineCollection
+    from matplotlib.figure import Figure
+
+    years = result.years
+    avg_total, p10_total, p90_total = result.avg_total, result.p10_total, result.p90_total
+    ruin_prob, threshold, ruin_thr_age = result.ruin_prob, result.threshold, result.ruin_thr_age
+
+    # pyplot を経由しない Figure はグローバル状態を持たず、close も不要
+    fig = Figure(figsize=(18, 10))
+    gs  = fig.add_gridspec(2, 1, height_ratios=[3.0, 1.2], hspace=0.28)
+    ax  = fig.add_subplot(gs[0])
+    ax2 = fig.add_subplot(gs[1])
+
+    paths = result.sample_paths_total[:result.sp_n]
+    if result.show_sp and len(paths) > 0:
+        # サンプル軌跡は 1 つの LineCollection（数百本でも artist 1 個）
+        segs = np.stack([np.broadcast_to(years, paths.shape), _man(paths)], axis=-1)
+        ax.add_collection(LineCollection(segs, colors="#8899bb", alpha=0.06, linewidths=0.8))
+
+    fan = dict(zip(FAN_QUANTILES, result.fan_total))
+    ax.fill_between(years, _man(fan[5]), _man(fan[95]),
+                    alpha=0.08, color="#4c72b0", label="Total Assets (5-95%)")
+    ax.fill_between(years, _man(p10_total), _man(p90_total),
+                    alpha=0.20, color="#4c72b0", label="Total Assets (10-90%)")
+    ax.plot(years, _man(avg_total),  lw=3.0, ls="-",               color="#1a6aff", label="Total (avg)")
+    if show_hl:
+        highlight = dict(zip(HIGHLIGHT_QUANTILES, result.highlight_total))
+        for q, c in HIGHLIGHT_COLORS:
+            if q in highlight:
+                ax.plot(years, _man(highlight[q]), lw=1.6, ls="-", alpha=0.85,
+                        color=c, label=f"Path P{q} (final)")
+    ax.plot(years, _man(result.avg_cash),   lw=2.0, ls="--",              color="#e67e22", label="Cash (avg)")
+    ax.plot(years, _man(result.avg_ideco),  lw=2.0, ls="-.",              color="#27ae60", label="iDeCo (avg)")
+    ax.plot(years, _man(result.avg_nisa),   lw=2.0, ls=":",               color="#8e44ad", label="NISA (avg)")
+    ax.plot(years, _man(result.avg_taxable),lw=2.0, ls=(0,(3,1,1,1,1,1)),color="#16a085", label="Taxable (avg)")
+    ax.axhline(0, lw=1.4, ls="--", alpha=0.5, color="red")
+
+    y_max   = float(_man(np.max(p90_total)))
+    y_min   = float(_man(np.min(p10_total)))
+    y_range = max(abs(y_max - y_min), 1.0)
+    age_idx = {int(a): i for i, a in enumerate(years)}
+    plotted_ages = []
+    for ke in sorted(result.key_events, key=lambda x: x["age"]):
+        age = ke["age"]
+        if age not in age_idx: continue
+        y_val = float(_man(avg_total[age_idx[age]]))
+        n_near = sum(1 for a in plotted_ages if abs(a - age) < 4)
+        y_off  = y_range * (0.14 + n_near * 0.11)
+        plotted_ages.append(age)
+        ax.annotate(ke["elabel"],
+                    xy=(age, y_val), xytext=(age, y_val + y_off),
+                    fontsize=9, color=ke["color"], fontweight="bold", ha="center",
+                    arrowprops=dict(arrowstyle="->", color=ke["color"], lw=1.2),
+                    bbox=dict(boxstyle="round,pad=0.3", facecolor="white",
+                              edgecolor=ke["color"], alpha=0.88))
+
+    ax.set_title("Asset Future Forecast Pro - Monte Carlo", fontsize=15, fontweight="bold", pad=12)
+    ax.set_xlabel("Age", fontsize=13)
+    ax.set_ylabel("Assets (10,000 JPY)", fontsize=13)
+    ax.grid(True, alpha=0.22)
+    ax.legend(ncols=2, fontsize=11, loc="upper right")
+    ax.tick_params(labelsize=12)
+    ax.autoscale_view()
+
+    ax2.plot(years, ruin_prob, lw=2.5, color="#c0392b", label="Ruin Probability")
+    ax2.axhline(threshold, ls="--", lw=1.5, alpha=0.8, color="#8e44ad", label=f"Threshold {threshold}%")
+    ax2.fill_between(years, 0, 100, where=ruin_prob >= threshold, alpha=0.10, color="#c0392b")
+    if ruin_thr_age is not None:
+        ax2.axvline(ruin_thr_age, ls="--", lw=2.0, alpha=0.7, color="#8e44ad")
+        ax2.text(ruin_thr_age + 0.3, 88, f"Ruin>{threshold}% at age {ruin_thr_age}",
+                 fontsize=10, color="#8e44ad", fontweight="bold")
+    ax2.set_xlabel("Age", fontsize=12)
+    ax2.set_ylabel("Ruin Prob. (%)", fontsize=12)
+    ax2.set_ylim(0, 100)
+    ax2.grid(True, alpha=0.22)
+    ax2.legend(fontsize=11, loc="upper left")
+    ax2.tick_params(labelsize=11)
+    return fig
+
+
+def render_static(result: SimResult, show_hl: bool = True, fmt: str = "png", dpi: int = 100) -> bytes:
+    """静的グラフを PNG / SVG のバイト列にする。"""
+    if fmt not in ("png", "svg"):
+        raise ValueError(f"unsupported image format: {fmt!r}")
+    buf = io.BytesIO()
+    build_static_figure(result, show_hl).savefig(buf, format=fmt, dpi=dpi, bbox_inches="tight")
+    return buf.getvalue()
+
+
+# ══════════════════════════════════════════════════════════
+#  インタラクティブグラフ（Plotly）
+# ══════════════════════════════════════════════════════════
+PLOTLY_MAX_POINTS = 20_000      # サンプル軌跡トレースの点数上限（超えたら年方向に間引く）
+
+
+def _r(x, nd=1):
+    """ブラウザへ送る値の桁数を落とす（JSON が短くなる）。"""
+    return np.round(np.asarray(x, dtype=float), nd)
+
+
+def merged_paths(years, paths, max_points: int = PLOTLY_MAX_POINTS):
+    """
+    複数の軌跡を NaN 区切りの 1 本の (x, y) にまとめる。点数が max_points を超える場合は
+    年方向に間引く（最終年は必ず残す）。
+    """
+    paths = np.asarray(paths, dtype=float)
+    n, m = paths.shape
+    step = max(1, int(np.ceil(n * m / max_points)))
+    idx = np.arange(0, m, step)
+    if idx[-1] != m - 1:
+        idx = np.append(idx, m - 1)
+    k = len(idx)
+    x = np.full((n, k + 1), np.nan)
+    y = np.full((n, k + 1), np.nan)
+    x[:, :k] = np.asarray(years, dtype=float)[idx]
+    y[:, :k] = paths[:, idx]
+    return x.ravel(), y.ravel()
+
+
+def build_interactive_figure(result: SimResult, show_hl: bool = True, *, webgl: bool = False,
+                             max_points: int = PLOTLY_MAX_POINTS):
+    """資産推移（平均）+ 破綻確率の Plotly 図。webgl=True で折れ線を Scattergl にする。"""
+    import plotly.graph_objects as go
+    from plotly.subplots import make_subplots
+
+    Line = go.Scattergl if webgl else go.Scatter
+    years = result.years
+    ruin_prob = result.ruin_prob
+    avg_invest = result.avg_ideco + result.avg_nisa + result.avg_taxable
+    customdata_main = np.column_stack([
+        _r(_man(result.avg_cash), 0),
+        _r(_man(avg_invest), 0),
+        _r(ruin_prob, 1),
+    ])
+    ht_main = (
+        "<b>年齢: %{x}歳</b><br>"
+        "総資産: %{y:,.0f} 万円<br>"
+        "現金残高: %{customdata[0]:,.0f} 万円<br>"
+        "総投資資産: %{customdata[1]:,.0f} 万円<br>"
+        "破綻確率: %{customdata[2]:.1f}%<br>"
+        "<extra></extra>"
+    )
+    fig = make_subplots(
+        rows=2, cols=1,
+        row_heights=[0.68, 0.32],
+        shared_xaxes=True,
+        vertical_spacing=0.06,
+        subplot_titles=("資産推移（平均）", "破綻確率（%）"),
+    )
+    # サンプル軌跡（NaN 区切りの 1 トレース）
+    paths = result.sample_paths_total[:result.sp_n]
+    if result.show_sp and len(paths) > 0:
+        sx, sy = merged_paths(years, _r(_man(paths)), max_points)
+        fig.add_trace(Line(
+            x=sx, y=sy, mode="lines", connectgaps=False,
+            line=dict(color="rgba(136,153,187,0.25)", width=0.8),
+            name="サンプル軌跡", hoverinfo="skip",
+        ), row=1, col=1)
+    # P10-P90 帯（塗りつぶしは SVG の Scatter のまま）
+    fig.add_trace(go.Scatter(
+        x=np.concatenate([years, years[::-1]]),
+        y=np.concatenate([_r(_man(result.p90_total)), _r(_man(result.p10_total))[::-1]]),
+        fill="toself", fillcolor="rgba(76,114,176,0.15)",
+        line=dict(color="rgba(0,0,0,0)"),
+        name="総資産 10-90%帯", hoverinfo="skip",
+    ), row=1, col=1)
+    # 代表パス
+    if show_hl:
+        highlight = dict(zip(HIGHLIGHT_QUANTILES, result.highlight_total))
+        for q, c in HIGHLIGHT_COLORS:
+            if q in highlight:
+                fig.add_trace(Line(
+                    x=years, y=_r(_man(highlight[q])),
+                    name=f"代表パス（最終資産 {q}%）",
+                    line=dict(color=c, width=1.5),
+                    hoverinfo="skip",
+                ), row=1, col=1)
+    # 総資産（平均）- メイントレース（ツールチップ付き）
+    fig.add_trace(Line(
+        x=years, y=_r(_man(result.avg_total)),
+        name="総資産（平均）",
+        line=dict(color="#1a6aff", width=3),
+        customdata=customdata_main,
+        hovertemplate=ht_main,
+    ), row=1, col=1)
+    # 現金
+    fig.add_trace(Line(
+        x=years, y=_r(_man(result.avg_cash)),
+        name="現金（平均）",
+        line=dict(color="#e67e22", width=2, dash="dash"),
+        hoverinfo="skip",
+    ), row=1, col=1)
+    # 総投資資産
+    fig.add_trace(Line(
+        x=years, y=_r(_man(avg_invest)),
+        name="総投資資産（iDeCo+NISA+特定）",
+        line=dict(color="#27ae60", width=2, dash="dot"),
+        hoverinfo="skip",
+    ), row=1, col=1)
+    # 破綻確率
+    fig.add_trace(go.Scatter(
+        x=years, y=_r(ruin_prob),
+        name="破綻確率",
+        line=dict(color="#c0392b", width=2),
+        fill="tozeroy", fillcolor="rgba(192,57,43,0.08)",
+        hovertemplate="年齢: %{x}歳<br>破綻確率: %{y:.1f}%<extra></extra>",
+    ), row=2, col=1)
+    # しきい値ライン
+    fig.add_hline(y=result.threshold, line_dash="dash", line_color="#8e44ad",
+                  annotation_text=f"しきい値 {result.threshold}%",
+                  annotation_position="top left", row=2, col=1)
+    fig.update_layout(
+        height=580,
+        hovermode="x unified",
+        legend=dict(orientation="h", y=1.02, x=0),
+        margin=dict(t=60, b=40),
+    )
+    fig.update_xaxes(title_text="年齢（歳）", row=2, col=1)
+    fig.update_yaxes(title_text="資産（万円）", row=1, col=1)
+    fig.update_yaxes(title_text="破綻確率（%）", range=[0, 100], row=2, col=1)
+    return fig
+
+
+def interactive_figure_json(result: SimResult, show_hl: bool = True, *, webgl: bool = False,
+                            max_points: int = PLOTLY_MAX_POINTS) -> str:
+    """ブラウザへ送る図の JSON（結果ごとにキャッシュする単位）。"""
+    return build_interactive_figure(result, show_hl, webgl=webgl, max_points=max_points).to_json()
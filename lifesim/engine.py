@@ -0,0 +1,226 @@
+"""モンテカルロ エンジン本体（1 試行ループ版と一括版）。"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+
+import numpy as np
+
+from .params import SimParams
+from .timeline import Timeline, compile_timeline, growth_rates
+
+ENGINE_VERSION = "4"   # 計算結果が変わる変更をしたら上げる（キャッシュ無効化）
+
+SERIES = ("total", "cash", "ideco", "nisa", "taxable", "ic", "nc", "iw", "nw", "tc", "tw")
+
+
+def simulate_path(p: SimParams, rng):
+    """1 試行分を年ごとの Python ループで計算する参照実装。"""
+    years = np.arange(p.start_age, p.end_age + 1)
+    cash    = p.initial_cash
+    ideco   = p.initial_ideco
+    nisa    = p.initial_nisa
+    taxable = p.initial_taxable
+    taxable_cost_basis = p.initial_taxable
+    total_h=[]; cash_h=[]; ideco_h=[]; nisa_h=[]; taxable_h=[]
+    ic_h=[]; nc_h=[]; iw_h=[]; nw_h=[]; tc_h=[]; tw_h=[]
+    ruined=False; ruin_age=None
+    infl, salary_growth, pension_growth = growth_rates(p)
+
+    for age in years:
+        inf_f = (1.0 + infl) ** int(age - p.start_age)
+        years_elapsed = int(age - p.start_age)
+        income = 0.0
+        if age < p.retire_age:
+            income += p.salary_net * (1.0 + salary_growth) ** years_elapsed
+        if age >= p.pension_start_age:
+            income += p.pension_annual * (1.0 + pension_growth) ** years_elapsed
+
+        base_lv   = p.living_before if age < p.retire_age else p.living_after
+        available = cash + income - base_lv * inf_f
+
+        ic = nc = 0.0
+        if p.ideco_on and p.ideco_contrib_start <= age <= p.ideco_contrib_end and available > 0:
+            ic = min(p.ideco_contrib_monthly * 12, available); ideco += ic; available -= ic
+        if p.nisa_on and p.nisa_contrib_start <= age <= p.nisa_contrib_end and available > 0:
+            nc = min(p.nisa_contrib_monthly * 12, available); nisa += nc; available -= nc
+
+        tc = 0.0
+        if p.taxable_on and p.taxable_contrib_start <= age <= p.taxable_contrib_end and available > 0:
+            tc = min(p.taxable_contrib_monthly * 12, available); taxable += tc; taxable_cost_basis += tc; available -= tc
+
+        cash = available
+
+        iw = nw = tw = 0.0
+        if p.ideco_on and age >= p.ideco_withdraw_start and ideco > 0:
+            iw = min(p.ideco_withdraw_annual, ideco); ideco -= iw; cash += iw
+        if p.nisa_on and age >= p.nisa_withdraw_start and nisa > 0:
+            nw = (nisa * p.nisa_withdraw_rate if p.nisa_withdraw_mode == "定率"
+                  else min(p.nisa_withdraw_annual, nisa))
+            nw = min(nw, nisa); nisa -= nw; cash += nw
+        if p.taxable_on and age >= p.taxable_withdraw_start and taxable > 0:
+            tw_gross = (taxable * p.taxable_withdraw_rate if p.taxable_withdraw_mode == "定率"
+                        else min(p.taxable_withdraw_annual, taxable))
+            tw_gross = min(tw_gross, taxable)
+            if taxable > 0 and taxable_cost_basis < taxable:
+                gain_ratio = (taxable - taxable_cost_basis) / taxable
+                tw_tax = tw_gross * gain_ratio * p.taxable_tax_rate
+            else:
+                tw_tax = 0.0
+            tw = tw_gross - tw_tax
+            cost_ratio = min(taxable_cost_basis / taxable, 1.0) if taxable > 0 else 0.0
+            taxable_cost_basis -= tw_gross * cost_ratio
+            taxable_cost_basis = max(taxable_cost_basis, 0.0)
+            taxable -= tw_gross; cash += tw
+
+        for ev in p.events:
+            if ev.on and ev.occurs_at(int(age)):
+                cash += ev.signed_amount
+
+        r_ideco = rng.normal(p.ideco_return, p.ideco_vol)
+        r_nisa  = rng.normal(p.nisa_return,  p.nisa_vol)
+        r_tax   = rng.normal(p.tax_return,   p.tax_vol)
+        ideco   *= (1.0 + r_ideco)
+        nisa    *= (1.0 + r_nisa)
+        taxable *= (1.0 + r_tax)
+
+        total = cash + ideco + nisa + taxable
+        if not ruined and total <= 0: ruined=True; ruin_age=int(age)
+
+        total_h.append(total); cash_h.append(cash); ideco_h.append(ideco)
+        nisa_h.append(nisa); taxable_h.append(taxable)
+        ic_h.append(ic); nc_h.append(nc); iw_h.append(iw)
+        nw_h.append(nw); tc_h.append(tc); tw_h.append(tw)
+
+    return dict(years=years,
+                total=np.array(total_h), cash=np.array(cash_h),
+                ideco=np.array(ideco_h),  nisa=np.array(nisa_h),
+                taxable=np.array(taxable_h),
+                ic=np.array(ic_h), nc=np.array(nc_h),
+                iw=np.array(iw_h), nw=np.array(nw_h),
+                tc=np.array(tc_h), tw=np.array(tw_h),
+                ruined=ruined, ruin_age=ruin_age)
+
+
+@dataclass
+class EngineState:
+    """ある年の期首時点の試行ごとの状態。途中再開（start=…）に使う。"""
+    cash: np.ndarray
+    ideco: np.ndarray
+    nisa: np.ndarray
+    taxable: np.ndarray
+    taxable_cost_basis: np.ndarray
+    ruined: np.ndarray       # それまでに一度でも総資産 ≤ 0 になったか
+
+    @classmethod
+    def initial(cls, p: SimParams, n: int) -> "EngineState":
+        return cls(cash=np.full(n, p.initial_cash, dtype=float),
+                   ideco=np.full(n, p.initial_ideco, dtype=float),
+                   nisa=np.full(n, p.initial_nisa, dtype=float),
+                   taxable=np.full(n, p.initial_taxable, dtype=float),
+                   taxable_cost_basis=np.full(n, p.initial_taxable, dtype=float),
+                   ruined=np.zeros(n, dtype=bool))
+
+
+def simulate_batch(p: SimParams, rng, n_trials, z=None, timeline: Timeline | None = None,
+                   state: EngineState | None = None, start: int = 0, stop: int | None = None,
+                   keep_basis: bool = False):
+    """
+    simulate_path の一括版。全試行を (試行数 × 年数) 配列としてまとめて進める。
+    乱数は試行→年→(iDeCo, NISA, 特定) の順に引くので、同じ rng なら
+    simulate_path を n_trials 回呼んだ場合と同一の結果になる。
+    z: 標準正規ショック (n_trials, 年数, 3)。与えた場合は rng を使わない（lifesim.sampling 参照）。
+    timeline: compile_timeline(p) の結果。呼び出し側で 1 回作って使い回す。
+    state / start / stop: 年インデックス [start, stop) だけを state から計算する（途中再開）。
+    このとき出力配列は区間の幅になり、z は全期間ぶん渡す。終了時点の状態を out["state"] に入れる。
+    ruin_age は区間内で初めて破綻した年齢（区間前に破綻済みの試行は NaN）。
+    keep_basis: 年末の特定口座の取得原価も out["basis"] に入れる（lifesim.incremental の再開用）。
+    """
+    tl = timeline if timeline is not None else compile_timeline(p)
+    n_years = len(tl.years)
+    stop = n_years if stop is None else int(stop)
+    years = tl.years[start:stop]
+    n, width = int(n_trials), len(years)
+
+    mu  = np.array([p.ideco_return, p.nisa_return, p.tax_return])
+    sig = np.array([p.ideco_vol,    p.nisa_vol,    p.tax_vol])
+    if z is None:
+        shocks = mu + sig * rng.standard_normal((n, width, 3))
+    else:
+        shocks = mu + sig * z[:, start:stop]
+
+    st0 = state if state is not None else EngineState.initial(p, n)
+    cash, ideco, nisa, taxable = st0.cash, st0.ideco, st0.nisa, st0.taxable
+    taxable_cost_basis = st0.taxable_cost_basis
+
+    out = {k: np.zeros((n, width)) for k in SERIES}
+    basis_h = np.zeros((n, width)) if keep_basis else None
+    zeros = np.zeros(n)
+    nisa_rate_mode    = p.nisa_withdraw_mode == "定率"
+    taxable_rate_mode = p.taxable_withdraw_mode == "定率"
+
+    for j, t in enumerate(range(start, stop)):
+        available = cash + tl.income[t] - tl.living[t]
+
+        ic = nc = tc = zeros
+        if tl.ideco_contrib_on[t]:
+            ic = np.where(available > 0, np.minimum(tl.ideco_contrib[t], available), 0.0)
+            ideco = ideco + ic; available = available - ic
+        if tl.nisa_contrib_on[t]:
+            nc = np.where(available > 0, np.minimum(tl.nisa_contrib[t], available), 0.0)
+            nisa = nisa + nc; available = available - nc
+        if tl.taxable_contrib_on[t]:
+            tc = np.where(available > 0, np.minimum(tl.taxable_contrib[t], available), 0.0)
+            taxable = taxable + tc; taxable_cost_basis = taxable_cost_basis + tc; available = available - tc
+
+        cash = available
+
+        iw = nw = tw = zeros
+        if tl.ideco_withdraw_on[t]:
+            iw = np.where(ideco > 0, np.minimum(p.ideco_withdraw_annual, ideco), 0.0)
+            ideco = ideco - iw; cash = cash + iw
+        if tl.nisa_withdraw_on[t]:
+            nw = (nisa * p.nisa_withdraw_rate if nisa_rate_mode
+                  else np.minimum(p.nisa_withdraw_annual, nisa))
+            nw = np.where(nisa > 0, np.minimum(nw, nisa), 0.0)
+            nisa = nisa - nw; cash = cash + nw
+        if tl.taxable_withdraw_on[t]:
+            pos = taxable > 0
+            safe = np.where(pos, taxable, 1.0)
+            tw_gross = (taxable * p.taxable_withdraw_rate if taxable_rate_mode
+                        else np.minimum(p.taxable_withdraw_annual, taxable))
+            tw_gross = np.where(pos, np.minimum(tw_gross, taxable), 0.0)
+            gain_ratio = (taxable - taxable_cost_basis) / safe
+            tw_tax = np.where(pos & (taxable_cost_basis < taxable),
+                              tw_gross * gain_ratio * p.taxable_tax_rate, 0.0)
+            tw = tw_gross - tw_tax
+            cost_ratio = np.where(pos, np.minimum(taxable_cost_basis / safe, 1.0), 0.0)
+            taxable_cost_basis = np.where(
+                pos, np.maximum(taxable_cost_basis - tw_gross * cost_ratio, 0.0), taxable_cost_basis)
+            taxable = taxable - tw_gross; cash = cash + tw
+
+        if tl.event_cash[t] != 0.0:
+            cash = cash + tl.event_cash[t]
+
+        ideco   = ideco   * (1.0 + shocks[:, j, 0])
+        nisa    = nisa    * (1.0 + shocks[:, j, 1])
+        taxable = taxable * (1.0 + shocks[:, j, 2])
+
+        total = cash + ideco + nisa + taxable
+        for k, v in (("total", total), ("cash", cash), ("ideco", ideco), ("nisa", nisa),
+                     ("taxable", taxable), ("ic", ic), ("nc", nc), ("iw", iw),
+                     ("nw", nw), ("tc", tc), ("tw", tw)):
+            out[k][:, j] = v
+        if basis_h is not None:
+            basis_h[:, j] = taxable_cost_basis
+
+    # 破綻年齢: 総資産が初めて 0 以下になった年（なければ NaN）
+    hit = out["total"] <= 0
+    new_ruin = hit.any(axis=1) & ~st0.ruined
+    ruined = st0.ruined | hit.any(axis=1)
+    ruin_age = (np.where(new_ruin, years[np.argmax(hit, axis=1)], np.nan).astype(float)
+                if width else np.full(n, np.nan))
+    if basis_h is not None:
+        out["basis"] = basis_h
+    out.update(years=years, ruined=ruined, ruin_age=ruin_age,
+               state=EngineState(cash, ideco, nisa, taxable, taxable_cost_basis, ruined))
+    return out
@@ -0,0 +1,144 @@
+"""
+全試行データの書き出し（試行 × 年の行列をそのまま保存）。
+
+画面の集計は平均・分位点だけを残して試行ごとの軌跡を捨てるので、分析用には同じ seed で
+エンジンを流し直し、チャンクごとにディスク上の配列へ書き込む（メモリは chunk 分だけ）。
+
+出力はディレクトリ:
+
+    meta.json        params・seed・エンジン版・試行数・年齢・系列名など
+    total.npy ...    系列ごとに float32 の (試行数, 年数)。SERIES と同じ名前
+    ruin_age.npy     float32 (試行数,)。破綻しなかった試行は NaN
+
+.npy は np.load(..., mmap_mode="r") でメモリマップでき、百万試行でも必要な行・列だけ読める。
+直列実行（workers=1）の run_simulation と同じ乱数列なので、同じ seed・試行数なら画面の結果と一致する。
+
+    python -m lifesim.export params.json out_dir --trials 1000000
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+from dataclasses import dataclass
+from typing import Iterable, Optional
+
+import numpy as np
+
+from .bank import shock_source
+from .engine import ENGINE_VERSION, SERIES, simulate_batch
+from .params import SimParams, as_params
+from .simulation import BATCH_CHUNK, result_key
+from .timeline import compile_timeline
+
+META_FILE = "meta.json"
+FORMAT_VERSION = 1
+
+
+def export_size_bytes(n_trials: int, n_years: int, series: Iterable[str] = SERIES) -> int:
+    """書き出しサイズの見積もり（float32）。"""
+    return 4 * int(n_trials) * (int(n_years) * len(tuple(series)) + 1)
+
+
+def export_trials(params, out_dir: str, *, trials: Optional[int] = None, seed: int = 42,
+                  series: Iterable[str] = SERIES, chunk: int = BATCH_CHUNK,
+                  source_key: Optional[str] = None) -> dict:
+    """
+    params の全試行を out_dir に書き出し、meta を返す。trials の既定は params.trials
+    （試行回数の自動決定時は結果の SimResult.trials を渡すと画面と同じ試行になる）。
+    meta の result_key は source_key（再現元の SimResult.key）。省略時は trials 回・
+    自動決定なしの直列実行 run_simulation のキー（自動決定した結果のキーとは異なる）。
+    既存の書き出しに上書きするときは先に meta.json を消すので、途中で止まっても古い meta は残らない。
+    """
+    p = as_params(params)
+    n = int(trials or p.trials)
+    series = tuple(series)
+    unknown = set(series) - set(SERIES)
+    if unknown:
+        raise ValueError(f"unknown series: {sorted(unknown)}")
+    os.makedirs(out_dir, exist_ok=True)
+    meta_path = os.path.join(out_dir, META_FILE)
+    if os.path.exists(meta_path):   # meta.json があれば書き出し完了の扱い。配列を書き換える前に消す
+        os.remove(meta_path)
+    tl = compile_timeline(p)
+    m = len(tl.years)
+
+    mats = {k: np.lib.format.open_memmap(os.path.join(out_dir, f"{k}.npy"), mode="w+",
+                                         dtype=np.float32, shape=(n, m)) for k in series}
+    ruin_age = np.lib.format.open_memmap(os.path.join(out_dir, "ruin_age.npy"), mode="w+",
+                                         dtype=np.float32, shape=(n,))
+    source = shock_source(p.sampling, seed, m, n, p)
+    done = 0
+    while done < n:
+        k = min(chunk, n - done)
+        out = simulate_batch(p, None, k, z=source.next(k), timeline=tl)
+        for name in series:
+            mats[name][done:done + k] = out[name]
+        ruin_age[done:done + k] = out["ruin_age"]
+        done += k
+    for a in (*mats.values(), ruin_age):
+        a.flush()
+    del mats, ruin_age
+
+    meta = {
+        "format_version": FORMAT_VERSION, "engine_version": ENGINE_VERSION,
+        "seed": int(seed), "trials": n, "years": tl.years.tolist(),
+        "series": list(series), "dtype": "float32", "unit": "JPY",
+        "result_key": source_key or result_key(p.to_dict() | {"trials": n, "auto_trials": False}, seed=seed),
+        "params": p.to_dict(),
+    }
+    tmp = os.path.join(out_dir, META_FILE + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=1)
+    os.replace(tmp, meta_path)   # meta.json があれば書き出し完了
+    return meta
+
+
+@dataclass
+class TrialExport:
+    """書き出したデータ。arrays の各値は（mmap=True なら）読み取り専用メモリマップ。"""
+    meta: dict
+    arrays: dict[str, np.ndarray]
+
+    @property
+    def years(self) -> np.ndarray:
+        return np.asarray(self.meta["years"])
+
+    @property
+    def params(self) -> SimParams:
+        return SimParams.from_dict(self.meta["params"])
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self.arrays[name]
+
+
+def load_trials(out_dir: str, mmap: bool = True) -> TrialExport:
+    with open(os.path.join(out_dir, META_FILE), encoding="utf-8") as f:
+        meta = json.load(f)
+    mode = "r" if mmap else None
+    arrays = {k: np.load(os.path.join(out_dir, f"{k}.npy"), mmap_mode=mode)
+              for k in (*meta["series"], "ruin_age")}
+    return TrialExport(meta, arrays)
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(prog="python -m lifesim.export", description="全試行データの書き出し")
+    ap.add_argument("params", help="params の JSON ファイル（build_params() と同じキー）")
+    ap.add_argument("out", help="出力ディレクトリ")
+    ap.add_argument("--trials", type=int, default=None)
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--series", default=",".join(SERIES), help="書き出す系列（カンマ区切り）")
+    a = ap.parse_args(argv)
+    with open(a.params, encoding="utf-8") as f:
+        p = SimParams.from_dict(json.load(f))
+    series = [s for s in a.series.split(",") if s]
+    n = a.trials or p.trials
+    print(f"writing {n:,} trials x {p.n_years} years "
+          f"({export_size_bytes(n, p.n_years, series) / 2**20:,.0f} MB) to {a.out}", file=sys.stderr)
+    export_trials(p, a.out, trials=a.trials, seed=a.seed, series=series)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,124 @@
+"""
+エンジン・バックエンドの差分テスト（同じ乱数入力に対して全バックエンドの結果が一致するか）。
+
+    python -m lifesim.harness                                   # 利用可能な全バックエンド × 200 ケース
+    python -m lifesim.harness --cases 1000 --backends reference,numba --seed 3
+
+ランダムな params（期間・口座の有無・積立 / 取崩の年齢と額・定額 / 定率・譲渡税率・イベント・
+破綻しやすい高ボラティリティなど）を作り、共通の z を各バックエンドに流して、年ごとの各口座残高・
+積立額・取崩額と破綻年齢を基準（--baseline、既定 reference）と比べる。
+食い違ったケースは params を JSON で表示し、終了コード 1 を返す。
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+from typing import Optional
+
+import numpy as np
+
+from .backends import available_backends, simulate
+from .engine import SERIES
+from .params import Event, SimParams
+from .timeline import compile_timeline
+
+
+def random_params(rng: np.random.Generator, trials: int = 16) -> SimParams:
+    """境界（残高 0・含み損・生活費超過・定率取崩など）を踏みやすい範囲で params を引く。"""
+    s = int(rng.integers(20, 80))
+    e = int(rng.integers(s, min(s + 60, 110) + 1))
+
+    def age(lo=s, hi=e):
+        return int(rng.integers(lo, max(lo, hi) + 1))
+
+    def money(hi):
+        return float(rng.choice([0.0, rng.uniform(0, hi)], p=[0.2, 0.8]))
+
+    def mode():
+        return str(rng.choice(["定額", "定率"]))
+
+    events = [Event(on=bool(rng.random() < 0.8), label=f"ev{i}", idx=i + 1, age=age(),
+                    direction=str(rng.choice(["支出", "収入"])), amount=int(money(20_000_000)),
+                    every=int(rng.choice([0, 0, 1, 3, 5])), until_age=int(rng.choice([0, age()])))
+              for i in range(int(rng.integers(0, 5)))]
+    return SimParams(
+        start_age=s, end_age=e,
+        initial_cash=float(rng.uniform(-2_000_000, 30_000_000)),
+        initial_ideco=money(10_000_000), initial_nisa=money(20_000_000), initial_taxable=money(30_000_000),
+        salary_net=money(8_000_000), retire_age=age(), pension_start_age=age(),
+        pension_annual=money(3_000_000),
+        living_before=money(6_000_000), living_after=money(5_000_000),
+        inflation_rate=float(rng.uniform(-0.01, 0.04)),
+        salary_macro_slide=float(rng.uniform(-0.02, 0.02)), pension_macro_slide=float(rng.uniform(-0.02, 0.0)),
+        ideco_on=bool(rng.random() < 0.7), ideco_contrib_start=age(), ideco_contrib_end=age(),
+        ideco_contrib_monthly=money(70_000), ideco_withdraw_start=age(), ideco_withdraw_annual=money(3_000_000),
+        ideco_return=float(rng.uniform(-0.05, 0.1)), ideco_vol=float(rng.uniform(0, 0.4)),
+        nisa_on=bool(rng.random() < 0.7), nisa_contrib_start=age(), nisa_contrib_end=age(),
+        nisa_contrib_monthly=money(300_000), nisa_withdraw_start=age(), nisa_withdraw_annual=money(5_000_000),
+        nisa_withdraw_mode=mode(), nisa_withdraw_rate=float(rng.uniform(0, 0.2)),
+        nisa_return=float(rng.uniform(-0.05, 0.1)), nisa_vol=float(rng.uniform(0, 0.4)),
+        taxable_on=bool(rng.random() < 0.7), taxable_contrib_start=age(), taxable_contrib_end=age(),
+        taxable_contrib_monthly=money(300_000), taxable_withdraw_start=age(),
+        taxable_withdraw_annual=money(5_000_000), taxable_withdraw_mode=mode(),
+        taxable_withdraw_rate=float(rng.uniform(0, 0.2)), taxable_tax_rate=float(rng.uniform(0, 0.5)),
+        tax_return=float(rng.uniform(-0.05, 0.1)), tax_vol=float(rng.uniform(0, 0.4)),
+        events=events, trials=int(trials),
+    )
+
+
+def compare(ref: dict, out: dict, rtol: float, atol: float) -> list[str]:
+    """食い違った系列の説明（空なら一致）。ruin_age は完全一致（NaN 同士は一致）で比べる。"""
+    bad = []
+    for k in SERIES:
+        a, b = np.asarray(ref[k]), np.asarray(out[k])
+        if a.shape != b.shape:
+            bad.append(f"{k}: shape {a.shape} != {b.shape}")
+        elif not np.allclose(a, b, rtol=rtol, atol=atol):
+            i = np.unravel_index(np.argmax(np.abs(a - b)), a.shape)
+            bad.append(f"{k}: max |diff| {abs(a[i] - b[i]):,.6g} at trial {i[0]}, year {i[1]} "
+                       f"({a[i]:,.6g} vs {b[i]:,.6g})")
+    if not np.array_equal(np.asarray(ref["ruin_age"]), np.asarray(out["ruin_age"]), equal_nan=True):
+        bad.append("ruin_age differs")
+    return bad
+
+
+def run(cases: int = 200, trials: int = 16, seed: int = 0, backends: Optional[list[str]] = None,
+        baseline: str = "reference", rtol: float = 1e-9, atol: float = 1e-3, log=print) -> list[dict]:
+    """全ケースを実行し、食い違い（{"case", "backend", "problems", "params"}）のリストを返す。"""
+    backends = [b for b in (backends or available_backends()) if b != baseline]
+    rng = np.random.default_rng(seed)
+    failures = []
+    for c in range(cases):
+        p = random_params(rng, trials)
+        tl = compile_timeline(p)
+        z = rng.standard_normal((p.trials, p.n_years, 3))
+        ref = simulate(p, p.trials, z, tl, backend=baseline)
+        for b in backends:
+            problems = compare(ref, simulate(p, p.trials, z, tl, backend=b), rtol, atol)
+            if problems:
+                failures.append({"case": c, "backend": b, "problems": problems, "params": p.to_dict()})
+                log(f"case {c}: {b} != {baseline}: " + "; ".join(problems))
+    log(f"{cases} cases x {len(backends)} backend(s) vs {baseline}: {len(failures)} mismatch(es)")
+    return failures
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(prog="python -m lifesim.harness", description="エンジン・バックエンドの差分テスト")
+    ap.add_argument("--cases", type=int, default=200)
+    ap.add_argument("--trials", type=int, default=16, help="1 ケースあたりの試行数")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--backends", default=",".join(available_backends()), help="比べるバックエンド（カンマ区切り）")
+    ap.add_argument("--baseline", default="reference")
+    ap.add_argument("--rtol", type=float, default=1e-9)
+    ap.add_argument("--atol", type=float, default=1e-3, help="許容する絶対誤差（円）")
+    a = ap.parse_args(argv)
+    failures = run(a.cases, a.trials, a.seed, [b for b in a.backends.split(",") if b], a.baseline,
+                   a.rtol, a.atol, log=lambda m: print(m, file=sys.stderr))
+    for f in failures:
+        print(json.dumps(f, ensure_ascii=False))
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,236 @@
+"""
+チェックポイントからの差分再計算（変更が効き始める年齢から先だけエンジンを回す）。
+
+直列・試行回数固定の実行で、試行ごとの年末残高（SERIES）・特定口座の取得原価・使った乱数ショック z を
+保持しておく。年 t の期首状態（現金・iDeCo・NISA・特定口座・取得原価・破綻済みか）は t-1 年末の
+値そのものなので、各年齢のスナップショットを別に持つ必要はない。
+
+次の実行で params が変わったときは、古い params と比べて「結果が変わりうる最初の年」t0 を求め
+（first_affected_index）、[0, t0) は保持した値をそのまま使い、t0 以降だけ同じ z で計算し直す。
+集計は全年ぶんを同じ順で Aggregator に流すので、最初から計算した場合とビット単位で一致する。
+
+- 乱数列が変わる変更（期間・試行回数・サンプリング方式・seed など）は全体を計算し直す
+- 期待リターン・変動率・初期残高は初年から効くので、やはり全体を計算し直す
+- 保持量の上限は LIFESIM_CHECKPOINT_MB（既定 256MB、0 で無効）。超える実行は通常どおり計算する
+"""
+from __future__ import annotations
+
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, fields
+from typing import Optional
+
+import numpy as np
+
+from .aggregate import Aggregator
+from .engine import SERIES, EngineState, simulate_batch
+from .params import ANALYSIS_FIELDS, SimParams
+from .profiling import stage
+from .timeline import Timeline, compile_timeline
+
+CHECKPOINT_MB = 256
+
+# 乱数ショックの列・形が変わる項目（違えば再利用できない）
+STREAM_FIELDS = frozenset({
+    "start_age", "end_age", "trials", "sampling", "returns_csv", "bootstrap_block",
+    "bootstrap_freq", "bootstrap_map", "bootstrap_raw",
+    "auto_trials", "auto_ruin_tol", "auto_median_tol", "auto_max_trials",
+})
+# compile_timeline を通してしか効かない項目（タイムラインの差分で最初の年が分かる）
+TIMELINE_FIELDS = frozenset({
+    "salary_net", "retire_age", "pension_start_age", "pension_annual",
+    "living_before", "living_after", "inflation_rate", "salary_macro_slide", "pension_macro_slide",
+    "ideco_on", "ideco_contrib_start", "ideco_contrib_end", "ideco_contrib_monthly", "ideco_withdraw_start",
+    "nisa_on", "nisa_contrib_start", "nisa_contrib_end", "nisa_contrib_monthly", "nisa_withdraw_start",
+    "taxable_on", "taxable_contrib_start", "taxable_contrib_end", "taxable_contrib_monthly",
+    "taxable_withdraw_start", "events",
+})
+# エンジンが直接使い、取崩の対象年にだけ効く項目 → その口座の取崩フラグ（Timeline の属性名）
+WITHDRAW_FIELDS = {
+    "ideco_withdraw_annual": "ideco_withdraw_on",
+    "nisa_withdraw_annual": "nisa_withdraw_on", "nisa_withdraw_mode": "nisa_withdraw_on",
+    "nisa_withdraw_rate": "nisa_withdraw_on",
+    "taxable_withdraw_annual": "taxable_withdraw_on", "taxable_withdraw_mode": "taxable_withdraw_on",
+    "taxable_withdraw_rate": "taxable_withdraw_on", "taxable_tax_rate": "taxable_withdraw_on",
+}
+_RETURN_FIELDS = frozenset({"ideco_return", "ideco_vol", "nisa_return", "nisa_vol", "tax_return", "tax_vol"})
+_TIMELINE_ARRAYS = tuple(f.name for f in fields(Timeline) if f.name != "years")
+
+
+def _first_true(mask: np.ndarray, default: int) -> int:
+    idx = np.flatnonzero(mask)
+    return int(idx[0]) if len(idx) else default
+
+
+def first_affected_index(old: SimParams, new: SimParams, tl_old: Optional[Timeline] = None,
+                         tl_new: Optional[Timeline] = None) -> Optional[int]:
+    """
+    old の試行と new の試行が初めて違いうる年インデックス。差がなければ年数、
+    同じ乱数列で続きを計算できない変更なら None。分析専用の項目は無視する。
+    それ以外の未分類の項目は安全側に 0（初年から）とみなす。
+    """
+    a, b = old.to_dict(), new.to_dict()
+    changed = {k for k in a if a[k] != b[k]} - ANALYSIS_FIELDS
+    if changed & STREAM_FIELDS:
+        return None
+    if new.sampling == "bootstrap" and new.bootstrap_raw and changed & _RETURN_FIELDS:
+        return None   # 水準そのままのブートストラップは z が期待リターン・変動率から作られる
+    tl_old = tl_old if tl_old is not None else compile_timeline(old)
+    tl_new = tl_new if tl_new is not None else compile_timeline(new)
+    n = len(tl_old.years)
+    first = n
+    for k in changed - TIMELINE_FIELDS:
+        flag = WITHDRAW_FIELDS.get(k)
+        if flag is None:
+            return 0
+        first = min(first, _first_true(getattr(tl_old, flag) | getattr(tl_new, flag), n))
+    if changed & TIMELINE_FIELDS:
+        for name in _TIMELINE_ARRAYS:
+            first = min(first, _first_true(getattr(tl_old, name) != getattr(tl_new, name), n))
+    return first
+
+
+@dataclass
+class Checkpoint:
+    """1 回分の実行の全試行データ（すべて (試行数, 年数)。z は (試行数, 年数, 3)）。"""
+    params: SimParams
+    seed: int
+    timeline: Timeline
+    out: dict[str, np.ndarray]   # SERIES ＋ "basis"（年末の取得原価）
+    z: np.ndarray
+    stream: str = ""             # params 以外で乱数列を決めるもの（bootstrap の CSV の内容）
+
+    @property
+    def nbytes(self) -> int:
+        return sum(a.nbytes for a in self.out.values()) + self.z.nbytes
+
+    def state_at(self, p: SimParams, t: int, i: int, k: int) -> EngineState:
+        """
+        試行 [i, i+k) の年インデックス t の期首状態（p は再開後の params）。
+        t == 0 は保持した値ではなく p の初期残高から作る（初期残高の変更は初年から効く）。
+        """
+        if t == 0:
+            return EngineState.initial(p, k)
+        o, rows = self.out, slice(i, i + k)
+        return EngineState(cash=o["cash"][rows, t - 1].copy(), ideco=o["ideco"][rows, t - 1].copy(),
+                           nisa=o["nisa"][rows, t - 1].copy(), taxable=o["taxable"][rows, t - 1].copy(),
+                           taxable_cost_basis=o["basis"][rows, t - 1].copy(),
+                           ruined=(o["total"][rows, :t] <= 0).any(axis=1))
+
+
+def _stream_tag(p: SimParams) -> str:
+    if p.sampling == "bootstrap" and p.returns_csv:
+        from .bootstrap import returns_digest
+        return returns_digest(p.returns_csv)
+    return ""
+
+
+def checkpoint_bytes(n_trials: int, n_years: int) -> int:
+    return 8 * int(n_trials) * int(n_years) * (len(SERIES) + 1 + 3)
+
+
+class CheckpointStore:
+    """Checkpoint の置き場（合計サイズ上限つき LRU）。スレッドセーフ。"""
+
+    def __init__(self, max_bytes: int = CHECKPOINT_MB * 2**20):
+        self.max_bytes = int(max_bytes)
+        self._items: "OrderedDict[int, Checkpoint]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def fits(self, n_trials: int, n_years: int) -> bool:
+        return checkpoint_bytes(n_trials, n_years) <= self.max_bytes
+
+    def take(self, p: SimParams, seed: int, tl: Timeline) -> tuple[Optional[Checkpoint], int]:
+        """
+        再開位置が最も遅い（計算が最も少ない）チェックポイントと、その再開年インデックス。
+        取り出したものは置き場から外す（呼び出し側が配列をその場で書き換えるため。
+        first_affected_index は対称なので、新しい params のチェックポイントで元の params にも戻れる）。
+        """
+        best, best_t = None, -1
+        with self._lock:
+            items = list(self._items.items())
+        tag = _stream_tag(p)
+        for key, cp in items:
+            if cp.seed != int(seed) or cp.stream != tag:
+                continue
+            t = first_affected_index(cp.params, p, cp.timeline, tl)
+            if t is not None and t > best_t:
+                best, best_t = (key, cp), t
+        if best is None:
+            return None, 0
+        with self._lock:
+            if self._items.pop(best[0], None) is None:   # 他のスレッドが先に取り出した
+                return None, 0
+        return best[1], best_t
+
+    def put(self, cp: Checkpoint) -> None:
+        with self._lock:
+            self._items[id(cp)] = cp
+            used = sum(c.nbytes for c in self._items.values())
+            while used > self.max_bytes and len(self._items) > 1:
+                _, old = self._items.popitem(last=False)
+                used -= old.nbytes
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+
+
+def run_checkpointed(p: SimParams, agg: Aggregator, source, key_rng, *, seed: int, chunk: int,
+                     timeline: Timeline, store: CheckpointStore, prof=None, on_progress=None) -> Optional[int]:
+    """
+    p.trials 試行を agg に集計し、チェックポイントを store に残す。再利用できるものがあれば
+    その再開年から先だけ計算する。戻り値は計算し直した最初の年インデックス（0 は全体）。
+    上限を超えて保持できない場合は何もせず None（呼び出し側が通常どおり計算する）。
+    source は再利用できないときだけ使う（ショックは z として保持する）。
+    """
+    tl = timeline
+    n, n_years = int(p.trials), len(tl.years)
+    if not store.fits(n, n_years):
+        return None
+    with stage(prof, "checkpoint lookup"):
+        base, t0 = store.take(p, seed, tl)
+    # 再利用するときは [t0, 年数) をその場で上書きする（途中で中断したら置き場には戻さない）
+    out = base.out if base is not None else {k: np.empty((n, n_years)) for k in (*SERIES, "basis")}
+    z = base.z if base is not None else np.empty((n, n_years, 3))
+    done = 0
+    while done < n:
+        k = min(chunk, n - done)
+        rows = slice(done, done + k)
+        if base is None:
+            with stage(prof, "shocks"):
+                z[rows] = source.next(k)
+        if t0 < n_years:
+            state = base.state_at(p, t0, done, k) if base is not None else None
+            with stage(prof, "engine"):
+                part = simulate_batch(p, None, k, z=z[rows], timeline=tl, state=state,
+                                      start=t0, keep_basis=True)
+            for name in out:
+                out[name][rows, t0:] = part[name]
+        # 破綻年齢: 再開前に破綻していればその年、そうでなければ再開後の初回
+        hit = out["total"][rows] <= 0
+        ruin_age = np.where(hit.any(axis=1), tl.years[np.argmax(hit, axis=1)], np.nan).astype(float)
+        with stage(prof, "aggregation"):
+            agg.update({**{s: out[s][rows] for s in SERIES}, "ruin_age": ruin_age}, key_rng.random(k))
+        done += k
+        if on_progress is not None:
+            on_progress(agg)
+    store.put(Checkpoint(params=p, seed=int(seed), timeline=tl, out=out, z=z, stream=_stream_tag(p)))
+    return t0 if base is not None else 0
+
+
+_default_store: Optional[CheckpointStore] = None
+_default_lock = threading.Lock()
+
+
+def default_checkpoints() -> Optional[CheckpointStore]:
+    """プロセス共通の置き場。LIFESIM_CHECKPOINT_MB（既定 256）が 0 なら None。"""
+    global _default_store
+    mb = int(os.getenv("LIFESIM_CHECKPOINT_MB", str(CHECKPOINT_MB)))
+    if mb <= 0:
+        return None
+    with _default_lock:
+        if _default_store is None or _default_store.max_bytes != mb * 2**20:
+            _default_store = CheckpointStore(mb * 2**20)
+        return _default_store
@@ -0,0 +1,180 @@
+"""
+バックグラウンド実行（画面のスレッドを計算で止めない）。
+
+    job = default_jobs().submit(params, owner=session_id, workers=1)
+    job.progress        # (完了試行数, 予定試行数)
+    job.partial         # 途中経過の SimResult（一定間隔で更新。無ければ None）
+    job.cancel()        # 次のバッチの区切りで止まり、ワーカーを空ける
+    job.result          # 完了後の SimResult
+
+- ワーカーはスレッドプール（LIFESIM_JOB_WORKERS、既定 2）。エンジンは numpy 演算中に GIL を離す
+- 待ち行列は上限つき（LIFESIM_JOB_QUEUE、既定 8）。あふれたら JobQueueFull
+- 同じ owner（セッション）の実行中・待機中ジョブは 1 件まで。新しく投入すると古い方を取り消すので、
+  1 人の大きな実行がワーカーを占有し続けることはない
+- 完了した結果は結果キャッシュに登録する。キャッシュにあれば投入した時点で完了している
+  （分析専用の項目だけが違う場合も同じ結果を使う）
+"""
+from __future__ import annotations
+
+import itertools
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Optional
+
+from .cache import ResultCache, default_cache
+from .parallel import RunCancelled
+from .params import SimParams, as_params
+from .simulation import SimResult, analyze, partial_result, result_key, run_simulation
+
+SNAPSHOT_EVERY = 0.5     # 途中経過の SimResult を作り直す最短間隔（秒）
+
+_ids = itertools.count(1)
+
+
+class JobCancelled(RunCancelled):
+    """取り消されたジョブの実行を打ち切るための例外。"""
+
+
+class JobQueueFull(RuntimeError):
+    """待ち行列が上限に達している。"""
+
+
+@dataclass
+class Job:
+    params: SimParams
+    kw: dict[str, Any]
+    owner: str = ""
+    total: int = 0
+    id: int = field(default_factory=lambda: next(_ids))
+    status: str = "queued"           # queued / running / done / cancelled / error
+    done_trials: int = 0
+    partial: Optional[SimResult] = None
+    result: Optional[SimResult] = None
+    source: str = "miss"             # 結果の取得元（cache.get と同じ "memory" / "disk" / "miss"）
+    error: Optional[BaseException] = None
+    submitted: float = field(default_factory=time.perf_counter)
+    seconds: float = 0.0             # 投入から完了まで
+    _cancel: threading.Event = field(default_factory=threading.Event, repr=False)
+    _future: Optional[Future] = field(default=None, repr=False)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("done", "cancelled", "error")
+
+    @property
+    def progress(self) -> tuple[int, int]:
+        return self.done_trials, self.total
+
+    def cancel(self) -> None:
+        """待機中ならその場で取り消し、実行中なら次のバッチの区切りで止める。"""
+        self._cancel.set()
+        fut = self._future
+        if fut is not None and fut.cancel():
+            self._finish("cancelled")
+
+    def _finish(self, status: str) -> None:
+        self.status = status
+        self.seconds = time.perf_counter() - self.submitted
+
+
+class JobManager:
+    """上限つきのワーカープールと待ち行列。スレッドセーフ。"""
+
+    def __init__(self, workers: int = 2, max_queue: int = 8, cache: Optional[ResultCache] = None):
+        self.workers = max(1, int(workers))
+        self.max_queue = max(0, int(max_queue))
+        self.cache = cache
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="lifesim-job")
+        self._jobs: dict[int, Job] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, params, *, owner: str = "", **kw) -> Job:
+        """
+        run_simulation(params, **kw) を投入して Job を返す。owner の未完了ジョブは取り消す。
+        待ち行列があふれていれば JobQueueFull。
+        """
+        p = as_params(params)
+        job = Job(p, kw, owner=owner, total=int(p.auto_max_trials if p.auto_trials else p.trials))
+        cache = self.cache or default_cache()
+        res, source = cache.get(result_key(p, **kw))
+        if res is not None:
+            job.result, job.source, job.done_trials = analyze(res, p), source, res.trials
+            job._finish("done")
+            return job
+        with self._lock:
+            for old in self._jobs.values():
+                if owner and old.owner == owner and not old.finished:
+                    old.cancel()
+            self._prune()
+            # 取り消し済みでも実行中のものはバッチの区切りまでワーカーを使っているので数える
+            active = sum(1 for j in self._jobs.values()
+                         if not j.finished and (j.status == "running" or not j._cancel.is_set()))
+            if active >= self.workers + self.max_queue:
+                raise JobQueueFull(f"{active} jobs pending (limit {self.workers + self.max_queue})")
+            self._jobs[job.id] = job
+            job._future = self._pool.submit(self._run, job, cache)
+        return job
+
+    def get(self, job_id: int) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return {s: sum(1 for j in jobs if j.status == s) for s in ("queued", "running")} | {
+            "workers": self.workers, "max_queue": self.max_queue}
+
+    # ── 内部 ──────────────────────────────────────────────
+    def _prune(self) -> None:
+        """終わったジョブは一定数だけ残す（画面が結果を取りに来るまでの猶予）。"""
+        done = [j for j in self._jobs.values() if j.finished]
+        for j in done[:max(len(done) - 4 * (self.workers + self.max_queue), 0)]:
+            del self._jobs[j.id]
+
+    def _run(self, job: Job, cache: ResultCache) -> None:
+        if job._cancel.is_set():
+            job._finish("cancelled")
+            return
+        job.status = "running"
+        seed = job.kw.get("seed", 42)
+        last = [0.0]
+
+        def on_progress(agg):
+            if job._cancel.is_set():
+                raise JobCancelled()
+            job.done_trials = int(agg.n)
+            now = time.perf_counter()
+            if now - last[0] >= SNAPSHOT_EVERY:
+                job.partial = partial_result(job.params, agg, seed=seed)
+                last[0] = time.perf_counter()   # スナップショット自体の時間は間隔に含めない
+
+        try:
+            res = run_simulation(job.params, on_progress=on_progress, cancel=job._cancel, **job.kw)
+        except RunCancelled:   # 並列時も実行中のシャードはバッチの区切りで止まっている
+            job._finish("cancelled")
+            return
+        except Exception as e:   # 画面側で表示する
+            job.error = e
+            job._finish("error")
+            return
+        cache.put(res.key, res)
+        job.result, job.done_trials = res, res.trials
+        job._finish("done")
+
+
+_default_jobs: Optional[JobManager] = None
+_default_lock = threading.Lock()
+
+
+def default_jobs() -> JobManager:
+    """プロセス共通のジョブ管理。LIFESIM_JOB_WORKERS（既定 2）, LIFESIM_JOB_QUEUE（既定 8）。"""
+    global _default_jobs
+    with _default_lock:
+        if _default_jobs is None:
+            _default_jobs = JobManager(workers=int(os.getenv("LIFESIM_JOB_WORKERS", "2")),
+                                       max_queue=int(os.getenv("LIFESIM_JOB_QUEUE", "8")))
+        return _default_jobs
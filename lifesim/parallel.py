@@ -0,0 +1,126 @@
+"""
+試行のマルチプロセス並列実行。
+
+seed から np.random.SeedSequence(seed).spawn(workers) で各シャードの乱数列を作り、
+シャードごとに Aggregator を作ってシャード順に merge する。
+同じ seed・同じ workers なら結果はビット単位で一致する（workers が違えば乱数列も違う）。
+
+cancel（is_set() を持つもの）を渡すと、取り消し時に共有フラグ（Manager の Event）を立て、
+実行中のシャードもバッチ（chunk 件）の区切りで止まる。プールはすぐ次の実行に使える。
+"""
+from __future__ import annotations
+
+import multiprocessing as mp
+import threading
+from concurrent.futures import ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+from .aggregate import Aggregator
+from .backends import DEFAULT_BACKEND, get_backend
+from .params import SimParams
+from .sampling import make_shock_source
+from .timeline import compile_timeline
+
+CANCEL_POLL = 0.1   # 取り消しを確認する間隔（秒）
+
+_pools: dict[int, ProcessPoolExecutor] = {}
+_pools_lock = threading.Lock()
+_manager = None
+
+
+class RunCancelled(Exception):
+    """cancel によって打ち切られた（lifesim.jobs.JobCancelled はこの派生）。"""
+
+
+def _get_pool(workers: int) -> ProcessPoolExecutor:
+    """プロセスプールは使い回す（起動コストを毎回払わない）。Streamlit のスレッドと干渉しないよう spawn。"""
+    with _pools_lock:
+        pool = _pools.get(workers)
+        if pool is None:
+            pool = ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context("spawn"))
+            _pools[workers] = pool
+        return pool
+
+
+def _stop_flag():
+    """シャードと共有する取り消しフラグ。Manager は最初に必要になったときに 1 つだけ起動する。"""
+    global _manager
+    with _pools_lock:
+        if _manager is None:
+            _manager = mp.get_context("spawn").Manager()
+        return _manager.Event()
+
+
+def shard_sizes(n_trials: int, workers: int) -> list[int]:
+    base, extra = divmod(int(n_trials), int(workers))
+    return [base + (1 if i < extra else 0) for i in range(workers)]
+
+
+def _run_shard(p: SimParams, n: int, seed_seq, quantiles: str, chunk: int,
+               backend: str = DEFAULT_BACKEND, stop=None) -> Aggregator | None:
+    """1 シャード分を集計する。stop が立ったらバッチの区切りで None を返す。"""
+    engine = get_backend(backend)
+    source = make_shock_source(p.sampling, np.random.default_rng(seed_seq), p.n_years, p)
+    key_rng = np.random.default_rng(seed_seq.spawn(1)[0])   # サンプル軌跡選択用（本番の乱数列とは別）
+    tl = compile_timeline(p)
+    agg = Aggregator(tl.years, quantiles=quantiles)
+    while n > 0:
+        if stop is not None and stop.is_set():
+            return None
+        m = min(n, chunk)
+        agg.update(engine(p, m, source.next(m), tl), key_rng.random(m))
+        n -= m
+    return agg
+
+
+def run_parallel(p: SimParams, n_trials: int, *, seed, workers: int,
+                 quantiles: str, chunk: int, on_part=None, backend: str = DEFAULT_BACKEND,
+                 cancel=None) -> Aggregator:
+    """
+    n_trials を workers 個のシャードに分けてプロセスプールで実行し、集計を合流して返す。
+    seed は int または int の列（SeedSequence のエントロピーとしてそのまま使う）。
+    on_part(agg) はシャードを合流するたびに呼ぶ。例外を投げたら全シャードを止めて送出する。
+    cancel が立ったら全シャードを止めて RunCancelled。どちらも実行中のシャードが
+    バッチの区切りで止まるのを待ってから戻る。
+    """
+    children = np.random.SeedSequence(seed).spawn(workers)
+    pool = _get_pool(workers)
+    stop = _stop_flag() if cancel is not None else None
+    futures = [pool.submit(_run_shard, p, n, ss, quantiles, chunk, backend, stop)
+               for n, ss in zip(shard_sizes(n_trials, workers), children) if n > 0]
+
+    def halt():
+        if stop is not None:
+            stop.set()
+        for f in futures:
+            f.cancel()
+        wait(futures)
+
+    agg = None
+    for fut in futures:            # 提出順（＝シャード順）に合流
+        try:
+            while True:
+                try:
+                    part = fut.result(timeout=CANCEL_POLL if cancel is not None else None)
+                    break
+                except TimeoutError:
+                    if cancel.is_set():
+                        halt()
+                        raise RunCancelled() from None
+        except BrokenProcessPool:
+            with _pools_lock:      # 壊れたプールは捨てて次回作り直す
+                _pools.pop(workers, None)
+            raise
+        if agg is None:
+            agg = part
+        else:
+            agg.merge(part)
+        if on_part is not None:
+            try:
+                on_part(agg)
+            except BaseException:
+                halt()
+                raise
+    return agg
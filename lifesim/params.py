@@ -0,0 +1,167 @@
+"""シミュレーション入力パラメータ（型付き）。"""
+from __future__ import annotations
+
+import hashlib
+import json
+from dataclasses import asdict, dataclass, field, fields
+from typing import Any, Mapping
+
+import numpy as np
+
+_COERCE = {"int": int, "float": float, "bool": bool, "str": str}
+
+# 試行には影響せず、集計済みの結果の後処理（しきい値を超える年齢・注記・サンプル軌跡の表示）だけに
+# 使う項目。結果キャッシュのキー（digest）に含めず、変えたときは lifesim.simulation.analyze で
+# 保存済みの結果から作り直す（エンジンは回さない）。
+ANALYSIS_FIELDS = frozenset({"ruin_threshold", "show_sample_paths", "sample_paths_n"})
+
+
+@dataclass
+class Event:
+    """一時イベント（収入 / 支出）。"""
+    on: bool = False
+    label: str = ""
+    idx: int = 0
+    age: int = 70
+    direction: str = "支出"   # "支出" or "収入"
+    amount: int = 0
+    every: int = 0            # 繰り返し間隔（年）。0 は 1 回のみ
+    until_age: int = 0        # 繰り返しの最終年齢。0 はシミュレーション終了まで
+
+    @property
+    def signed_amount(self) -> float:
+        """現金に加算する額（支出は負）。"""
+        return self.amount if self.direction == "収入" else -abs(self.amount)
+
+    def occurrence_ages(self, end_age: int):
+        """発生する年齢の配列（end_age まで）。"""
+        if self.every <= 0:
+            return np.array([self.age])
+        last = min(self.until_age or end_age, end_age)
+        return np.arange(self.age, last + 1, self.every)
+
+    def occurs_at(self, age: int) -> bool:
+        if self.every <= 0:
+            return age == self.age
+        last = self.until_age or age
+        return self.age <= age <= last and (age - self.age) % self.every == 0
+
+    @classmethod
+    def from_dict(cls, d: Mapping[str, Any]) -> "Event":
+        return cls(**_coerce(cls, d))
+
+
+@dataclass
+class SimParams:
+    """build_params() が作る dict と同じキーを持つパラメータ一式。金額は円、率は小数。"""
+    # 期間
+    start_age: int = 40
+    end_age: int = 95
+    # 初期資産
+    initial_cash: float = 10_000_000.0
+    initial_ideco: float = 0.0
+    initial_nisa: float = 0.0
+    initial_taxable: float = 0.0
+    # 収入
+    salary_net: float = 3_000_000.0
+    retire_age: int = 65
+    pension_start_age: int = 70
+    pension_annual: float = 1_200_000.0
+    # 生活費・インフレ
+    living_before: float = 2_500_000.0
+    living_after: float = 2_000_000.0
+    inflation_rate: float = 0.01
+    salary_macro_slide: float = 0.0
+    pension_macro_slide: float = -0.006
+    # iDeCo
+    ideco_on: bool = True
+    ideco_contrib_start: int = 40
+    ideco_contrib_end: int = 65
+    ideco_contrib_monthly: float = 23_000.0
+    ideco_withdraw_start: int = 65
+    ideco_withdraw_annual: float = 600_000.0
+    ideco_return: float = 0.04
+    ideco_vol: float = 0.12
+    # NISA
+    nisa_on: bool = True
+    nisa_contrib_start: int = 40
+    nisa_contrib_end: int = 65
+    nisa_contrib_monthly: float = 60_000.0
+    nisa_withdraw_start: int = 70
+    nisa_withdraw_annual: float = 1_000_000.0
+    nisa_withdraw_mode: str = "定額"   # "定額" or "定率"
+    nisa_withdraw_rate: float = 0.04
+    nisa_return: float = 0.04
+    nisa_vol: float = 0.12
+    # 特定口座
+    taxable_on: bool = False
+    taxable_contrib_start: int = 40
+    taxable_contrib_end: int = 60
+    taxable_contrib_monthly: float = 50_000.0
+    taxable_withdraw_start: int = 70
+    taxable_withdraw_annual: float = 1_000_000.0
+    taxable_withdraw_mode: str = "定額"
+    taxable_withdraw_rate: float = 0.04
+    taxable_tax_rate: float = 0.20315
+    tax_return: float = 0.04
+    tax_vol: float = 0.12
+    # イベント
+    events: list[Event] = field(default_factory=list)
+    # モンテカルロ・表示（ruin_threshold・show_sample_paths・sample_paths_n は分析専用。ANALYSIS_FIELDS）
+    ruin_threshold: int = 20
+    show_sample_paths: bool = True
+    sample_paths_n: int = 80
+    trials: int = 1000
+    sampling: str = "mc"                # "mc" / "antithetic" / "sobol" / "bootstrap"（lifesim.sampling）
+    # ヒストリカル・ブートストラップ（sampling="bootstrap" のとき。lifesim.bootstrap）
+    returns_csv: str = ""               # 年次 / 月次リターンの CSV（ローカルパス）
+    bootstrap_block: int = 5            # ブロック長（年）
+    bootstrap_freq: str = "annual"      # "annual" or "monthly"
+    bootstrap_map: str = ""             # 口座→系列 "ideco=列名,nisa=列名,taxable=列名"（3 口座とも必須）
+    bootstrap_raw: bool = False         # True: 履歴リターンをそのまま使う（変動率 > 0 が必要）/ False: 口座の期待値・変動率に合わせる
+    # 試行回数の自動決定（収束判定）。有効時 trials は無視し、auto_max_trials を上限にバッチ追加
+    auto_trials: bool = False
+    auto_ruin_tol: float = 1.0          # 破綻率 95%CI の半幅（%ポイント）
+    auto_median_tol: float = 0.02       # 最終資産中央値 95%CI の半幅（中央値に対する比）
+    auto_max_trials: int = 20_000
+
+    @property
+    def n_years(self) -> int:
+        return self.end_age - self.start_age + 1
+
+    @classmethod
+    def from_dict(cls, d: Mapping[str, Any]) -> "SimParams":
+        """dict（build_params() の出力や JSON）から生成。未知のキーは ValueError。"""
+        kw = _coerce(cls, {k: v for k, v in d.items() if k != "events"})
+        kw["events"] = [e if isinstance(e, Event) else Event.from_dict(e)
+                        for e in d.get("events", [])]
+        return cls(**kw)
+
+    def to_dict(self) -> dict[str, Any]:
+        return asdict(self)
+
+    def simulation_dict(self) -> dict[str, Any]:
+        """試行の結果を左右する項目だけ（ANALYSIS_FIELDS を除く）。"""
+        return {k: v for k, v in self.to_dict().items() if k not in ANALYSIS_FIELDS}
+
+    def digest(self, **extra: Any) -> str:
+        """
+        正規化した params（＋seed・エンジン版など extra）の安定ハッシュ。キャッシュキーに使う。
+        分析専用の項目は含めないので、それだけが違う params は同じキーになる。
+        """
+        payload = {"params": self.simulation_dict(), **extra}
+        blob = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+        return hashlib.sha256(blob.encode("utf-8")).hexdigest()[:32]
+
+
+def as_params(p: "SimParams | Mapping[str, Any]") -> SimParams:
+    """SimParams / dict のどちらでも受け付けるための正規化。"""
+    return p if isinstance(p, SimParams) else SimParams.from_dict(p)
+
+
+def _coerce(cls, d: Mapping[str, Any]) -> dict[str, Any]:
+    types = {f.name: f.type for f in fields(cls)}
+    unknown = set(d) - set(types)
+    if unknown:
+        raise ValueError(f"unknown {cls.__name__} keys: {sorted(unknown)}")
+    return {k: _COERCE.get(types[k], lambda x: x)(v) for k, v in d.items()}
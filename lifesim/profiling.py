@@ -0,0 +1,103 @@
+"""
+処理段階ごとの計測（実行・描画のどこで時間を使ったか）。
+
+    prof = Profiler()
+    with prof.stage("engine"):
+        ...
+    prof.rows()                        # [{"stage", "seconds", "calls", "peak_mb"}, ...]
+    prof.append_jsonl("profile.jsonl", session="abc")
+
+同じ名前の段階は呼び出しごとに時間を足し込む（チャンクごとのエンジン呼び出しなど）。
+track_memory=True のときは tracemalloc で段階内のピーク確保量も記録する（計測中は遅くなる）。
+段階は入れ子にできる。内側の段階は外側の時間・ピークにも含まれ、total は最も外側の段階だけを足す。
+"""
+from __future__ import annotations
+
+import datetime
+import json
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from typing import Any, Optional
+
+from .engine import ENGINE_VERSION
+
+
+class Profiler:
+    def __init__(self, track_memory: bool = False):
+        self.track_memory = bool(track_memory)
+        self._stages: dict[str, dict[str, Any]] = {}   # 挿入順＝初回に通った順
+        self._top: set[str] = set()                      # 入れ子でなく通ったことのある段階（total の対象）
+        self._open: list[dict[str, int]] = []            # 実行中の段階（外側から）。carry は内側に入る前のピーク
+
+    @contextmanager
+    def stage(self, name: str):
+        started = False
+        frame = {"carry": 0, "base": 0}
+        if self.track_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                started = True
+            if self._open:   # reset_peak で消える外側のピークを退避しておく
+                outer = self._open[-1]
+                outer["carry"] = max(outer["carry"], tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+            frame["base"] = tracemalloc.get_traced_memory()[0]
+        top = not self._open
+        self._open.append(frame)
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            sec = time.perf_counter() - t0
+            self._open.pop()
+            peak = None
+            if self.track_memory:
+                high = max(tracemalloc.get_traced_memory()[1], frame["carry"])
+                peak = max(high - frame["base"], 0) / 2**20
+                if self._open:
+                    self._open[-1]["carry"] = max(self._open[-1]["carry"], high)
+                if started:
+                    tracemalloc.stop()
+            self.add(name, sec, peak, top=top)
+
+    def add(self, name: str, seconds: float, peak_mb: Optional[float] = None, top: bool = True) -> None:
+        """top=False は他の段階の内側で計った時間（total に足さない）。"""
+        if top:
+            self._top.add(name)
+        s = self._stages.setdefault(name, {"seconds": 0.0, "calls": 0, "peak_mb": None})
+        s["seconds"] += float(seconds)
+        s["calls"] += 1
+        if peak_mb is not None:
+            s["peak_mb"] = max(s["peak_mb"] or 0.0, float(peak_mb))
+
+    def merge(self, other: "Profiler", prefix: str = "") -> None:
+        for name, s in other._stages.items():
+            if name in other._top:
+                self._top.add(prefix + name)
+            t = self._stages.setdefault(prefix + name, {"seconds": 0.0, "calls": 0, "peak_mb": None})
+            t["seconds"] += s["seconds"]
+            t["calls"] += s["calls"]
+            if s["peak_mb"] is not None:
+                t["peak_mb"] = max(t["peak_mb"] or 0.0, s["peak_mb"])
+
+    @property
+    def total(self) -> float:
+        return sum(s["seconds"] for k, s in self._stages.items() if k in self._top)
+
+    def rows(self) -> list[dict[str, Any]]:
+        return [{"stage": k, **v} for k, v in self._stages.items()]
+
+    def to_record(self, **meta: Any) -> dict[str, Any]:
+        return {"time": datetime.datetime.now().isoformat(timespec="seconds"),
+                "engine": ENGINE_VERSION, **meta, "total_seconds": self.total, "stages": self.rows()}
+
+    def append_jsonl(self, path: str, **meta: Any) -> None:
+        """1 回分の計測を JSON 1 行として追記する。"""
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(self.to_record(**meta), ensure_ascii=False) + "\n")
+
+
+def stage(prof: Optional[Profiler], name: str):
+    """prof が None なら何もしないコンテキスト（計測なしの経路を分岐させないため）。"""
+    return prof.stage(name) if prof is not None else nullcontext()
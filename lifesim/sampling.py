@@ -0,0 +1,128 @@
+"""
+リターンショック（標準正規乱数）の生成方式。
+
+- "mc"        : 疑似乱数（従来どおり。rng.normal と同じ乱数列）
+- "antithetic": 対称変量。z と -z を対で使い、平均まわりの誤差を打ち消す
+- "sobol"     : スクランブル Sobol 準乱数を逆正規変換（scipy が必要）
+- "bootstrap" : ヒストリカル・リターンのブロック・ブートストラップ（lifesim.bootstrap。params が必要）
+
+どの方式も next(n) で (n, 年数, 3) の標準正規ショックを返し、
+エンジン側で mu + sigma * z に変換する。
+"""
+from __future__ import annotations
+
+import warnings
+
+import numpy as np
+
+SAMPLING_MODES = ("mc", "antithetic", "sobol", "bootstrap")
+N_ACCOUNTS = 3   # iDeCo, NISA, 特定口座
+
+
+def sobol_available() -> bool:
+    try:
+        import scipy.stats.qmc  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class MonteCarloShocks:
+    def __init__(self, rng, n_years: int):
+        self.rng, self.n_years = rng, int(n_years)
+
+    def next(self, n: int) -> np.ndarray:
+        return self.rng.standard_normal((int(n), self.n_years, N_ACCOUNTS))
+
+
+class AntitheticShocks:
+    """z, -z, z', -z', ... の順に返す。奇数本で区切れても対は次回に持ち越す。"""
+
+    def __init__(self, rng, n_years: int):
+        self.rng, self.n_years = rng, int(n_years)
+        self._pending = None
+
+    def next(self, n: int) -> np.ndarray:
+        n = int(n)
+        parts = []
+        if self._pending is not None and n > 0:
+            parts.append(self._pending); self._pending = None; n -= 1
+        m = (n + 1) // 2
+        z = self.rng.standard_normal((m, self.n_years, N_ACCOUNTS))
+        pairs = np.stack([z, -z], axis=1).reshape(2 * m, self.n_years, N_ACCOUNTS)
+        if 2 * m > n:
+            self._pending = pairs[-1:]; pairs = pairs[:-1]
+        parts.append(pairs)
+        return np.concatenate(parts)
+
+
+class SobolShocks:
+    """次元 = 年数 × 3 のスクランブル Sobol 列。チャンクをまたいでも列は連続する。"""
+
+    def __init__(self, rng, n_years: int):
+        from scipy.special import ndtri
+        from scipy.stats import qmc
+        self._ndtri = ndtri
+        self.n_years = int(n_years)
+        self.engine = qmc.Sobol(d=self.n_years * N_ACCOUNTS, scramble=True, seed=rng)
+
+    def next(self, n: int) -> np.ndarray:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")   # 2 の冪でない本数の警告は無視（精度が少し落ちるだけ）
+            u = self.engine.random(int(n))
+        u = np.clip(u, 1e-12, 1 - 1e-12)
+        return self._ndtri(u).reshape(int(n), self.n_years, N_ACCOUNTS)
+
+
+def make_shock_source(mode: str, rng, n_years: int, params=None):
+    if mode == "mc":
+        return MonteCarloShocks(rng, n_years)
+    if mode == "antithetic":
+        return AntitheticShocks(rng, n_years)
+    if mode == "sobol":
+        if not sobol_available():
+            raise RuntimeError("sampling='sobol' には scipy が必要です（pip install scipy）")
+        return SobolShocks(rng, n_years)
+    if mode == "bootstrap":
+        if params is None or not params.returns_csv:
+            raise ValueError("sampling='bootstrap' には returns_csv（ヒストリカル・リターンの CSV）が必要です")
+        from .bootstrap import BlockBootstrapShocks
+        return BlockBootstrapShocks(rng, n_years, params)
+    raise ValueError(f"unknown sampling mode: {mode!r}")
+
+
+def compare_sampling(params, modes=None, *, trials: int = 1000, replicates: int = 8,
+                     seed: int = 0) -> list[dict]:
+    """
+    各サンプリング方式を replicates 回（seed を変えて）実行し、主要統計量の推定ばらつきを比べる。
+    var_ratio = 疑似乱数（mc）の分散 / その方式の分散。2.0 なら同じ精度を約半分の試行回数で得られる。
+    """
+    from .params import as_params
+    from .simulation import run_simulation
+
+    p = as_params(params)
+    # bootstrap は分布そのものが違うので分散の比較対象にしない
+    modes = list(modes or [m for m in SAMPLING_MODES
+                           if m != "bootstrap" and (m != "sobol" or sobol_available())])
+    if "mc" not in modes:
+        modes.insert(0, "mc")
+    stats = {
+        "survival_rate": lambda r: r.survival_rate,
+        "ruin_rate":     lambda r: r.ruin_rate,
+        "median_final":  lambda r: r.median_final,
+        "mean_final":    lambda r: float(r.avg_total[-1]),
+    }
+    samples = {}
+    for mode in modes:
+        q = as_params({**p.to_dict(), "sampling": mode, "trials": int(trials), "auto_trials": False})
+        runs = [run_simulation(q, seed=seed + i, quantiles="exact") for i in range(replicates)]
+        samples[mode] = {k: np.array([f(r) for r in runs]) for k, f in stats.items()}
+
+    rows = []
+    for mode in modes:
+        for k in stats:
+            v = samples[mode][k]
+            var, var_mc = float(np.var(v, ddof=1)), float(np.var(samples["mc"][k], ddof=1))
+            rows.append(dict(mode=mode, stat=k, mean=float(v.mean()), std=float(np.sqrt(var)),
+                             var_ratio=(var_mc / var) if var > 0 else float("inf") if var_mc > 0 else 1.0))
+    return rows
@@ -0,0 +1,299 @@
+"""run_simulation: エンジン実行 → 集計 → 結果オブジェクト。Streamlit 非依存。"""
+from __future__ import annotations
+
+import json
+from dataclasses import dataclass, field, fields, replace
+from typing import Any, Optional
+
+import numpy as np
+
+from .aggregate import EXACT_LIMIT, Aggregator
+from .backends import DEFAULT_BACKEND, get_backend
+from .engine import ENGINE_VERSION
+from .parallel import RunCancelled, run_parallel
+from .params import SimParams, as_params
+from .profiling import stage
+from .timeline import compile_timeline
+
+BATCH_CHUNK = 2000   # 一括エンジン 1 回あたりの試行数（ピークメモリの目安）
+AUTO_BATCH = 500     # 自動決定時に 1 回で追加する試行数
+AUTO_MIN_TRIALS = 1000
+
+
+@dataclass
+class SimResult:
+    """1 回の実行結果。配列はすべて年齢 years に対応する長さ。金額は円。"""
+    years: np.ndarray
+    avg_total: np.ndarray
+    p10_total: np.ndarray
+    p90_total: np.ndarray
+    avg_cash: np.ndarray
+    avg_ideco: np.ndarray
+    avg_nisa: np.ndarray
+    avg_taxable: np.ndarray
+    avg_ic: np.ndarray
+    avg_nc: np.ndarray
+    avg_iw: np.ndarray
+    avg_nw: np.ndarray
+    avg_tc: np.ndarray
+    avg_tw: np.ndarray
+    fan_total: np.ndarray            # 総資産の分位点 (len(FAN_QUANTILES), 年数)
+    ruin_prob: np.ndarray            # 各年齢までに破綻した試行の割合（%）
+    survival_rate: float
+    ruin_rate: float
+    median_final: float
+    p10_final: float
+    p90_final: float
+    median_ruin: Optional[int]
+    ruin_ci: tuple[float, float]     # 破綻率の 95% 信頼区間（%）
+    median_ci: tuple[float, float]   # 最終資産中央値の 95% 信頼区間（円）
+    threshold: int
+    ruin_thr_age: Optional[int]
+    trials: int                      # 実際に使った試行回数（自動決定時は停止時点）
+    seed: int
+    converged: bool = True           # 自動決定時: 許容幅に収まって停止したか（False は上限到達）
+    key_events: list[dict[str, Any]] = field(default_factory=list)
+    sample_paths_total: np.ndarray = field(default_factory=lambda: np.empty((0, 0)))
+    highlight_total: np.ndarray = field(default_factory=lambda: np.empty((0, 0)))
+    show_sp: bool = False
+    sp_n: int = 0                    # 表示するサンプル軌跡の本数（sample_paths_total の先頭から）
+    key: str = ""                    # params・seed・エンジン版のハッシュ（キャッシュキー）
+
+    @property
+    def yr_cnt(self) -> int:
+        return len(self.years)
+
+    @property
+    def view_key(self) -> str:
+        """key ＋ 分析専用の項目。グラフなど表示のキャッシュはこちらで引く。"""
+        return f"{self.key}:{self.threshold}:{int(self.show_sp)}:{self.sp_n}"
+
+    def to_arrays(self) -> dict[str, np.ndarray]:
+        """npz 保存用に配列へ分解。配列以外は JSON にまとめて "__meta__" に入れる。"""
+        arrays, meta = {}, {}
+        for f in fields(self):
+            v = getattr(self, f.name)
+            if isinstance(v, np.ndarray):
+                arrays[f.name] = v
+            else:
+                meta[f.name] = v
+        arrays["__meta__"] = np.array(json.dumps(meta, ensure_ascii=False))
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays) -> "SimResult":
+        kw = json.loads(str(arrays["__meta__"]))
+        for name in arrays:
+            if name != "__meta__":
+                kw[name] = np.asarray(arrays[name])
+        return cls(**kw)
+
+
+def build_key_events(p: SimParams, ruin_thr_age: Optional[int]) -> list[dict[str, Any]]:
+    """グラフ注記用の重要変換点。elabel は ASCII のみ（文字化け回避）。"""
+    key_events = [
+        {"age": p.retire_age,
+         "label":  f"退職（{p.retire_age}歳）",
+         "elabel": f"Retire (age {p.retire_age})",
+         "color": "#e67e22"},
+        {"age": p.pension_start_age,
+         "label":  f"年金開始（{p.pension_start_age}歳）",
+         "elabel": f"Pension (age {p.pension_start_age})",
+         "color": "#2980b9"},
+    ]
+    for ev in p.events:
+        if ev.on:
+            sign = "+" if ev.direction == "収入" else "-"
+            rep  = f"・{ev.every}年ごと" if ev.every > 0 else ""
+            erep = f", every {ev.every}y" if ev.every > 0 else ""
+            # elabel は番号と金額のみ（日本語ラベルを除外して文字化け回避）
+            key_events.append({
+                "age":    ev.age,
+                "label":  f"[Ev{ev.idx}] {ev.label}（{sign}{ev.amount//10000:,}万円{rep}）",
+                "elabel": f"Ev{ev.idx} {sign}{ev.amount//10000:,}M (age {ev.age}{erep})",
+                "color":  "#27ae60" if ev.direction == "収入" else "#c0392b",
+            })
+    if ruin_thr_age:
+        key_events.append({
+            "age":    ruin_thr_age,
+            "label":  f"⚠ 破綻{p.ruin_threshold}%超（{ruin_thr_age}歳）",
+            "elabel": f"Ruin>{p.ruin_threshold}% (age {ruin_thr_age})",
+            "color":  "#8e44ad",
+        })
+    return key_events
+
+
+def _run_serial(p, agg, source, key_rng, n_trials, chunk, timeline=None, prof=None, on_progress=None,
+                backend=DEFAULT_BACKEND):
+    tl = timeline if timeline is not None else compile_timeline(p)
+    engine = get_backend(backend)
+    n_left = int(n_trials)
+    while n_left > 0:
+        n = min(n_left, chunk)
+        with stage(prof, "shocks"):
+            z = source.next(n)
+        with stage(prof, "engine"):
+            out = engine(p, n, z, tl)
+        with stage(prof, "aggregation"):
+            agg.update(out, key_rng.random(n))
+        n_left -= n
+        if on_progress is not None:
+            on_progress(agg)
+
+
+def _converged(p: SimParams, agg: Aggregator) -> bool:
+    """破綻率と最終資産中央値の 95%CI がどちらも許容幅に収まったか。"""
+    lo, hi = agg.ruin_rate_ci()
+    if (hi - lo) / 2 > p.auto_ruin_tol:
+        return False
+    m_lo, m_hi = agg.final_quantile_ci(50)
+    median = agg.q.quantiles((50,), last_only=True)[0, -1]
+    return (m_hi - m_lo) / 2 <= p.auto_median_tol * max(abs(median), 1_000_000.0)
+
+
+def _run_adaptive(p, years_arr, max_trials, *, seed, sample_seed, workers, quantiles, chunk, prof=None,
+                  on_progress=None, backend=DEFAULT_BACKEND, cancel=None):
+    """
+    AUTO_BATCH 件ずつ試行を足し、_converged になるか max_trials に達したら止める。
+    直列では 1 本の乱数列を続けて使うので、N 回で止まった結果は trials=N の固定実行と同一。
+    並列では各ラウンドを SeedSequence([seed, ラウンド番号]) から分割する。
+    """
+    agg = Aggregator(years_arr, quantiles=quantiles)
+    tl = compile_timeline(p)
+    if workers <= 1:
+        from .bank import shock_source   # python -m lifesim.bank 実行時の二重 import を避けるため遅延
+        source = shock_source(p.sampling, seed, len(years_arr), max_trials, p)
+        key_rng = np.random.default_rng(seed=sample_seed)
+    round_no = 0
+    while agg.n < max_trials:
+        step = min(AUTO_BATCH * workers, max_trials - agg.n)
+        if workers > 1:
+            with stage(prof, "parallel (engine+aggregation)"):
+                agg.merge(run_parallel(p, step, seed=[seed, round_no], workers=workers,
+                                       quantiles=quantiles, chunk=chunk, backend=backend, cancel=cancel))
+            if on_progress is not None:
+                on_progress(agg)
+        else:
+            _run_serial(p, agg, source, key_rng, step, chunk, tl, prof, on_progress, backend)
+        round_no += 1
+        with stage(prof, "convergence check"):
+            if agg.n >= AUTO_MIN_TRIALS and _converged(p, agg):
+                break
+    return agg
+
+
+def result_key(params, *, seed: int = 42, sample_seed: int = 7,
+               quantiles: str = "auto", workers: int = 1, backend: str = DEFAULT_BACKEND,
+               chunk: int = BATCH_CHUNK, **_ignored) -> str:
+    """run_simulation の結果を一意に決めるキー（結果に影響しない実行オプションは無視）。"""
+    p = as_params(params)
+    extra = {}
+    if backend != DEFAULT_BACKEND:   # 浮動小数点の丸め順が違いうるので別の結果として扱う
+        extra["backend"] = backend
+    if int(chunk) != BATCH_CHUNK:    # 集計の加算順が変わり、末尾の桁が違いうる
+        extra["chunk"] = int(chunk)
+    if p.sampling == "bootstrap" and p.returns_csv:   # 同じパスでも CSV の中身が変われば別の結果
+        from .bootstrap import returns_digest
+        extra["returns"] = returns_digest(p.returns_csv)
+    return p.digest(seed=int(seed), sample_seed=int(sample_seed),
+                    quantiles=quantiles, workers=int(workers),
+                    engine=ENGINE_VERSION, **extra)
+
+
+def run_simulation(params, *, seed: int = 42, sample_seed: int = 7,
+                   chunk: int = BATCH_CHUNK, quantiles: str = "auto",
+                   workers: int = 1, profiler=None, on_progress=None,
+                   checkpoints=None, backend: str = DEFAULT_BACKEND, cancel=None) -> SimResult:
+    """
+    params（SimParams または build_params() 形式の dict）で全試行を実行し集計する。
+    試行は chunk 件ずつエンジンに流し、Aggregator で逐次集計するのでピークメモリは
+    chunk で決まる（quantiles="exact" のときのみ総資産行列を保持）。
+    workers > 1 でプロセス並列（乱数列は SeedSequence 分割。lifesim.parallel 参照）。
+    サンプル軌跡は別計算せず、本番試行から一様に抜き出した SAMPLE_POOL 本を保持する。
+    profiler（lifesim.profiling.Profiler）を渡すと段階ごとの所要時間を記録する。
+    on_progress(agg) はバッチ（並列時はシャード）を集計するたびに呼ばれる。途中経過の表示
+    （partial_result）や中断に使う。例外を投げると実行はそこで打ち切られ、例外がそのまま伝わる。
+    checkpoints（lifesim.incremental.CheckpointStore）を渡すと、直列・試行回数固定の実行で
+    前回の実行から変更が効く年齢以降だけを計算し直す（結果は同一）。
+    backend はエンジンの実装（lifesim.backends。既定 "numpy"）。差分再計算は "numpy" のときだけ。
+    cancel（threading.Event など）が立つと、次のバッチの区切りで RunCancelled を送出する
+    （並列時は実行中のシャードも止める）。
+    """
+    p = as_params(params)
+    years_arr = np.arange(p.start_age, p.end_age + 1)
+    get_backend(backend)   # 未知・未インストールならここで ValueError
+
+    workers = max(1, int(workers))
+    max_trials = int(p.auto_max_trials if p.auto_trials else p.trials)
+    q_mode = quantiles
+    if q_mode == "auto":
+        q_mode = "exact" if max_trials <= EXACT_LIMIT else "sketch"
+
+    prof = profiler
+    if cancel is not None:
+        user_progress = on_progress
+
+        def on_progress(agg):
+            if cancel.is_set():
+                raise RunCancelled()
+            if user_progress is not None:
+                user_progress(agg)
+
+    if not p.auto_trials and workers > 1:
+        with stage(prof, "parallel (engine+aggregation)"):
+            agg = run_parallel(p, p.trials, seed=seed, workers=workers,
+                               quantiles=q_mode, chunk=chunk, on_part=on_progress, backend=backend,
+                               cancel=cancel)
+    elif not p.auto_trials:
+        # rng は連続消費なので、チャンク分割しても一括実行と同一の乱数列になる
+        with stage(prof, "timeline"):
+            tl = compile_timeline(p)
+        from .bank import shock_source
+        source = shock_source(p.sampling, seed, len(years_arr), p.trials, p)
+        key_rng = np.random.default_rng(seed=sample_seed)   # サンプル軌跡の選択用
+        agg = Aggregator(years_arr, quantiles=q_mode)
+        resumed = None
+        if checkpoints is not None and backend == DEFAULT_BACKEND:
+            from .incremental import run_checkpointed
+            resumed = run_checkpointed(p, agg, source, key_rng, seed=seed, chunk=chunk, timeline=tl,
+                                       store=checkpoints, prof=prof, on_progress=on_progress)
+        if resumed is None:
+            _run_serial(p, agg, source, key_rng, p.trials, chunk, tl, prof, on_progress, backend)
+    else:
+        agg = _run_adaptive(p, years_arr, max_trials, seed=seed, sample_seed=sample_seed,
+                            workers=workers, quantiles=q_mode, chunk=chunk, prof=prof,
+                            on_progress=on_progress, backend=backend, cancel=cancel)
+
+    return _build_result(p, agg, seed=seed, prof=prof,
+                         converged=(not p.auto_trials) or (agg.n >= AUTO_MIN_TRIALS and _converged(p, agg)),
+                         key=result_key(p, seed=seed, sample_seed=sample_seed, quantiles=quantiles,
+                                        workers=workers, backend=backend, chunk=chunk))
+
+
+def partial_result(params, agg: Aggregator, *, seed: int = 42) -> SimResult:
+    """実行途中の集計から暫定の SimResult を作る（key は空。キャッシュには入れない）。"""
+    p = as_params(params)
+    return _build_result(p, agg, seed=seed, converged=False, key="")
+
+
+def analyze(result: SimResult, params) -> SimResult:
+    """
+    分析専用の項目（params.ANALYSIS_FIELDS）から決まる部分だけを params に合わせて作り直した
+    SimResult を返す。年齢ごとの破綻確率と保持済みのサンプル軌跡から計算するので、エンジンは回さない。
+    params の試行に影響する項目は result を作ったときと同じものを渡すこと（注記のイベント等に使う）。
+    """
+    p = as_params(params)
+    over_idx     = np.where(result.ruin_prob >= p.ruin_threshold)[0]
+    ruin_thr_age = int(result.years[over_idx[0]]) if len(over_idx) > 0 else None
+    return replace(result, threshold=p.ruin_threshold, ruin_thr_age=ruin_thr_age,
+                   key_events=build_key_events(p, ruin_thr_age),
+                   show_sp=p.show_sample_paths, sp_n=int(p.sample_paths_n))
+
+
+def _build_result(p: SimParams, agg: Aggregator, *, seed, converged, key, prof=None) -> SimResult:
+    with stage(prof, "quantiles/summary"):
+        stats = agg.summary()
+    res = SimResult(years=agg.years, **stats, threshold=0, ruin_thr_age=None,
+                    trials=int(agg.n), seed=int(seed), converged=converged, key=key)
+    with stage(prof, "key_events"):
+        return analyze(res, p)
@@ -0,0 +1,134 @@
+"""
+目標逆算（ゴールシーク）。破綻確率が目標以下に収まる
+
+- 退職後生活費 living_after の上限（二分探索, 円）
+- 最も早い退職年齢 retire_age（整数の二分探索）
+
+を求める。探索中は同じ乱数シナリオを使い続けるので、評価値は候補値だけで決まり単調になる。
+候補値が影響しない年（living_after なら退職前、retire_age なら探索下限より前）は
+1 回だけ計算してその時点の状態から再開する。
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+
+from .bank import shock_source
+from .engine import simulate_batch
+from .params import SimParams, as_params
+from .timeline import compile_timeline
+
+SOLVE_TARGETS = ("living_after", "retire_age")
+
+
+@dataclass
+class SolveResult:
+    target: str                      # 探索したパラメータ名
+    value: Optional[float]           # 解（円 or 歳）。範囲内に解がなければ None
+    ci: tuple[Optional[float], Optional[float]]   # 破綻率の推定誤差（95%）を反映した解の幅
+    target_ruin: float               # 目標とした破綻確率の上限（%）
+    ruin_rate: Optional[float]       # 解での破綻確率（%）
+    evaluations: int                 # エンジン呼び出し回数（共通部分の 1 回を含む）
+    trials: int
+    bounds: tuple[float, float]
+
+
+class _Evaluator:
+    """固定シナリオ z と共通部分の状態を持ち、候補値 → 破綻率（%）を返す。結果はメモ化。"""
+
+    def __init__(self, base: SimParams, target: str, z: np.ndarray, lo_value):
+        self.base, self.target, self.z = base, target, z
+        self.n = len(z)
+        self._memo: dict = {}
+        prefix = self._variant(lo_value)
+        age = base.retire_age if target == "living_after" else int(lo_value)
+        self.start = int(min(max(age - base.start_age, 0), base.n_years))
+        self.state = None
+        self.calls = 0
+        if self.start > 0:
+            out = simulate_batch(prefix, None, self.n, z=z, stop=self.start)
+            self.state = out["state"]
+            self.calls += 1
+
+    def _variant(self, x) -> SimParams:
+        d = self.base.to_dict()
+        d[self.target] = x
+        return SimParams.from_dict(d)
+
+    def __call__(self, x) -> float:
+        if x not in self._memo:
+            v = self._variant(x)
+            out = simulate_batch(v, None, self.n, z=self.z, timeline=compile_timeline(v),
+                                 state=self.state, start=self.start)
+            self.calls += 1
+            self._memo[x] = float(out["ruined"].mean() * 100)
+        return self._memo[x]
+
+
+def _bisect(f, lo, hi, target, increasing: bool, tol):
+    """
+    increasing=True : f(x) ≤ target を満たす最大の x（living_after）
+    increasing=False: f(x) ≤ target を満たす最小の x（retire_age）
+    """
+    if increasing:
+        if f(lo) > target:
+            return None
+        if f(hi) <= target:
+            return hi
+        while hi - lo > tol:
+            mid = (lo + hi) // 2 if isinstance(lo, int) else (lo + hi) / 2
+            lo, hi = (mid, hi) if f(mid) <= target else (lo, mid)
+        return lo
+    if f(hi) > target:
+        return None
+    if f(lo) <= target:
+        return lo
+    while hi - lo > tol:
+        mid = (lo + hi) // 2 if isinstance(lo, int) else (lo + hi) / 2
+        lo, hi = (lo, mid) if f(mid) <= target else (mid, hi)
+    return hi
+
+
+def _wilson_half(rate_pct: float, n: int, z: float = 1.96) -> float:
+    p = rate_pct / 100.0
+    denom = 1.0 + z * z / n
+    return z * np.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / denom * 100
+
+
+def solve(params, target: str = "living_after", target_ruin: Optional[float] = None, *,
+          trials: int = 2000, seed: int = 42, lo=None, hi=None,
+          tol: float = 10_000.0) -> SolveResult:
+    """
+    target の値を探索し、破綻確率（総資産が一度でも 0 以下）≤ target_ruin となる限界を返す。
+    target_ruin の既定は params.ruin_threshold。tol は living_after の探索精度（円）。
+    """
+    if target not in SOLVE_TARGETS:
+        raise ValueError(f"unknown solve target: {target!r}")
+    base = as_params(params)
+    target_ruin = float(base.ruin_threshold if target_ruin is None else target_ruin)
+    if target == "living_after":
+        lo = 0.0 if lo is None else float(lo)
+        hi = float(max(3 * base.living_after, 5_000_000.0)) if hi is None else float(hi)
+        increasing, step = True, float(tol)
+    else:
+        lo = int(max(base.start_age + 1, 45) if lo is None else lo)
+        hi = int(min(base.end_age, 80) if hi is None else hi)
+        increasing, step = False, 1
+
+    z = shock_source(base.sampling, seed, base.n_years, trials, base).next(trials)
+    f = _Evaluator(base, target, z, lo)
+    value = _bisect(f, lo, hi, target_ruin, increasing, step)
+    if value is None:
+        return SolveResult(target, None, (None, None), target_ruin, None,
+                           f.calls, int(trials), (lo, hi))
+
+    # 解での破綻率の 95% 区間ぶん目標をずらして解き直し、解の不確かさとする（同じシナリオなので安価）
+    rate = f(value)
+    h = _wilson_half(rate, int(trials))
+    strict = _bisect(f, lo, hi, max(target_ruin - h, 0.0), increasing, step)
+    loose = _bisect(f, lo, hi, min(target_ruin + h, 100.0), increasing, step)
+    ends = [v for v in (strict, loose) if v is not None]
+    ci = (min(ends + [value]), max(ends + [value]))
+    return SolveResult(target, value, ci, target_ruin, rate, f.calls, int(trials), (lo, hi))
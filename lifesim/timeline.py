@@ -0,0 +1,93 @@
+"""
+params → 年ごとの確定的キャッシュフロー（タイムライン）へのコンパイル。
+
+収入・インフレ調整後の生活費・各口座の積立額／取崩可否・イベント純額は
+全試行で共通なので、実行前に 1 回だけベクトルとして作っておき、
+エンジンは確率的な部分（リターン・残高依存の判定）だけを計算する。
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+
+import numpy as np
+
+from .params import SimParams
+
+
+@dataclass(frozen=True)
+class Timeline:
+    years: np.ndarray            # 年齢 (Y,)
+    income: np.ndarray           # 給与＋年金（円）
+    living: np.ndarray           # インフレ調整後の生活費（円）
+    ideco_contrib: np.ndarray    # 積立上限額（対象外の年は 0）
+    nisa_contrib: np.ndarray
+    taxable_contrib: np.ndarray
+    ideco_contrib_on: np.ndarray     # 積立対象年か (bool)
+    nisa_contrib_on: np.ndarray
+    taxable_contrib_on: np.ndarray
+    ideco_withdraw_on: np.ndarray    # 取崩対象年か (bool)
+    nisa_withdraw_on: np.ndarray
+    taxable_withdraw_on: np.ndarray
+    event_cash: np.ndarray       # イベントの年ごと純額（収入 +, 支出 -）
+
+    @property
+    def n_years(self) -> int:
+        return len(self.years)
+
+
+def clamp(x, lo, hi): return max(lo, min(hi, x))
+
+
+def growth_rates(p: SimParams):
+    """(インフレ率, 給与成長率, 年金成長率)。成長率はマクロスライド込みで ±3% に制限。"""
+    infl = p.inflation_rate
+    salary_growth  = clamp(infl + p.salary_macro_slide,  -0.03, 0.03)
+    pension_growth = clamp(infl + p.pension_macro_slide, -0.03, 0.03)
+    return infl, salary_growth, pension_growth
+
+
+def event_cashflow(p: SimParams, years: np.ndarray) -> np.ndarray:
+    """有効なイベント（繰り返しを含む）を年ごとの純額ベクトルに畳み込む。年ごとの走査はしない。"""
+    idx, amt = [], []
+    start, end = int(years[0]), int(years[-1])
+    for ev in p.events:
+        if not ev.on:
+            continue
+        ages = ev.occurrence_ages(end)
+        ages = ages[(ages >= start) & (ages <= end)]
+        idx.append(ages - start)
+        amt.append(np.full(len(ages), float(ev.signed_amount)))
+    out = np.zeros(len(years))
+    if idx:
+        np.add.at(out, np.concatenate(idx), np.concatenate(amt))
+    return out
+
+
+def compile_timeline(p: SimParams) -> Timeline:
+    years = np.arange(p.start_age, p.end_age + 1)
+    elapsed = (years - p.start_age).astype(float)
+    infl, salary_growth, pension_growth = growth_rates(p)
+
+    working = years < p.retire_age
+    income = (np.where(working, p.salary_net * (1.0 + salary_growth) ** elapsed, 0.0)
+              + np.where(years >= p.pension_start_age,
+                         p.pension_annual * (1.0 + pension_growth) ** elapsed, 0.0))
+    living = np.where(working, p.living_before, p.living_after) * (1.0 + infl) ** elapsed
+
+    def window(on, lo, hi):
+        return np.asarray(on & (years >= lo) & (years <= hi))
+
+    ideco_c   = window(p.ideco_on,   p.ideco_contrib_start,   p.ideco_contrib_end)
+    nisa_c    = window(p.nisa_on,    p.nisa_contrib_start,    p.nisa_contrib_end)
+    taxable_c = window(p.taxable_on, p.taxable_contrib_start, p.taxable_contrib_end)
+    return Timeline(
+        years=years, income=income, living=living,
+        ideco_contrib=np.where(ideco_c, p.ideco_contrib_monthly * 12, 0.0),
+        nisa_contrib=np.where(nisa_c, p.nisa_contrib_monthly * 12, 0.0),
+        taxable_contrib=np.where(taxable_c, p.taxable_contrib_monthly * 12, 0.0),
+        ideco_contrib_on=ideco_c, nisa_contrib_on=nisa_c, taxable_contrib_on=taxable_c,
+        ideco_withdraw_on=np.asarray(p.ideco_on & (years >= p.ideco_withdraw_start)),
+        nisa_withdraw_on=np.asarray(p.nisa_on & (years >= p.nisa_withdraw_start)),
+        taxable_withdraw_on=np.asarray(p.taxable_on & (years >= p.taxable_withdraw_start)),
+        event_cash=event_cashflow(p, years),
+    )
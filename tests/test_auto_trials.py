@@ -0,0 +1,18 @@
+"""試行回数の自動決定（収束判定）。"""
+from __future__ import annotations
+
+from lifesim.params import SimParams
+from lifesim.simulation import AUTO_MIN_TRIALS, run_simulation
+
+
+def test_cap_below_minimum_is_not_converged():
+    p = SimParams(auto_trials=True, auto_max_trials=AUTO_MIN_TRIALS // 2, auto_ruin_tol=50.0, auto_median_tol=10.0)
+    res = run_simulation(p)
+    assert res.trials == AUTO_MIN_TRIALS // 2
+    assert not res.converged
+
+
+def test_loose_tolerance_converges_at_minimum():
+    p = SimParams(auto_trials=True, auto_max_trials=20_000, auto_ruin_tol=50.0, auto_median_tol=10.0)
+    res = run_simulation(p)
+    assert res.converged and res.trials <= AUTO_MIN_TRIALS + 1000
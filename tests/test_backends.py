@@ -0,0 +1,15 @@
+"""エンジン・バックエンドの差分テスト（lifesim.harness を pytest から回す）。"""
+from __future__ import annotations
+
+import pytest
+
+from lifesim import harness
+
+
+def test_numpy_matches_reference():
+    assert harness.run(cases=50, backends=["numpy"], log=lambda m: None) == []
+
+
+def test_numba_matches_reference():
+    pytest.importorskip("numba")
+    assert harness.run(cases=50, backends=["numba"], log=lambda m: None) == []
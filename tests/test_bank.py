@@ -0,0 +1,45 @@
+"""乱数シナリオバンク（バンクの有無で結果が変わらないこと）。"""
+from __future__ import annotations
+
+import time
+
+import numpy as np
+import pytest
+
+from lifesim import bank
+from lifesim.params import SimParams
+from lifesim.sampling import make_shock_source
+from lifesim.simulation import run_simulation
+
+
+@pytest.fixture
+def bank_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv("LIFESIM_BANK_DIR", str(tmp_path))
+    monkeypatch.setenv("LIFESIM_BANK_TRIALS", "3000")
+    monkeypatch.setattr(bank, "_default_bank", None)
+    yield tmp_path
+    b = bank._default_bank
+    while b is not None and b._building:   # バックグラウンドの作成が終わるまで待つ
+        time.sleep(0.01)
+
+
+@pytest.mark.parametrize("mode", ["mc", "antithetic"])
+def test_bank_shocks_match_generated(bank_dir, mode):
+    bank.default_bank().build(mode, 42, 30)
+    src = bank.shock_source(mode, 42, 30, 2500)
+    assert isinstance(src, bank.BankShocks)
+    ref = make_shock_source(mode, np.random.default_rng(seed=42), 30)
+    for n in (1000, 999, 501):   # チャンクの区切りが揃わなくても同じ列
+        np.testing.assert_array_equal(src.next(n), ref.next(n))
+
+
+@pytest.mark.parametrize("mode", ["mc", "antithetic"])
+def test_run_with_bank_is_identical(bank_dir, mode, monkeypatch):
+    p = SimParams(trials=2000, sampling=mode)
+    bank.default_bank().build(mode, 42, p.n_years)
+    with_bank = run_simulation(p)
+    monkeypatch.delenv("LIFESIM_BANK_DIR")
+    without = run_simulation(p)
+    np.testing.assert_array_equal(with_bank.fan_total, without.fan_total)
+    np.testing.assert_array_equal(with_bank.avg_total, without.avg_total)
+    assert with_bank.ruin_rate == without.ruin_rate
@@ -0,0 +1,62 @@
+"""リターン履歴 CSV の読み込みと口座の対応づけ。"""
+from __future__ import annotations
+
+import numpy as np
+import pytest
+
+from lifesim.bootstrap import load_returns, parse_map
+from lifesim.params import SimParams
+from lifesim.simulation import run_simulation
+
+
+@pytest.fixture
+def csv_path(tmp_path):
+    rng = np.random.default_rng(0)
+    path = tmp_path / "returns.csv"
+    lines = ["Year,SP500,TOPIX"] + [f"{y},{a:.4f},{b:.4f}"
+                                    for y, (a, b) in zip(range(1990, 2025), rng.normal(0.06, 0.15, (35, 2)))]
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    return str(path)
+
+
+def test_year_column_is_not_a_series(csv_path, tmp_path):
+    names, data = load_returns(csv_path)
+    assert names == ["SP500", "TOPIX"]
+    assert data.shape == (35, 2)
+    other = tmp_path / "dates.csv"   # 列名が日付らしくなくても、値がすべて西暦年なら除く
+    other.write_text("t,r\n2001,0.05\n2002,-0.1\n2003,0.2\n", encoding="utf-8")
+    assert load_returns(str(other))[0] == ["r"]
+
+
+def test_unmapped_account_raises(csv_path):
+    names, _ = load_returns(csv_path)
+    assert parse_map("ideco=SP500,nisa=TOPIX,taxable=SP500", names) == [0, 1, 0]
+    with pytest.raises(ValueError, match="taxable"):
+        parse_map("ideco=SP500,nisa=TOPIX", names)
+    with pytest.raises(ValueError):
+        run_simulation(SimParams(trials=50, sampling="bootstrap", returns_csv=csv_path))
+
+
+def test_bootstrap_run_is_finite(csv_path):
+    p = SimParams(trials=200, sampling="bootstrap", returns_csv=csv_path, bootstrap_raw=True,
+                  bootstrap_map="ideco=SP500,nisa=SP500,taxable=TOPIX")
+    res = run_simulation(p)
+    assert np.isfinite(res.median_final) and res.median_final < 1e12
+
+
+def test_raw_mode_rejects_zero_volatility(csv_path):
+    p = SimParams(trials=50, sampling="bootstrap", returns_csv=csv_path, bootstrap_raw=True,
+                  bootstrap_map="ideco=SP500,nisa=SP500,taxable=TOPIX", tax_vol=0.0)
+    with pytest.raises(ValueError, match="taxable"):
+        run_simulation(p)
+
+
+def test_raw_mode_reproduces_history(csv_path):
+    from lifesim.bootstrap import BlockBootstrapShocks
+    p = SimParams(sampling="bootstrap", returns_csv=csv_path, bootstrap_raw=True, bootstrap_block=3,
+                  bootstrap_map="ideco=SP500,nisa=TOPIX,taxable=SP500")
+    src = BlockBootstrapShocks(np.random.default_rng(0), p.n_years, p)
+    r = src.mu + src.sig * src.next(20)
+    _, data = load_returns(csv_path)
+    hist = {round(v, 10) for v in data[:, 0]}
+    assert {round(v, 10) for v in r[..., 0].ravel()} <= hist
@@ -0,0 +1,33 @@
+"""全試行データの書き出し。"""
+from __future__ import annotations
+
+import os
+
+import numpy as np
+import pytest
+
+from lifesim import export
+from lifesim.params import SimParams
+from lifesim.simulation import run_simulation
+
+
+def test_export_matches_run_and_key(tmp_path):
+    p = SimParams(trials=300)
+    meta = export.export_trials(p, str(tmp_path))
+    res = run_simulation(p)
+    assert meta["result_key"] == res.key
+    ex = export.load_trials(str(tmp_path))
+    np.testing.assert_allclose(ex["total"].mean(axis=0), res.avg_total, rtol=1e-6)
+    assert export.export_trials(p, str(tmp_path), source_key="abc")["result_key"] == "abc"
+
+
+def test_interrupted_reexport_leaves_no_meta(tmp_path, monkeypatch):
+    export.export_trials(SimParams(trials=100), str(tmp_path))
+
+    def boom(*a, **kw):
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(export, "simulate_batch", boom)
+    with pytest.raises(KeyboardInterrupt):
+        export.export_trials(SimParams(trials=200, end_age=90), str(tmp_path))
+    assert not os.path.exists(tmp_path / export.META_FILE)
@@ -0,0 +1,57 @@
+"""チェックポイントからの差分再計算が、最初から計算した結果と一致するか。"""
+from __future__ import annotations
+
+import dataclasses
+
+import numpy as np
+import pytest
+
+from lifesim.incremental import CheckpointStore
+from lifesim.params import Event, SimParams
+from lifesim.simulation import run_simulation
+
+
+def _base() -> SimParams:
+    return SimParams(trials=300, initial_ideco=2_000_000, initial_nisa=3_000_000,
+                     initial_taxable=4_000_000, taxable_on=True,
+                     events=[Event(on=True, label="車", idx=1, age=60, amount=3_000_000)])
+
+
+EDITS = {
+    "initial_cash": {"initial_cash": 3_000_000.0},
+    "initial_ideco": {"initial_ideco": 0.0},
+    "initial_nisa": {"initial_nisa": 10_000_000.0},
+    "initial_taxable": {"initial_taxable": 500_000.0},
+    "nisa_return": {"nisa_return": 0.01},
+    "tax_vol": {"tax_vol": 0.3},
+    "living_after": {"living_after": 3_500_000.0},
+    "events": {"events": [Event(on=True, label="車", idx=1, age=75, amount=8_000_000)]},
+}
+
+
+def _assert_same(a, b) -> None:
+    for f in dataclasses.fields(a):
+        x, y = getattr(a, f.name), getattr(b, f.name)
+        if isinstance(x, np.ndarray):
+            np.testing.assert_array_equal(x, y, err_msg=f.name)
+        else:
+            assert x == y, f.name
+
+
+@pytest.mark.parametrize("edit", EDITS.values(), ids=EDITS.keys())
+def test_checkpointed_matches_fresh(edit):
+    store = CheckpointStore()
+    base = _base()
+    run_simulation(base, checkpoints=store)
+    p = dataclasses.replace(base, **edit)
+    _assert_same(run_simulation(p, checkpoints=store), run_simulation(p))
+
+
+def test_chain_of_edits_and_back():
+    store = CheckpointStore()
+    base = _base()
+    run_simulation(base, checkpoints=store)
+    for edit in EDITS.values():
+        p = dataclasses.replace(base, **edit)
+        _assert_same(run_simulation(p, checkpoints=store), run_simulation(p))
+    _assert_same(run_simulation(base, checkpoints=store), run_simulation(base))
@@ -0,0 +1,67 @@
+"""バックグラウンド実行の取り消し。"""
+from __future__ import annotations
+
+import threading
+import time
+
+import pytest
+
+from lifesim.cache import ResultCache
+from lifesim.jobs import JobManager, JobQueueFull
+from lifesim.parallel import RunCancelled
+from lifesim.params import SimParams
+from lifesim.simulation import run_simulation
+
+BIG = SimParams(trials=400_000, end_age=110)   # 2 ワーカーでも数秒以上かかる
+
+
+def _wait(job, timeout):
+    t = time.perf_counter()
+    while not job.finished and time.perf_counter() - t < timeout:
+        time.sleep(0.01)
+    return time.perf_counter() - t
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_cancel_stops_running_job_within_a_chunk(workers):
+    jm = JobManager(workers=1, cache=ResultCache())
+    job = jm.submit(BIG, owner="a", workers=workers, quantiles="sketch")
+    while job.status == "queued":
+        time.sleep(0.01)
+    time.sleep(0.3)
+    job.cancel()
+    assert _wait(job, 5.0) < 2.0
+    assert job.status == "cancelled"
+
+
+def test_cancel_flag_does_not_change_result():
+    p = SimParams(trials=2000)
+    assert (run_simulation(p, workers=2).median_final
+            == run_simulation(p, workers=2, cancel=threading.Event()).median_final)
+    ev = threading.Event()
+    ev.set()
+    with pytest.raises(RunCancelled):
+        run_simulation(p, workers=2, cancel=ev)
+
+
+def test_job_result_matches_direct_run():
+    p = SimParams(trials=5000)
+    jm = JobManager(workers=1, cache=ResultCache())
+    job = jm.submit(p, owner="a")
+    _wait(job, 30.0)
+    direct = run_simulation(p)
+    assert job.result.key == direct.key
+    assert (job.result.avg_total == direct.avg_total).all()
+    assert (job.result.fan_total == direct.fan_total).all()
+
+
+def test_cancelled_running_job_still_counts_toward_limit():
+    jm = JobManager(workers=1, max_queue=0, cache=ResultCache())
+    job = jm.submit(BIG, owner="a", quantiles="sketch")
+    while job.status == "queued":
+        time.sleep(0.01)
+    job._cancel.set()          # 取り消し要求直後（まだバッチの途中で実行中）
+    with pytest.raises(JobQueueFull):
+        jm.submit(SimParams(trials=100), owner="b")
+    _wait(job, 5.0)
+    jm.submit(SimParams(trials=100), owner="b")
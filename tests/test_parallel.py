@@ -0,0 +1,22 @@
+"""並列実行の再現性（同じ seed・同じ workers ならビット単位で一致）。"""
+from __future__ import annotations
+
+import dataclasses
+
+import numpy as np
+
+from lifesim.params import SimParams
+from lifesim.simulation import run_simulation
+
+
+def test_parallel_run_is_reproducible():
+    p = SimParams(trials=3001)   # シャードの大きさが揃わない件数
+    a, b = run_simulation(p, workers=2), run_simulation(p, workers=2)
+    for f in dataclasses.fields(a):
+        x, y = getattr(a, f.name), getattr(b, f.name)
+        if isinstance(x, np.ndarray):
+            np.testing.assert_array_equal(x, y, err_msg=f.name)
+        else:
+            assert x == y, f.name
+    assert a.trials == 3001
+
@@ -0,0 +1,35 @@
+"""段階ごとの計測（入れ子の段階）。"""
+from __future__ import annotations
+
+import time
+
+import numpy as np
+import pytest
+
+from lifesim.profiling import Profiler
+
+
+def test_nested_stage_is_not_counted_twice():
+    prof = Profiler()
+    with prof.stage("outer"):
+        with prof.stage("inner"):
+            time.sleep(0.02)
+    rows = {r["stage"]: r for r in prof.rows()}
+    assert rows["outer"]["seconds"] >= rows["inner"]["seconds"]
+    assert prof.total == pytest.approx(rows["outer"]["seconds"])
+    merged = Profiler()
+    merged.merge(prof, "run: ")
+    assert merged.total == pytest.approx(prof.total)
+
+
+def test_nested_stage_keeps_outer_peak():
+    prof = Profiler(track_memory=True)
+    with prof.stage("outer"):
+        big = np.ones(4 * 2**20 // 8)   # 約 4MB 確保してから解放
+        del big
+        with prof.stage("inner"):
+            small = np.ones(1000)
+            del small
+    rows = {r["stage"]: r for r in prof.rows()}
+    assert rows["outer"]["peak_mb"] >= 3.9
+    assert rows["inner"]["peak_mb"] < 1.0
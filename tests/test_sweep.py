@@ -0,0 +1,20 @@
+"""年金受給開始年齢スイープ。"""
+from __future__ import annotations
+
+import pytest
+
+from lifesim.params import SimParams
+from lifesim.sweep import pension_factor, sweep_pension
+
+
+@pytest.mark.parametrize("age, factor", [(55, 0.76), (60, 0.76), (65, 1.0), (70, 1.42), (75, 1.84), (90, 1.84)])
+def test_pension_factor_is_clamped(age, factor):
+    assert pension_factor(age) == pytest.approx(factor)
+
+
+def test_late_start_amount_is_not_inflated():
+    p = SimParams(trials=50, pension_start_age=90, pension_annual=2_000_000)
+    rows = {r["pension_start_age"]: r["pension_annual"] for r in sweep_pension(p, [65, 75, 90])}
+    assert rows[90] == pytest.approx(2_000_000)
+    assert rows[75] == pytest.approx(2_000_000)
+    assert rows[65] == pytest.approx(2_000_000 / 1.84)